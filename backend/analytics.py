@@ -0,0 +1,274 @@
+"""Platform analytics rollups: rental volume, GMV and fees per day/week and category.
+
+`rental_rollups` holds one row per (period, bucket, primary category),
+where a rental falls in the bucket of its start date and an item's primary
+category is its lowest category id (UNCATEGORIZED, 0, for items without
+one; a NULL would slip past the unique index). Refreshes are incremental: rentals
+whose `updated_at` moved past the stored watermark name the days that
+changed, those days are recomputed from `rentals` with range scans, and
+their weeks are re-summed from the day rows. This relies on rentals never
+being deleted and keeping their start date, so a change only ever touches
+the bucket the rental is already in; recategorizing an item isn't picked
+up until a full refresh. The admin endpoint reads only the rollups, never
+`rentals` or `transactions`.
+
+The watermark trails the clock by ROLLUP_SETTLE_SECONDS so a transaction
+that committed late with an earlier `updated_at` is still picked up.
+
+Every worker runs a refresher, but a refresh first takes a lease on the
+watermark row (`locked_by`/`locked_until`, claimed with a conditional
+UPDATE), so only one worker refreshes at a time and the others skip the
+round. A lease left by a crashed worker lapses after ROLLUP_LEASE_SECONDS.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import and_, case, delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import Rental, RentalRollup, RollupWatermark, SessionLocal, item_categories
+from instrumentation import metrics
+
+logger = logging.getLogger("campus_rentals.analytics")
+
+ROLLUP_REFRESH_SECONDS = float(os.getenv("ROLLUP_REFRESH_SECONDS", "60"))
+ROLLUP_SETTLE_SECONDS = float(os.getenv("ROLLUP_SETTLE_SECONDS", "5"))
+ROLLUP_LEASE_SECONDS = 300
+# Days recomputed, and rollup rows inserted, per statement
+DAY_CHUNK = 50
+INSERT_CHUNK = 500
+WATERMARK_NAME = "rental_rollups"
+UNCATEGORIZED = 0
+# Watermark of a lease row created before the first refresh
+NEVER = datetime(1970, 1, 1)
+BOOKED_STATUSES = ("approved", "active", "completed")
+MEASURES = ("rentals", "booked", "active", "completed", "cancelled", "gmv", "platform_fees", "owner_earnings")
+
+metrics.describe("rollup_refresh_duration_seconds", "histogram", "Time spent refreshing analytics rollups")
+metrics.describe("rollup_days_refreshed_total", "counter", "Day buckets recomputed by rollup refreshes")
+
+
+def day_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, moment.day)
+
+
+def week_start(moment: datetime) -> datetime:
+    return day_start(moment) - timedelta(days=moment.weekday())
+
+
+def _as_datetime(value) -> datetime:
+    # SQLite's date() returns text, other databases a date
+    return datetime.fromisoformat(str(value))
+
+
+def _day_totals(db: Session, days: Optional[List[datetime]]) -> List[dict]:
+    """Per (day, primary category) totals straight from `rentals`; every day when `days` is None"""
+    primary = (
+        select(item_categories.c.item_id, func.min(item_categories.c.category_id).label("category_id"))
+        .group_by(item_categories.c.item_id)
+        .subquery()
+    )
+    booked = Rental.status.in_(BOOKED_STATUSES)
+    day = func.date(Rental.start_date)
+    query = (
+        select(
+            day, func.coalesce(primary.c.category_id, UNCATEGORIZED),
+            func.count(),
+            func.sum(case((booked, 1), else_=0)),
+            func.sum(case((Rental.status == "active", 1), else_=0)),
+            func.sum(case((Rental.status == "completed", 1), else_=0)),
+            func.sum(case((Rental.status == "cancelled", 1), else_=0)),
+            func.sum(case((booked, Rental.total_cost), else_=0.0)),
+            func.sum(case((booked, Rental.platform_fee), else_=0.0)),
+            func.sum(case((booked, Rental.owner_earnings), else_=0.0)),
+        )
+        .select_from(Rental)
+        .outerjoin(primary, primary.c.item_id == Rental.item_id)
+        .group_by(day, func.coalesce(primary.c.category_id, UNCATEGORIZED))
+    )
+    if days is not None:
+        query = query.where(or_(*(
+            and_(Rental.start_date >= start, Rental.start_date < start + timedelta(days=1)) for start in days
+        )))
+    return [
+        {
+            "period": "day",
+            "bucket_start": _as_datetime(row[0]),
+            "category_id": row[1],
+            **{name: value or 0 for name, value in zip(MEASURES, row[2:])},
+        }
+        for row in db.execute(query)
+    ]
+
+
+def _insert_rows(db: Session, rows: List[dict]):
+    for index in range(0, len(rows), INSERT_CHUNK):
+        db.execute(insert(RentalRollup).values(rows[index:index + INSERT_CHUNK]))
+
+
+def _rebuild_weeks(db: Session, weeks: Iterable[datetime]):
+    """Re-sum week rows from their day rows"""
+    for start in weeks:
+        totals = db.execute(
+            select(RentalRollup.category_id, *(func.sum(getattr(RentalRollup, name)) for name in MEASURES))
+            .where(
+                RentalRollup.period == "day",
+                RentalRollup.bucket_start >= start,
+                RentalRollup.bucket_start < start + timedelta(days=7),
+            )
+            .group_by(RentalRollup.category_id)
+        ).all()
+        db.execute(delete(RentalRollup).where(RentalRollup.period == "week", RentalRollup.bucket_start == start))
+        _insert_rows(db, [
+            {"period": "week", "bucket_start": start, "category_id": row[0], **dict(zip(MEASURES, row[1:]))}
+            for row in totals
+        ])
+
+
+def _acquire(db: Session, owner: str, now: datetime) -> Optional[RollupWatermark]:
+    """Take the refresh lease, creating the watermark row on first use; None if another worker holds it"""
+    claimed = db.execute(
+        update(RollupWatermark)
+        .where(
+            RollupWatermark.name == WATERMARK_NAME,
+            or_(RollupWatermark.locked_until.is_(None), RollupWatermark.locked_until < now),
+        )
+        .values(locked_by=owner, locked_until=now + timedelta(seconds=ROLLUP_LEASE_SECONDS))
+    ).rowcount
+    if not claimed:
+        if db.get(RollupWatermark, WATERMARK_NAME) is not None:
+            db.rollback()
+            return None
+        db.add(RollupWatermark(name=WATERMARK_NAME, watermark=NEVER, locked_by=owner,
+                               locked_until=now + timedelta(seconds=ROLLUP_LEASE_SECONDS)))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker created the row first
+        db.rollback()
+        return None
+    return db.get(RollupWatermark, WATERMARK_NAME)
+
+
+def _release(db: Session, owner: str):
+    db.execute(
+        update(RollupWatermark)
+        .where(RollupWatermark.name == WATERMARK_NAME, RollupWatermark.locked_by == owner)
+        .values(locked_by=None, locked_until=None)
+    )
+    db.commit()
+
+
+def refresh_rollups(db: Session, full: bool = False) -> Optional[int]:
+    """Bring the rollups up to date; returns how many day buckets were recomputed.
+
+    Returns None without doing anything when another worker holds the lease.
+    """
+    now = datetime.utcnow()
+    owner = uuid.uuid4().hex
+    mark = _acquire(db, owner, now)
+    if mark is None:
+        return None
+    try:
+        changed_days = _refresh(db, mark, full, now - timedelta(seconds=ROLLUP_SETTLE_SECONDS))
+    except BaseException:
+        db.rollback()
+        _release(db, owner)
+        raise
+    return changed_days
+
+
+def _refresh(db: Session, mark: RollupWatermark, full: bool, horizon: datetime) -> int:
+    if full or mark.watermark <= NEVER:
+        db.execute(delete(RentalRollup))
+        rows = _day_totals(db, None)
+        changed_days: Set[datetime] = {row["bucket_start"] for row in rows}
+    else:
+        changed_days = {
+            day_start(start_date) for start_date in db.scalars(
+                select(Rental.start_date).where(Rental.updated_at > mark.watermark, Rental.updated_at <= horizon)
+            )
+        }
+        rows = []
+        ordered = sorted(changed_days)
+        for index in range(0, len(ordered), DAY_CHUNK):
+            chunk = ordered[index:index + DAY_CHUNK]
+            db.execute(delete(RentalRollup).where(
+                RentalRollup.period == "day", RentalRollup.bucket_start.in_(chunk)
+            ))
+            rows.extend(_day_totals(db, chunk))
+
+    _insert_rows(db, rows)
+    _rebuild_weeks(db, {week_start(day) for day in changed_days})
+
+    # The new watermark and the lease's release commit with the rollups
+    mark.watermark = horizon
+    mark.locked_by = None
+    mark.locked_until = None
+    db.commit()
+    return len(changed_days)
+
+
+def read_rollups(db: Session, period: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 category_id: Optional[int] = None) -> List[RentalRollup]:
+    query = select(RentalRollup).where(RentalRollup.period == period)
+    if start is not None:
+        query = query.where(RentalRollup.bucket_start >= start)
+    if end is not None:
+        query = query.where(RentalRollup.bucket_start < end)
+    if category_id is not None:
+        query = query.where(RentalRollup.category_id == category_id)
+    return list(db.scalars(query.order_by(RentalRollup.bucket_start, RentalRollup.category_id)))
+
+
+def watermark(db: Session) -> Optional[datetime]:
+    mark = db.get(RollupWatermark, WATERMARK_NAME)
+    return mark.watermark if mark and mark.watermark > NEVER else None
+
+
+class RollupRefresher:
+    def __init__(self, session_factory=SessionLocal, interval: float = ROLLUP_REFRESH_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._task = None
+
+    def run_once(self, full: bool = False) -> Optional[int]:
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            days = refresh_rollups(db, full=full)
+        finally:
+            db.close()
+            metrics.observe("rollup_refresh_duration_seconds", time.perf_counter() - started)
+        if days is not None:
+            metrics.inc("rollup_days_refreshed_total", days)
+        return days
+
+    async def _loop(self):
+        await asyncio.sleep(random.uniform(0, min(self.interval, 10)))
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception:
+                logger.exception("Rollup refresh failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+rollup_refresher = RollupRefresher()
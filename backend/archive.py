@@ -0,0 +1,240 @@
+"""Archive of old message threads, kept out of the hot `messages` table.
+
+Once a rental is completed or cancelled and its conversation has been
+quiet for MESSAGE_ARCHIVE_DAYS, the whole thread is compacted into one
+zlib-compressed JSON blob in a separate SQLite file (MESSAGE_ARCHIVE_PATH)
+and its rows are deleted from `messages`. `get_messages` then only scans
+live conversations, and `/api/messages/archive` reads old ones on demand.
+
+Threads move in batches of MESSAGE_ARCHIVE_BATCH. Each batch is written to
+the archive first and deleted from the database second; a crash between
+the two leaves the rows in both places, and the next run merges them into
+the archived thread again by message id, so nothing is lost or duplicated.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from database import Message, Rental, SessionLocal
+from instrumentation import metrics
+
+logger = logging.getLogger("campus_rentals.archive")
+
+MESSAGE_ARCHIVE_PATH = os.getenv("MESSAGE_ARCHIVE_PATH", "message_archive.db")
+MESSAGE_ARCHIVE_DAYS = float(os.getenv("MESSAGE_ARCHIVE_DAYS", "30"))
+MESSAGE_ARCHIVE_SECONDS = float(os.getenv("MESSAGE_ARCHIVE_SECONDS", "3600"))
+MESSAGE_ARCHIVE_BATCH = int(os.getenv("MESSAGE_ARCHIVE_BATCH", "100"))
+MESSAGE_ARCHIVE_MAX_BATCHES = 20
+ARCHIVED_STATUSES = ("completed", "cancelled")
+
+metrics.describe("messages_archived_total", "counter", "Messages moved to the archive store")
+metrics.describe("message_archive_duration_seconds", "histogram", "Time spent in one archive run")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+    rental_id INTEGER PRIMARY KEY,
+    renter_id INTEGER NOT NULL,
+    owner_id INTEGER NOT NULL,
+    message_count INTEGER NOT NULL,
+    first_at TEXT NOT NULL,
+    last_at TEXT NOT NULL,
+    archived_at TEXT NOT NULL,
+    messages BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_threads_renter ON threads (renter_id, last_at);
+CREATE INDEX IF NOT EXISTS ix_threads_owner ON threads (owner_id, last_at);
+"""
+
+_THREAD_COLUMNS = "rental_id, renter_id, owner_id, message_count, first_at, last_at, archived_at"
+
+
+def _pack(messages: List[dict]) -> bytes:
+    return zlib.compress(json.dumps(messages, separators=(",", ":")).encode(), 6)
+
+
+def _unpack(blob: bytes) -> List[dict]:
+    return json.loads(zlib.decompress(blob))
+
+
+class MessageArchive:
+    def __init__(self, path: str = MESSAGE_ARCHIVE_PATH):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+            self._initialized = True
+        return connection
+
+    def store(self, threads: Dict[int, dict]):
+        """Merge `{rental_id: {"renter_id", "owner_id", "messages"}}` into the archive"""
+        connection = self._connect()
+        try:
+            # One write transaction, so concurrent archivers merge rather than overwrite
+            connection.execute("BEGIN IMMEDIATE")
+            for rental_id, thread in threads.items():
+                row = connection.execute(
+                    "SELECT messages FROM threads WHERE rental_id = ?", (rental_id,)
+                ).fetchone()
+                merged = {message["id"]: message for message in (_unpack(row["messages"]) if row else [])}
+                merged.update((message["id"], message) for message in thread["messages"])
+                messages = sorted(merged.values(), key=lambda message: (message["created_at"], message["id"]))
+                connection.execute(
+                    f"INSERT OR REPLACE INTO threads ({_THREAD_COLUMNS}, messages) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (rental_id, thread["renter_id"], thread["owner_id"], len(messages),
+                     messages[0]["created_at"], messages[-1]["created_at"],
+                     datetime.utcnow().isoformat(), _pack(messages)),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def threads_for(self, user_id: int, limit: int = 50, offset: int = 0) -> List[dict]:
+        """Archived threads the user took part in, most recent first"""
+        if not os.path.exists(self.path):
+            return []
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                f"""SELECT {_THREAD_COLUMNS} FROM threads WHERE renter_id = ?
+                    UNION
+                    SELECT {_THREAD_COLUMNS} FROM threads WHERE owner_id = ?
+                    ORDER BY last_at DESC, rental_id DESC LIMIT ? OFFSET ?""",
+                (user_id, user_id, limit, offset),
+            ).fetchall()
+        finally:
+            connection.close()
+        return [dict(row) for row in rows]
+
+    def thread(self, rental_id: int) -> Optional[dict]:
+        """One archived thread with its messages, or None"""
+        if not os.path.exists(self.path):
+            return None
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                f"SELECT {_THREAD_COLUMNS}, messages FROM threads WHERE rental_id = ?", (rental_id,)
+            ).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        thread = dict(row)
+        thread["messages"] = _unpack(thread["messages"])
+        return thread
+
+
+class MessageArchiver:
+    def __init__(self, archive: MessageArchive, session_factory=SessionLocal,
+                 interval: float = MESSAGE_ARCHIVE_SECONDS, batch_size: int = MESSAGE_ARCHIVE_BATCH,
+                 max_age: timedelta = timedelta(days=MESSAGE_ARCHIVE_DAYS)):
+        self.archive = archive
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self._task = None
+
+    def archive_batch(self, db: Session) -> int:
+        """Move up to `batch_size` eligible threads; returns how many messages moved"""
+        cutoff = datetime.utcnow() - self.max_age
+        rental_ids = db.scalars(
+            select(Message.rental_id)
+            .join(Rental, Rental.id == Message.rental_id)
+            .where(Rental.status.in_(ARCHIVED_STATUSES), Rental.updated_at < cutoff)
+            .group_by(Message.rental_id)
+            .having(func.max(Message.created_at) < cutoff)
+            .limit(self.batch_size)
+        ).all()
+        if not rental_ids:
+            return 0
+
+        parties = {
+            rental_id: (renter_id, owner_id)
+            for rental_id, renter_id, owner_id in db.execute(
+                select(Rental.id, Rental.renter_id, Rental.owner_id).where(Rental.id.in_(rental_ids))
+            )
+        }
+        threads: Dict[int, dict] = {}
+        message_ids = []
+        for message in db.execute(select(
+            Message.id, Message.rental_id, Message.sender_id, Message.receiver_id,
+            Message.content, Message.created_at, Message.read,
+        ).where(Message.rental_id.in_(rental_ids))):
+            renter_id, owner_id = parties[message.rental_id]
+            thread = threads.setdefault(
+                message.rental_id, {"renter_id": renter_id, "owner_id": owner_id, "messages": []}
+            )
+            thread["messages"].append({
+                "id": message.id,
+                "sender_id": message.sender_id,
+                "receiver_id": message.receiver_id,
+                "content": message.content,
+                "created_at": message.created_at.isoformat(),
+                "read": bool(message.read),
+            })
+            message_ids.append(message.id)
+
+        self.archive.store(threads)
+        db.execute(delete(Message).where(Message.id.in_(message_ids)))
+        db.commit()
+        return len(message_ids)
+
+    def run_once(self) -> int:
+        started = time.perf_counter()
+        moved = 0
+        db = self.session_factory()
+        try:
+            for _ in range(MESSAGE_ARCHIVE_MAX_BATCHES):
+                count = self.archive_batch(db)
+                moved += count
+                if not count:
+                    break
+        finally:
+            db.close()
+            metrics.observe("message_archive_duration_seconds", time.perf_counter() - started)
+        metrics.inc("messages_archived_total", moved)
+        if moved:
+            logger.info("Archived %d messages to %s", moved, self.archive.path)
+        return moved
+
+    async def _loop(self):
+        await asyncio.sleep(random.uniform(0, min(self.interval, 60)))
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception:
+                logger.exception("Message archiving failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+message_archive = MessageArchive()
+message_archiver = MessageArchiver(message_archive)
@@ -1,20 +1,67 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 from pydantic import BaseModel, EmailStr
+import os
 import re
+import threading
+import time
+import uuid
 
-SECRET_KEY = "campus-rentals-super-secret-key-change-in-production"
+from revocation import revoked_tokens
+
+SECRET_KEY = os.getenv("SECRET_KEY", "campus-rentals-super-secret-key-change-in-production")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 1 week
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+
+
+def _signing_keys() -> Dict[str, str]:
+    """kid -> secret from JWT_KEYS, e.g. "2025-02=new-secret,2024-11=old-secret".
+
+    Tokens name their key in the `kid` header. To rotate, add the new key,
+    point JWT_ACTIVE_KID at it, and drop the old key once the tokens it
+    signed (at most REFRESH_TOKEN_EXPIRE_DAYS old) have expired.
+    """
+    keys = {}
+    for entry in os.getenv("JWT_KEYS", "").split(","):
+        kid, _, secret = entry.strip().partition("=")
+        if kid and secret:
+            keys[kid] = secret
+    return keys or {"default": SECRET_KEY}
+
+
+SIGNING_KEYS = _signing_keys()
+ACTIVE_KID = os.getenv("JWT_ACTIVE_KID") or next(iter(SIGNING_KEYS))
+if ACTIVE_KID not in SIGNING_KEYS:
+    raise RuntimeError(f"JWT_ACTIVE_KID '{ACTIVE_KID}' is not one of the JWT_KEYS")
+
+
 
-pwd_context = CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto")
+# passlib and python-jose are imported on first use; they add noticeably to
+# worker start-up and most processes (job runners, tooling) never need them.
+@lru_cache(maxsize=None)
+def _pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto")
+
+
+@lru_cache(maxsize=None)
+def _jose():
+    from jose import JWTError, jwt
+    return jwt, JWTError
 
 
 class Token(BaseModel):
     access_token: str
+    refresh_token: str
     token_type: str
+    expires_in: int
+
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
 
 
 class TokenData(BaseModel):
@@ -39,28 +86,95 @@ def verify_edu_email(email: str) -> bool:
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return _pwd_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return _pwd_context().hash(password)
 
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+def _encode(data: dict, token_type: str, expires_delta: timedelta) -> str:
+    now = datetime.utcnow()
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    to_encode.update({"exp": now + expires_delta, "iat": now, "jti": uuid.uuid4().hex, "type": token_type})
+    jwt, _ = _jose()
+    return jwt.encode(to_encode, SIGNING_KEYS[ACTIVE_KID], algorithm=ALGORITHM, headers={"kid": ACTIVE_KID})
 
 
-def decode_access_token(token: str) -> Optional[str]:
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    return _encode(data, "access", expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+
+def create_refresh_token(email: str) -> str:
+    return _encode({"sub": email}, "refresh", timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+
+
+def issue_tokens(email: str) -> dict:
+    """Access/refresh token pair returned by login, register and refresh"""
+    return {
+        "access_token": create_access_token(data={"sub": email}),
+        "refresh_token": create_refresh_token(email),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+
+def decode_token(token: str, token_type: str = "access") -> Optional[dict]:
+    """Claims of a valid, unrevoked token of `token_type`, else None"""
+    jwt, JWTError = _jose()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        return email
+        header = jwt.get_unverified_header(token)
+        claims = jwt.get_unverified_claims(token)
     except JWTError:
         return None
+    # Revoked tokens are turned away before any signature work
+    jti = claims.get("jti")
+    if not jti or revoked_tokens.is_revoked(jti):
+        return None
+    key = SIGNING_KEYS.get(header.get("kid"))
+    if key is None:
+        return None
+    try:
+        payload = jwt.decode(token, key, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("type") != token_type:
+        return None
+    return payload
+
+
+def decode_access_token(token: str) -> Optional[str]:
+    payload = decode_token(token)
+    return payload.get("sub") if payload else None
+
+
+# token -> (subject, exp) for tokens whose signature has been checked once
+_verified: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+_verified_lock = threading.Lock()
+VERIFIED_CACHE_SIZE = 4096
+
+
+def verified_subject(token: str) -> Optional[str]:
+    """`sub` of a valid access token, for keying rate limits and routing.
+
+    The first sighting of a token pays for the signature check; repeats are a
+    dict lookup until the token expires. Tokens that fail verification are not
+    cached, so a forged token is checked (and rejected) every time.
+    """
+    now = time.time()
+    with _verified_lock:
+        cached = _verified.get(token)
+        if cached is not None:
+            if cached[1] > now:
+                _verified.move_to_end(token)
+                return cached[0]
+            del _verified[token]
+    payload = decode_token(token)
+    subject = payload.get("sub") if payload else None
+    if not isinstance(subject, str):
+        return None
+    with _verified_lock:
+        _verified[token] = (subject, float(payload.get("exp", now)))
+        while len(_verified) > VERIFIED_CACHE_SIZE:
+            _verified.popitem(last=False)
+    return subject
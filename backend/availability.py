@@ -0,0 +1,174 @@
+"""Per-item occupancy bitmaps for calendars and date-filtered searches.
+
+Each item with bookings gets one bit per day over a rolling window of
+AVAILABILITY_HORIZON_DAYS starting today (UTC). A day is occupied when an
+approved or active rental, or a blocked AvailabilityBlock, touches it. The
+rows are packed into a uint8 matrix sorted by item id, so "free on every
+one of these days" for a whole candidate set is one AND against a day
+mask and an `any` per row. Items without a row have no bookings.
+
+The bitmaps are built on first use and rebuilt when the day rolls over.
+Commits touching rentals or blocks mark their items dirty, and those rows
+are reloaded on the next read. Other workers hear about changes through
+the `availability` channel and rebuild everything. The lifecycle sweeper
+cancels approved rentals that ended earlier today, whose last day is still
+in the window; its bulk updates reach the same hook through
+`record_bulk_changes`.
+
+Times are naive UTC throughout, like the rest of the schema; use `as_utc`
+on datetimes parsed from requests.
+"""
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Set
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database import AvailabilityBlock, Rental, on_commit
+from shared_state import Channel, Subscription
+
+AVAILABILITY_HORIZON_DAYS = int(os.getenv("AVAILABILITY_HORIZON_DAYS", "366"))
+OCCUPYING_STATUSES = ("approved", "active")
+
+
+def as_utc(moment: datetime) -> datetime:
+    """Naive UTC for comparing with stored times; naive input is taken as UTC"""
+    if moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def day_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, moment.day)
+
+
+class OccupancyIndex:
+    def __init__(self, horizon_days: int = AVAILABILITY_HORIZON_DAYS, changes: Optional[Subscription] = None):
+        self.horizon_days = horizon_days
+        self.changes = changes
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.origin: Optional[datetime] = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.bits = np.zeros((0, (self.horizon_days + 7) // 8), dtype=np.uint8)
+        self._dirty: Set[int] = set()
+
+    def _day_range(self, start: datetime, end: datetime):
+        """Window day indexes [first, last) covered by [start, end)"""
+        first = (start - self.origin).days
+        last = (end - self.origin).days + (end != day_start(end))
+        return max(first, 0), min(last, self.horizon_days)
+
+    def _occupancy(self, db: Session, item_ids: Optional[Iterable[int]]):
+        """(ids, packed rows) for items with occupied days; all items when item_ids is None"""
+        window_end = self.origin + timedelta(days=self.horizon_days)
+        rentals = select(Rental.item_id, Rental.start_date, Rental.end_date).where(
+            Rental.status.in_(OCCUPYING_STATUSES), Rental.end_date > self.origin, Rental.start_date < window_end
+        )
+        blocks = select(AvailabilityBlock.item_id, AvailabilityBlock.start_date, AvailabilityBlock.end_date).where(
+            AvailabilityBlock.is_blocked == True,
+            AvailabilityBlock.end_date > self.origin, AvailabilityBlock.start_date < window_end,
+        )
+        if item_ids is not None:
+            item_ids = list(item_ids)
+            rentals = rentals.where(Rental.item_id.in_(item_ids))
+            blocks = blocks.where(AvailabilityBlock.item_id.in_(item_ids))
+        ranges = db.execute(rentals).all() + db.execute(blocks).all()
+        if not ranges:
+            return np.empty(0, dtype=np.int64), np.zeros((0, self.bits.shape[1]), dtype=np.uint8)
+
+        ids = np.unique(np.array([row[0] for row in ranges], dtype=np.int64))
+        spans = np.array([(row[0], *self._day_range(row[1], row[2])) for row in ranges], dtype=np.int64)
+        spans = spans[spans[:, 1] < spans[:, 2]]
+        rows = np.searchsorted(ids, spans[:, 0])
+        # +1 where a booking starts and -1 where it ends; a running sum > 0 is occupied
+        counts = np.zeros((len(ids), self.horizon_days + 1), dtype=np.int32)
+        np.add.at(counts, (rows, spans[:, 1]), 1)
+        np.add.at(counts, (rows, spans[:, 2]), -1)
+        occupied = np.cumsum(counts, axis=1)[:, :self.horizon_days] > 0
+        return ids, np.packbits(occupied, axis=1, bitorder="little")
+
+    def _refresh(self, db: Session):
+        today = day_start(datetime.utcnow())
+        if self.origin != today or (self.changes is not None and self.changes.changed()):
+            self._clear()
+            self.origin = today
+            self.ids, self.bits = self._occupancy(db, None)
+        elif self._dirty:
+            dirty = np.array(sorted(self._dirty), dtype=np.int64)
+            self._dirty = set()
+            keep = ~np.isin(self.ids, dirty)
+            ids, bits = self._occupancy(db, dirty.tolist())
+            merged = np.concatenate([self.ids[keep], ids])
+            order = np.argsort(merged, kind="stable")
+            self.ids = merged[order]
+            self.bits = np.concatenate([self.bits[keep], bits])[order]
+
+    def _rows(self, item_ids: np.ndarray):
+        """Packed rows aligned with item_ids; zeros for items without bookings"""
+        positions = np.searchsorted(self.ids, item_ids)
+        positions[positions >= len(self.ids)] = 0
+        found = self.ids[positions] == item_ids if len(self.ids) else np.zeros(len(item_ids), dtype=bool)
+        rows = np.zeros((len(item_ids), self.bits.shape[1]), dtype=np.uint8)
+        rows[found] = self.bits[positions[found]]
+        return rows
+
+    def window(self, db: Session):
+        """(first day, day count) the bitmaps cover"""
+        with self._lock:
+            self._refresh(db)
+            return self.origin, self.horizon_days
+
+    def free(self, db: Session, item_ids: Iterable[int], start: datetime, end: datetime) -> np.ndarray:
+        """Boolean array: which items have no occupied day in [start, end)"""
+        item_ids = np.fromiter(item_ids, dtype=np.int64)
+        with self._lock:
+            self._refresh(db)
+            first, last = self._day_range(start, end)
+            days = np.zeros(self.horizon_days, dtype=bool)
+            days[first:last] = True
+            mask = np.packbits(days, bitorder="little")
+            return ~(self._rows(item_ids) & mask).any(axis=1)
+
+    def calendar(self, db: Session, item_id: int, start: datetime, days: int) -> List[bool]:
+        """Occupied flag for each of `days` days from `start`"""
+        with self._lock:
+            self._refresh(db)
+            first = (day_start(start) - self.origin).days
+            row = np.unpackbits(self._rows(np.array([item_id], dtype=np.int64))[0], bitorder="little")
+            return row[first:first + days].astype(bool).tolist()
+
+    def mark_dirty(self, item_ids: Iterable[Optional[int]]):
+        with self._lock:
+            for item_id in item_ids:
+                if item_id is None:
+                    # A change we can't attribute to an item; rebuild everything
+                    self.origin = None
+                    return
+                self._dirty.add(item_id)
+
+
+availability_channel = Channel("availability")
+item_availability = OccupancyIndex(changes=availability_channel.subscribe())
+
+
+def _sync(changes):
+    availability_channel.publish()
+    item_availability.mark_dirty(row.get("item_id") for _, row in changes)
+
+
+def _sync_rentals(changes):
+    # New requests are pending and occupy nothing until approved
+    changes = [(operation, row) for operation, row in changes
+               if operation != "insert" or row.get("status") in OCCUPYING_STATUSES]
+    if changes:
+        _sync(changes)
+
+
+on_commit(Rental, _sync_rentals)
+on_commit(AvailabilityBlock, _sync)
@@ -0,0 +1,196 @@
+"""Latency/throughput benchmark for the API hot paths.
+
+Runs the FastAPI app in-process over httpx's ASGI transport against a
+generated SQLite dataset and writes per-endpoint results to JSON:
+
+    cd backend
+    python benchmarks/bench_api.py
+    python benchmarks/bench_api.py --compare benchmarks/results/api-<sha>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from common import BACKEND_DIR, CAMPUS, percentile, write_results
+from dataset import BENCH_EMAIL, BENCH_PASSWORD, DEFAULT_SIZES, create_bench_engine, generate_dataset
+
+# static/ is resolved relative to the working directory
+os.chdir(BACKEND_DIR)
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+import main
+from database import get_db, get_read_db
+from revocation import revoked_tokens
+
+# name -> (method, path, params/json, needs auth)
+SCENARIOS = {
+    "items_all": ("GET", "/api/items", {}, False),
+    "items_search": ("GET", "/api/items", {"search": "camera"}, False),
+    "items_distance": ("GET", "/api/items", {**CAMPUS, "max_distance": 3}, False),
+    "items_search_distance": (
+        "GET", "/api/items", {**CAMPUS, "max_distance": 5, "search": "bike"}, False
+    ),
+    "items_grid_fields": (
+        "GET", "/api/items", {**CAMPUS, "max_distance": 3, "fields": "id,title,daily_rate,images,distance"}, False
+    ),
+    "items_rank": ("GET", "/api/items", {**CAMPUS, "max_distance": 5, "sort": "rank", "limit": 20}, False),
+    "item_detail": ("GET", "/api/items/1", {}, False),
+    "categories": ("GET", "/api/categories", {}, False),
+    "my_rentals": ("GET", "/api/rentals/my-rentals", {}, True),
+    "my_rentals_no_qr": ("GET", "/api/rentals/my-rentals", {"fields": "id,item,renter,owner,status"}, True),
+    "earnings": ("GET", "/api/dashboard/earnings", {}, True),
+    "login": ("POST", "/api/auth/login", {"email": BENCH_EMAIL, "password": BENCH_PASSWORD}, False),
+}
+
+
+class QueryCounter:
+    """Counts SQL statements executed on an engine"""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+async def run_scenario(client, counter, name, headers, requests, concurrency, warmup):
+    method, path, payload, needs_auth = SCENARIOS[name]
+    kwargs = {"headers": headers if needs_auth else {}}
+    if method == "GET":
+        kwargs["params"] = payload
+    else:
+        kwargs["json"] = payload
+
+    for _ in range(warmup):
+        await client.request(method, path, **kwargs)
+
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    queries_before = counter.count
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "queries_per_request": round((counter.count - queries_before) / requests, 2),
+    }
+
+
+async def run_benchmarks(args, db_path):
+    engine = create_bench_engine(db_path)
+    counter = QueryCounter(engine)
+    BenchSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = BenchSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[get_db] = override_get_db
+    main.app.dependency_overrides[get_read_db] = override_get_db
+    # Token revocation checks read the denylist from the same database
+    revoked_tokens.session_factory = BenchSession
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post(
+                "/api/auth/login", json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD}
+            )
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            for name in args.scenarios:
+                # Password hashing dominates login, so fewer iterations suffice
+                requests = max(1, args.requests // 10) if name == "login" else args.requests
+                results[name] = await run_scenario(
+                    client, counter, name, headers, requests, args.concurrency, args.warmup
+                )
+                print(
+                    f"{name:<24} p50 {results[name]['p50_ms']:>9.2f}ms  "
+                    f"p95 {results[name]['p95_ms']:>9.2f}ms  "
+                    f"p99 {results[name]['p99_ms']:>9.2f}ms  "
+                    f"{results[name]['throughput_rps']:>8.1f} req/s  "
+                    f"{results[name]['queries_per_request']:>7.2f} q/req"
+                )
+    finally:
+        main.app.dependency_overrides.pop(get_db, None)
+        main.app.dependency_overrides.pop(get_read_db, None)
+        engine.dispose()
+    return results
+
+
+def print_comparison(baseline_path, results):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline['meta']['commit']} ({baseline_path}):")
+    for name, current in results.items():
+        previous = baseline["results"].get(name)
+        if not previous:
+            continue
+        for metric in ("p50_ms", "p95_ms", "queries_per_request"):
+            if previous[metric]:
+                change = (current[metric] - previous[metric]) / previous[metric] * 100
+                print(f"  {name:<24} {metric:<20} {previous[metric]:>10} -> {current[metric]:>10} ({change:+.1f}%)")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent in-flight requests")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests per scenario")
+    parser.add_argument("--items", type=int, default=DEFAULT_SIZES["items"])
+    parser.add_argument("--users", type=int, default=DEFAULT_SIZES["users"])
+    parser.add_argument("--rentals", type=int, default=DEFAULT_SIZES["rentals"])
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--output", help="results file (default: benchmarks/results/api-<commit>.json)")
+    parser.add_argument("--compare", help="previous results file to diff against")
+    args = parser.parse_args()
+
+    sizes = {"items": args.items, "users": args.users, "rentals": args.rentals}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        print(f"Generating dataset {sizes}...")
+        sizes = generate_dataset(db_path, sizes)
+        results = asyncio.run(run_benchmarks(args, db_path))
+
+    output = write_results(
+        "api", {"dataset": sizes, "concurrency": args.concurrency}, results, args.output
+    )
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        print_comparison(args.compare, results)
+
+
+if __name__ == "__main__":
+    main_cli()
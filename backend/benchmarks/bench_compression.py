@@ -0,0 +1,123 @@
+"""Bytes-on-wire and CPU cost of response compression at different levels.
+
+Captures real response bodies from the in-process app (item listings,
+item detail, my-rentals with QR codes, categories) and measures the
+compressed size and compression CPU time for gzip and Brotli levels:
+
+    cd backend
+    python benchmarks/bench_compression.py
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from common import BACKEND_DIR, CAMPUS, write_results
+from dataset import BENCH_EMAIL, BENCH_PASSWORD, DEFAULT_SIZES, create_bench_engine, generate_dataset
+
+os.chdir(BACKEND_DIR)
+
+import httpx
+from sqlalchemy.orm import sessionmaker
+
+import main
+from compression import brotli, compress
+from database import get_db, get_read_db
+from revocation import revoked_tokens
+
+PAYLOADS = {
+    "items_all": ("/api/items", {}, False),
+    "items_distance": ("/api/items", {**CAMPUS, "max_distance": 3}, False),
+    "item_detail": ("/api/items/1", {}, False),
+    "categories": ("/api/categories", {}, False),
+    "my_rentals": ("/api/rentals/my-rentals", {}, True),
+}
+LEVELS = [("gzip", 1), ("gzip", 6), ("gzip", 9)]
+if brotli is not None:
+    LEVELS += [("br", 1), ("br", 5), ("br", 11)]
+
+
+async def capture_bodies(db_path):
+    engine = create_bench_engine(db_path)
+    BenchSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = BenchSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[get_db] = override_get_db
+    main.app.dependency_overrides[get_read_db] = override_get_db
+    revoked_tokens.session_factory = BenchSession
+    bodies = {}
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        # identity keeps the middleware from compressing what we want to measure
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", headers={"Accept-Encoding": "identity"}
+        ) as client:
+            response = await client.post(
+                "/api/auth/login", json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD}
+            )
+            auth = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            for name, (path, params, needs_auth) in PAYLOADS.items():
+                response = await client.get(path, params=params, headers=auth if needs_auth else {})
+                response.raise_for_status()
+                bodies[name] = response.content
+    finally:
+        main.app.dependency_overrides.pop(get_db, None)
+        main.app.dependency_overrides.pop(get_read_db, None)
+        engine.dispose()
+    return bodies
+
+
+def measure(body: bytes, encoding: str, level: int, min_seconds: float):
+    runs = 0
+    started = time.process_time()
+    while True:
+        compressed = compress(body, encoding, level)
+        runs += 1
+        elapsed = time.process_time() - started
+        if elapsed >= min_seconds:
+            break
+    cpu_ms = elapsed / runs * 1000
+    return {
+        "bytes": len(compressed),
+        "ratio": round(len(compressed) / len(body), 4),
+        "cpu_ms": round(cpu_ms, 4),
+        "mb_per_s": round(len(body) / 1e6 / (cpu_ms / 1000), 1) if cpu_ms else None,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=DEFAULT_SIZES["items"])
+    parser.add_argument("--min-seconds", type=float, default=0.2, help="CPU time to spend per measurement")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/compression-<commit>.json)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        print("Generating dataset...")
+        sizes = generate_dataset(db_path, {"items": args.items})
+        bodies = asyncio.run(capture_bodies(db_path))
+
+    results = {}
+    for name, body in bodies.items():
+        results[name] = {"identity_bytes": len(body)}
+        line = [f"{name:<16} {len(body):>10,} B"]
+        for encoding, level in LEVELS:
+            result = measure(body, encoding, level, args.min_seconds)
+            results[name][f"{encoding}-{level}"] = result
+            line.append(f"{encoding}-{level}: {result['ratio']:.3f} @ {result['cpu_ms']:.2f}ms")
+        print("  ".join(line))
+
+    output = write_results("compression", {"dataset": sizes}, results, args.output)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main_cli()
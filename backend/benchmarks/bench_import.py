@@ -0,0 +1,120 @@
+"""Start-up cost of the API process: import time and schema check.
+
+Imports main in fresh interpreters under `python -X importtime`, reports
+the median cumulative import time, the slowest top-level imports and the
+cost of init_db() on an already current database, and checks them against
+benchmarks/import_budget.json. Exits non-zero when over budget:
+
+    cd backend
+    python benchmarks/bench_import.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from common import BACKEND_DIR, write_results
+
+BUDGET_PATH = os.path.join(BACKEND_DIR, "benchmarks", "import_budget.json")
+
+PROBE = """
+import json, sys, time
+import main
+from database import init_db
+init_db()
+started = time.perf_counter()
+init_db()
+print(json.dumps({
+    "modules": sorted(sys.modules),
+    "init_db_current_schema_ms": (time.perf_counter() - started) * 1000,
+}))
+"""
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Cumulative microseconds for main and each module main imports directly"""
+    imports, children = {}, {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # One leading space, then two per nesting level; children print before their parent
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children[name.strip()] = int(cumulative)
+        elif depth == 0:
+            if name.strip() == "main":
+                imports = {**children, "main": int(cumulative)}
+            children = {}
+    return imports
+
+
+def run_probe(db_path: str) -> dict:
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}"}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    probe = json.loads(completed.stdout.strip().splitlines()[-1])
+    probe["imports"] = parse_importtime(completed.stderr)
+    return probe
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to measure")
+    parser.add_argument("--budget", default=BUDGET_PATH)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/import-<commit>.json)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "import.db")
+        run_probe(db_path)  # warm bytecode caches and create the schema
+        probes = [run_probe(db_path) for _ in range(args.runs)]
+
+    main_ms = statistics.median(p["imports"]["main"] / 1000 for p in probes)
+    init_ms = statistics.median(p["init_db_current_schema_ms"] for p in probes)
+    slowest = sorted(
+        ((name, us / 1000) for name, us in probes[-1]["imports"].items() if name != "main"),
+        key=lambda pair: -pair[1]
+    )[:10]
+
+    print(f"import main              {main_ms:>8.1f} ms (median of {args.runs})")
+    print(f"init_db (current schema) {init_ms:>8.2f} ms")
+    print("slowest imports:")
+    for name, ms in slowest:
+        print(f"  {name:<30} {ms:>8.1f} ms")
+
+    with open(args.budget) as f:
+        budget = json.load(f)
+    loaded = set(probes[-1]["modules"])
+    failures = []
+    if main_ms > budget["main_import_ms"]:
+        failures.append(f"import main took {main_ms:.0f} ms (budget {budget['main_import_ms']} ms)")
+    if init_ms > budget["init_db_current_schema_ms"]:
+        failures.append(f"init_db took {init_ms:.1f} ms (budget {budget['init_db_current_schema_ms']} ms)")
+    for module in budget["forbidden_modules"]:
+        if module in loaded:
+            failures.append(f"{module} is imported at start-up; import it where it is used")
+
+    output = write_results(
+        "import", {"runs": args.runs, "budget": budget},
+        {"main_import_ms": round(main_ms, 1), "init_db_current_schema_ms": round(init_ms, 3),
+         "slowest_imports_ms": {name: round(ms, 1) for name, ms in slowest}, "failures": failures},
+        args.output
+    )
+    print(f"\nResults written to {output}")
+
+    if failures:
+        print("\nOver budget:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("Within budget")
+
+
+if __name__ == "__main__":
+    main_cli()
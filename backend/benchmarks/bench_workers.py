@@ -0,0 +1,141 @@
+"""Throughput of the multi-worker deployment (serve.py) at 1/2/4/8 workers.
+
+Starts serve.py against a generated dataset for each worker count, drives
+it over real HTTP with a fixed number of concurrent clients, and writes
+throughput and latency per worker count to JSON:
+
+    cd backend
+    python benchmarks/bench_workers.py --workers 1 2 4 8 --duration 15
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from common import BACKEND_DIR, CAMPUS, percentile, write_results
+from dataset import BENCH_EMAIL, BENCH_PASSWORD, DEFAULT_SIZES, generate_dataset
+
+# Weighted mix of read traffic; login is left out since it is CPU-bound by design
+REQUEST_MIX = [
+    (5, "/api/items", {"search": "camera"}),
+    (3, "/api/items", {**CAMPUS, "max_distance": 3}),
+    (3, "/api/items/nearby", {**CAMPUS, "k": 10}),
+    (4, "/api/items/1", {}),
+    (2, "/api/categories", {}),
+    (2, "/api/dashboard/earnings", None),
+]
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve.py exited with {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/api/categories", timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("serve.py did not become ready in time")
+
+
+async def drive_load(base_url: str, concurrency: int, duration: float, seed: int = 1):
+    rng = random.Random(seed)
+    population = [entry for weight, *rest in REQUEST_MIX for entry in [rest] * weight]
+    latencies = []
+    errors = 0
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        response = await client.post(
+            "/api/auth/login", json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD}
+        )
+        response.raise_for_status()
+        auth = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        deadline = time.perf_counter() + duration
+
+        async def client_loop():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                path, params = rng.choice(population)
+                started = time.perf_counter()
+                response = await client.get(
+                    path, params=params or {}, headers=auth if params is None else {}
+                )
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--concurrency", type=int, default=64, help="concurrent HTTP clients")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of load per worker count")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--items", type=int, default=DEFAULT_SIZES["items"])
+    parser.add_argument("--output", help="results file (default: benchmarks/results/workers-<commit>.json)")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        print("Generating dataset...")
+        sizes = generate_dataset(db_path, {"items": args.items})
+        base_url = f"http://127.0.0.1:{args.port}"
+
+        for workers in args.workers:
+            env = {
+                **os.environ,
+                "DATABASE_URL": f"sqlite:///{db_path}",
+                "SHARED_STATE_URL": f"sqlite:///{os.path.join(tmp, 'shared_state.db')}",
+            }
+            process = subprocess.Popen(
+                [sys.executable, "serve.py", "--workers", str(workers), "--port", str(args.port),
+                 "--log-level", "warning"],
+                cwd=BACKEND_DIR, env=env,
+            )
+            try:
+                wait_until_ready(base_url, process)
+                results[str(workers)] = asyncio.run(drive_load(base_url, args.concurrency, args.duration))
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+            r = results[str(workers)]
+            print(
+                f"{workers} worker(s): {r['throughput_rps']:>8.1f} req/s  "
+                f"p50 {r['p50_ms']:>8.2f}ms  p99 {r['p99_ms']:>8.2f}ms  errors {r['errors']}"
+            )
+
+    output = write_results("workers", {
+        "cpu_count": os.cpu_count(),
+        "dataset": sizes,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+    }, results, args.output)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,153 @@
+"""Synthetic dataset generator shared by the benchmark scripts"""
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+import common  # noqa: F401 (puts backend/ on sys.path)
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, User, Category, Item, Rental, Transaction, Message
+from auth import get_password_hash
+from pricing import rental_charges
+from seed_data import CATEGORIES_DATA, PRINCETON_LOCATIONS, SAMPLE_ITEMS
+
+BENCH_EMAIL = "bench@princeton.edu"
+BENCH_PASSWORD = "password123"
+DEFAULT_SIZES = {"users": 200, "items": 2000, "rentals": 1500, "bench_rentals": 40}
+
+
+def create_bench_engine(path: str):
+    return create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+
+
+def generate_dataset(path: str, sizes: dict = None, seed: int = 42) -> dict:
+    """Create a fresh SQLite database at `path` filled with synthetic data.
+
+    User id 1 is the benchmark user: it owns a slice of the catalog and is
+    the renter or owner of `bench_rentals` rentals so that the per-user
+    endpoints (my-rentals, earnings) have realistic work to do.
+    """
+    sizes = {**DEFAULT_SIZES, **(sizes or {})}
+    rng = random.Random(seed)
+
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_bench_engine(path)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    # Hashing is deliberately slow, so every user shares one hash
+    hashed_password = get_password_hash(BENCH_PASSWORD)
+    now = datetime.utcnow()
+
+    categories = [Category(**data) for data in CATEGORIES_DATA]
+    db.add_all(categories)
+    db.flush()
+
+    users = []
+    for i in range(sizes["users"]):
+        location = PRINCETON_LOCATIONS[i % len(PRINCETON_LOCATIONS)]
+        users.append(User(
+            email=BENCH_EMAIL if i == 0 else f"user{i}@princeton.edu",
+            hashed_password=hashed_password,
+            full_name=f"Bench User {i}",
+            phone=f"+1-609-555-{i:04d}",
+            bio="Synthetic benchmark account.",
+            verified=True,
+            is_admin=i == 0,
+            rating=round(rng.uniform(3.5, 5.0), 1),
+            total_ratings=rng.randint(0, 40),
+            latitude=location["lat"],
+            longitude=location["lng"],
+            address=location["name"],
+        ))
+    db.add_all(users)
+    db.flush()
+
+    items = []
+    for i in range(sizes["items"]):
+        template = SAMPLE_ITEMS[i % len(SAMPLE_ITEMS)]
+        location = PRINCETON_LOCATIONS[i % len(PRINCETON_LOCATIONS)]
+        # Spread items over roughly a 20 mile box around campus
+        item = Item(
+            owner_id=users[i % len(users)].id,
+            title=f"{template['title']} #{i}",
+            description=template["description"],
+            daily_rate=round(template["daily_rate"] * rng.uniform(0.5, 1.5), 2),
+            weekly_rate=template.get("weekly_rate"),
+            deposit=template["deposit"],
+            condition=template["condition"],
+            available=rng.random() > 0.05,
+            latitude=location["lat"] + rng.uniform(-0.15, 0.15),
+            longitude=location["lng"] + rng.uniform(-0.2, 0.2),
+            location_name=location["name"],
+            insurance_value=template.get("insurance_value", 2000.0),
+            images=json.dumps([
+                f"http://localhost:8000/static/images/{template.get('image_folder', 'default')}/{n}.jpg"
+                for n in range(3)
+            ]),
+            created_at=now - timedelta(days=rng.randint(0, 365)),
+        )
+        item.categories = rng.sample(categories, rng.randint(1, 2))
+        items.append(item)
+    db.add_all(items)
+    db.flush()
+
+    bench_user = users[0]
+    bench_items = [item for item in items if item.owner_id == bench_user.id]
+    for i in range(sizes["rentals"] + sizes["bench_rentals"]):
+        if i < sizes["bench_rentals"]:
+            # Alternate the benchmark user between owner and renter
+            if i % 2 == 0 and bench_items:
+                item = rng.choice(bench_items)
+                renter = rng.choice(users[1:])
+            else:
+                item = rng.choice([it for it in items[:50] if it.owner_id != bench_user.id])
+                renter = bench_user
+        else:
+            item = rng.choice(items)
+            renter = rng.choice([u for u in users[:20] if u.id != item.owner_id])
+
+        start_date = now + timedelta(days=rng.randint(-120, 30))
+        days = rng.randint(1, 10)
+        status = rng.choice(["pending", "approved", "active", "completed", "completed"])
+        rental = Rental(
+            item_id=item.id,
+            renter_id=renter.id,
+            owner_id=item.owner_id,
+            start_date=start_date,
+            end_date=start_date + timedelta(days=days),
+            **rental_charges(item, days),
+            status=status,
+            pickup_qr=f"PICKUP-{item.id}-{renter.id}-{i}",
+            return_qr=f"RETURN-{item.id}-{renter.id}-{i}",
+            created_at=start_date - timedelta(days=2),
+        )
+        db.add(rental)
+        db.flush()
+
+        if status == "completed":
+            db.add(Transaction(
+                user_id=rental.owner_id,
+                rental_id=rental.id,
+                amount=rental.owner_earnings,
+                type="earning",
+                status="completed",
+                description=f"Earned from renting '{item.title}'",
+                created_at=rental.end_date,
+            ))
+        db.add(Message(
+            rental_id=rental.id,
+            sender_id=renter.id,
+            receiver_id=rental.owner_id,
+            content="Hi! Is this item still available?",
+            created_at=rental.created_at,
+        ))
+
+    db.commit()
+    db.close()
+    engine.dispose()
+    return sizes
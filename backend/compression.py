@@ -0,0 +1,176 @@
+"""Response compression (Brotli or gzip) with size and content-type policy.
+
+Responses are compressed only when they are big enough to benefit and
+have a compressible content type; images and already-encoded bodies pass
+through untouched. For routes whose output rarely changes, such as
+/api/categories, compressed bodies are cached by content hash so repeated
+responses skip the compressor entirely. A compressed body is no longer
+byte-identical to what a strong ETag describes, so ETags are made weak.
+"""
+import asyncio
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+# Bodies larger than this are streamed through uncompressed rather than buffered
+MAX_BUFFER_SIZE = 8 * 1024 * 1024
+# Bodies larger than this are compressed off the event loop
+THREAD_THRESHOLD = 64 * 1024
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+# GET routes whose compressed output is cached by body hash
+CACHEABLE_PATHS = {"/api/categories"}
+CACHE_ENTRIES = 256
+
+
+def compress(body: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY if level is None else level)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL if level is None else level, mtime=0)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best encoding the client accepts, preferring Brotli"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class CompressedCache:
+    """Small LRU of compressed bodies keyed by (encoding, body digest)"""
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compress(self, body: bytes, encoding: str) -> bytes:
+        key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                return cached
+        compressed = compress(body, encoding)
+        with self._lock:
+            self._entries[key] = compressed
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compressed
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+        self.cache = CompressedCache()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", ()))
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        cacheable = scope["method"] == "GET" and scope["path"] in CACHEABLE_PATHS
+
+        start_message = None
+        chunks = []
+        size = 0
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, size, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                response_headers = {k.lower(): v for k, v in message.get("headers", ())}
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+                length = response_headers.get(b"content-length")
+                if (
+                    b"content-encoding" in response_headers
+                    or message["status"] < 200 or message["status"] in (204, 206, 304)
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or (length is not None and int(length) < self.min_size)
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                # e.g. http.response.pathsend from FileResponse: nothing to
+                # compress, but the held-back start has to go out first
+                if start_message is not None:
+                    passthrough = True
+                    await send(start_message)
+                    if chunks:
+                        await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if message.get("more_body", False):
+                if size > MAX_BUFFER_SIZE:
+                    # Too big to hold; flush what we have uncompressed
+                    passthrough = True
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+                return
+
+            body = b"".join(chunks)
+            response_headers = [
+                (k, v) for k, v in start_message.get("headers", ())
+                if k.lower() not in (b"content-length", b"vary")
+            ]
+            vary = [v for k, v in start_message.get("headers", ()) if k.lower() == b"vary"]
+            response_headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+            if len(body) >= self.min_size:
+                if cacheable:
+                    body = self.cache.get_or_compress(body, encoding)
+                elif len(body) >= THREAD_THRESHOLD:
+                    body = await asyncio.to_thread(compress, body, encoding)
+                else:
+                    body = compress(body, encoding)
+                response_headers.append((b"content-encoding", encoding.encode()))
+                response_headers = [
+                    (k, b"W/" + v if k.lower() == b"etag" and not v.startswith(b"W/") else v)
+                    for k, v in response_headers
+                ]
+            response_headers.append((b"content-length", str(len(body)).encode()))
+            await send({**start_message, "headers": response_headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
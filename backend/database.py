@@ -1,15 +1,59 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Table
+from sqlalchemy import create_engine, event, inspect, Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Table, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, Session
+from collections import defaultdict
 from datetime import datetime
+from fastapi import Request
+import hashlib
+import itertools
+import logging
+import os
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./campus_rentals.db"
+from shared_state import shared_state
+
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./campus_rentals.db")
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
+
+
+@event.listens_for(engine, "connect")
+def _configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets readers in other worker processes proceed during a write
+    if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Read-only endpoints can be served from replicas, e.g.
+# REPLICA_URLS=sqlite:///./replica.db or postgresql://.../campus_rentals
+REPLICA_URLS = [url.strip() for url in os.getenv("REPLICA_URLS", "").split(",") if url.strip()]
+# After a client writes, its reads go to the primary for this long so it sees its own changes
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+
+def _create_replica_engine(url: str):
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_pre_ping=True)
+    replica = create_engine(url, connect_args={"check_same_thread": False})
+
+    @event.listens_for(replica, "connect")
+    def _read_only(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only=ON")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+    return replica
+
+
+replica_engines = [_create_replica_engine(url) for url in REPLICA_URLS]
+_replica_sessions = itertools.cycle([
+    sessionmaker(autocommit=False, autoflush=False, bind=replica) for replica in replica_engines
+] or [SessionLocal])
+
 Base = declarative_base()
 
 # Association table for item categories
@@ -30,6 +74,7 @@ class User(Base):
     full_name = Column(String, nullable=False)
     phone = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     verified = Column(Boolean, default=False)
     rating = Column(Float, default=0.0)
     total_ratings = Column(Integer, default=0)
@@ -38,6 +83,7 @@ class User(Base):
     address = Column(String)
     latitude = Column(Float)
     longitude = Column(Float)
+    is_admin = Column(Boolean, default=False)
 
     # Relationships
     items = relationship("Item", back_populates="owner", foreign_keys="Item.owner_id")
@@ -73,6 +119,7 @@ class Item(Base):
     condition = Column(String)  # Excellent, Good, Fair
     available = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     latitude = Column(Float)
     longitude = Column(Float)
     location_name = Column(String)
@@ -104,7 +151,7 @@ class Rental(Base):
     item_id = Column(Integer, ForeignKey("items.id"), nullable=False)
     renter_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    start_date = Column(DateTime, nullable=False)
+    start_date = Column(DateTime, nullable=False, index=True)
     end_date = Column(DateTime, nullable=False)
     total_cost = Column(Float, nullable=False)
     deposit_amount = Column(Float, nullable=False)
@@ -112,11 +159,13 @@ class Rental(Base):
     owner_earnings = Column(Float, nullable=False)
     status = Column(String, default="pending")  # pending, approved, active, completed, cancelled
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     approved_at = Column(DateTime)
     pickup_qr = Column(String)
     return_qr = Column(String)
     pickup_verified_at = Column(DateTime)
     return_verified_at = Column(DateTime)
+    overdue_at = Column(DateTime)  # set by the lifecycle sweeper when the return is late
     pickup_photos = Column(Text)  # JSON array
     return_photos = Column(Text)  # JSON array
 
@@ -127,6 +176,12 @@ class Rental(Base):
     messages = relationship("Message", back_populates="rental")
     reviews = relationship("Review", back_populates="rental")
 
+    # Range scans for the lifecycle sweeper (lifecycle.py)
+    __table_args__ = (
+        Index("ix_rentals_status_start_date", "status", "start_date"),
+        Index("ix_rentals_status_end_date", "status", "end_date"),
+    )
+
 
 class Message(Base):
     __tablename__ = "messages"
@@ -143,6 +198,13 @@ class Message(Base):
     sender = relationship("User", back_populates="messages_sent", foreign_keys=[sender_id])
     receiver = relationship("User", back_populates="messages_received", foreign_keys=[receiver_id])
 
+    __table_args__ = (
+        Index("ix_messages_sender_created_at", "sender_id", "created_at"),
+        Index("ix_messages_receiver_created_at", "receiver_id", "created_at"),
+        # Thread reads and the archiver's per-thread last-message check
+        Index("ix_messages_rental_created_at", "rental_id", "created_at"),
+    )
+
 
 class Review(Base):
     __tablename__ = "reviews"
@@ -173,13 +235,278 @@ class Transaction(Base):
     description = Column(String)
 
 
-def get_db():
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    payload = Column(Text)  # JSON object
+    status = Column(String, default="queued")  # queued, running, done, dead
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    run_at = Column(DateTime, default=datetime.utcnow)
+    locked_by = Column(String)
+    locked_at = Column(DateTime)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (Index("ix_jobs_status_run_at", "status", "run_at"),)
+
+
+class RentalRollup(Base):
+    """Rental totals per day or week and primary category, maintained by analytics.py"""
+    __tablename__ = "rental_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    period = Column(String, nullable=False)  # day, week
+    bucket_start = Column(DateTime, nullable=False)  # midnight, or Monday for weeks
+    category_id = Column(Integer, nullable=False, default=0)  # 0 for uncategorized items
+    rentals = Column(Integer, nullable=False, default=0)  # every request starting in the bucket
+    booked = Column(Integer, nullable=False, default=0)  # approved, active or completed
+    active = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    cancelled = Column(Integer, nullable=False, default=0)
+    gmv = Column(Float, nullable=False, default=0.0)  # total_cost of booked rentals
+    platform_fees = Column(Float, nullable=False, default=0.0)
+    owner_earnings = Column(Float, nullable=False, default=0.0)
+
+    __table_args__ = (Index("ix_rental_rollups_bucket", "period", "bucket_start", "category_id", unique=True),)
+
+
+class RollupWatermark(Base):
+    """Rental.updated_at up to which a rollup has been refreshed"""
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(String, primary_key=True)
+    watermark = Column(DateTime, nullable=False)
+    refreshed_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Refresh lease, so only one worker refreshes at a time
+    locked_by = Column(String)
+    locked_until = Column(DateTime)
+
+
+class RevokedToken(Base):
+    """Denylisted JWT ids; rows can go once the token would have expired"""
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String, primary_key=True)
+    token_type = Column(String, nullable=False)  # access, refresh
+    subject = Column(String)  # the token's `sub` (user email)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Notification(Base):
+    """Something a user should hear about; delivered in digests by notifications.py"""
+    __tablename__ = "notifications"
+
+    id = Column(Integer, primary_key=True, index=True)
+    recipient_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String, nullable=False)  # rental_requested, message_received
+    rental_id = Column(Integer, ForeignKey("rentals.id"))
+    payload = Column(Text)  # JSON object rendered into the digest
+    created_at = Column(DateTime, default=datetime.utcnow)
+    delivered_at = Column(DateTime)
+
+    __table_args__ = (Index("ix_notifications_recipient_delivered", "recipient_id", "delivered_at"),)
+
+
+class Event(Base):
+    """Append-only domain event; written in batches by events.EventLog"""
+    __tablename__ = "events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    uid = Column(String, unique=True, nullable=False)  # dedupes WAL replays
+    name = Column(String, nullable=False)  # e.g. rental.approved
+    aggregate = Column(String, nullable=False)  # rental, item, user
+    aggregate_id = Column(Integer, nullable=False)
+    actor_id = Column(Integer)
+    payload = Column(Text)  # JSON object
+    created_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (Index("ix_events_aggregate", "aggregate", "aggregate_id"),)
+
+
+class EventOffset(Base):
+    """How far a named event consumer has read"""
+    __tablename__ = "event_offsets"
+
+    consumer = Column(String, primary_key=True)
+    last_event_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+def _client_key(request: Request) -> str:
+    # The token's subject identifies who wrote, across access-token refreshes;
+    # anonymous clients and invalid tokens fall back to their address.
+    from auth import verified_subject  # auth imports this module
+    authorization = request.headers.get("authorization", "")
+    subject = verified_subject(authorization[7:]) if authorization[:7].lower() == "bearer " else None
+    credential = f"user:{subject}" if subject else f"ip:{request.client.host if request.client else ''}"
+    return "ryw:" + hashlib.blake2b(credential.encode(), digest_size=12).hexdigest()
+
+
+def get_db(request: Request):
+    """Read-write session on the primary database"""
     db = SessionLocal()
+    if replica_engines:
+        # Lets the commit hook pin this client's reads to the primary
+        db.info["client_key"] = _client_key(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request):
+    """Session for read-only endpoints: a replica, or the primary when the
+    client wrote within READ_YOUR_WRITES_SECONDS or no replicas are configured"""
+    if replica_engines and not shared_state.get(_client_key(request)):
+        db = next(_replica_sessions)()
+        db.info["read_only"] = True
+    else:
+        db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
 
+# Bump whenever tables, columns or indexes change so init_db re-applies the schema
+SCHEMA_VERSION = 8
+
+# Columns added after the first release: table -> [(column, type, backfill expression or None)]
+ADDED_COLUMNS = {
+    "users": [("updated_at", "DATETIME", "created_at"), ("is_admin", "BOOLEAN", "0")],
+    "items": [("updated_at", "DATETIME", "created_at")],
+    "rentals": [("updated_at", "DATETIME", "created_at"), ("overdue_at", "DATETIME", None)],
+    "rollup_watermarks": [("locked_by", "VARCHAR", None), ("locked_until", "DATETIME", None)],
+}
+
+
+def _add_missing_columns(connection):
+    """Bring databases created by older versions up to the current columns"""
+    existing_tables = set(inspect(connection).get_table_names())
+    for table, columns in ADDED_COLUMNS.items():
+        if table not in existing_tables:
+            continue
+        present = {column["name"] for column in inspect(connection).get_columns(table)}
+        for name, type_, backfill in columns:
+            if name in present:
+                continue
+            connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} {type_}")
+            if backfill is not None:
+                connection.exec_driver_sql(
+                    f"UPDATE {table} SET {name} = COALESCE({backfill}, CURRENT_TIMESTAMP)"
+                )
+
+
+def _create_missing_indexes(connection):
+    # create_all only builds indexes for tables it creates
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    """Create tables and apply column additions, unless the schema is already current.
+
+    SQLite databases record SCHEMA_VERSION in `PRAGMA user_version` once
+    migrated, so later start-ups skip reflection and create_all entirely.
+    """
+    is_sqlite = engine.dialect.name == "sqlite"
+    with engine.begin() as connection:
+        if is_sqlite and connection.exec_driver_sql("PRAGMA user_version").scalar() == SCHEMA_VERSION:
+            return
+        _add_missing_columns(connection)
+        Base.metadata.create_all(bind=connection)
+        _create_missing_indexes(connection)
+        # Uncategorized rollups used to be stored as NULL, which the unique index can't dedupe
+        if connection.exec_driver_sql("SELECT 1 FROM rental_rollups WHERE category_id IS NULL LIMIT 1").first():
+            connection.exec_driver_sql("DELETE FROM rollup_watermarks WHERE name = 'rental_rollups'")
+        if is_sqlite:
+            connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+# Commit hooks for in-process caches and indexes
+_commit_listeners = defaultdict(list)
+
+
+def on_commit(model, callback):
+    """Call callback(changes) after any commit that wrote rows of `model`.
+
+    `changes` is a list of (operation, snapshot) pairs where operation is
+    "insert", "update" or "delete" and snapshot holds the column values that
+    were loaded at flush time, plus `<relationship>_ids` for loaded
+    collections. Callbacks run after the data is durable, so a rollback
+    never reaches them.
+    """
+    _commit_listeners[model].append(callback)
+
+
+def _snapshot(obj):
+    state = inspect(obj)
+    snapshot = {
+        attr.key: state.dict[attr.key]
+        for attr in state.mapper.column_attrs if attr.key in state.dict
+    }
+    for rel in state.mapper.relationships:
+        if rel.uselist and rel.key in state.dict:
+            snapshot[f"{rel.key}_ids"] = [inspect(o).identity[0] for o in state.dict[rel.key]]
+    return snapshot
+
+
+def record_bulk_changes(session, model, operation, snapshots):
+    """Queue rows written by a Core statement for `model`'s commit hooks.
+
+    Bulk UPDATE/INSERT statements bypass the flush, so without this the
+    caches kept current by on_commit never hear about them. The snapshots
+    are dispatched with the session's next commit and dropped on rollback.
+    """
+    if model in _commit_listeners:
+        session.info.setdefault("committed_changes", []).extend(
+            (model, operation, snapshot) for snapshot in snapshots
+        )
+
+
+@event.listens_for(Session, "before_flush")
+def _reject_replica_writes(session, flush_context, instances):
+    if session.info.get("read_only"):
+        raise RuntimeError("Attempted to write through a read-only (replica) session")
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    session.info["flushed"] = True
+    if not _commit_listeners:
+        return
+    pending = session.info.setdefault("committed_changes", [])
+    for operation, objects in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            if type(obj) in _commit_listeners and (operation != "update" or session.is_modified(obj)):
+                pending.append((type(obj), operation, _snapshot(obj)))
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_changes(session):
+    if session.info.pop("flushed", False) and "client_key" in session.info:
+        shared_state.set(session.info["client_key"], "1", ttl=READ_YOUR_WRITES_SECONDS)
+    pending = session.info.pop("committed_changes", None)
+    if not pending:
+        return
+    by_model = defaultdict(list)
+    for model, operation, snapshot in pending:
+        by_model[model].append((operation, snapshot))
+    for model, changes in by_model.items():
+        for callback in _commit_listeners[model]:
+            try:
+                callback(changes)
+            except Exception:
+                logging.getLogger(__name__).exception("Commit listener %r failed", callback)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("flushed", None)
+    session.info.pop("committed_changes", None)
@@ -0,0 +1,352 @@
+"""Append-only domain event log with batched writes.
+
+Handlers record what happened after their own commit:
+
+    db.commit()
+    event_log.record("rental.approved", "rental", rental.id, actor_id=current_user.id)
+
+`record` never touches the database. The event is appended to a small
+per-process WAL file and buffered in memory; a background task writes the
+buffer as one multi-row INSERT every EVENT_FLUSH_SECONDS, or sooner once
+EVENT_FLUSH_SIZE events are waiting. The WAL segment is deleted once its
+batch has committed, and segments left behind by a crashed process are
+replayed on the next start-up (events already stored are skipped by uid).
+
+If the database rejects a batch outright (a constraint or a malformed
+event rather than a lock or lost connection), the batch is written one
+event at a time and the events that still fail are appended to
+EVENT_DEAD_LETTER_FILE in the WAL directory, so one bad row can't hold up
+the log. Transient errors keep the whole batch buffered for the next flush.
+
+Downstream projections read the log in id order through EventConsumer,
+which keeps its position in `event_offsets` in the same transaction as the
+projection's own writes.
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+
+from database import Event, EventOffset, SessionLocal
+from instrumentation import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single process assumed
+    fcntl = None
+
+logger = logging.getLogger("campus_rentals.events")
+
+EVENT_FLUSH_SECONDS = float(os.getenv("EVENT_FLUSH_SECONDS", "1.0"))
+EVENT_FLUSH_SIZE = int(os.getenv("EVENT_FLUSH_SIZE", "500"))
+EVENT_WAL_DIR = os.getenv("EVENT_WAL_DIR", "event_wal")
+# fsync every record; off by default, which still survives a process crash
+EVENT_WAL_FSYNC = os.getenv("EVENT_WAL_FSYNC", "0") == "1"
+# Events the database refused, one JSON object per line; not replayed
+EVENT_DEAD_LETTER_FILE = "dead-letter.jsonl"
+# Rows per INSERT statement, well under SQLite's bound-parameter limit
+INSERT_CHUNK = 500
+
+metrics.describe("events_recorded_total", "counter", "Domain events recorded by name")
+metrics.describe("event_flush_duration_seconds", "histogram", "Time spent writing one batch of events")
+metrics.describe("event_buffer_size", "gauge", "Events waiting to be written")
+metrics.describe("events_dead_lettered_total", "counter", "Events the database rejected")
+
+
+def _lock(file) -> bool:
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _transient(exc: Exception) -> bool:
+    """Errors worth retrying the same batch for: locks, timeouts, lost connections"""
+    return isinstance(exc, (OperationalError, InterfaceError))
+
+
+def _row(event: dict) -> dict:
+    return {
+        "uid": event["uid"],
+        "name": event["name"],
+        "aggregate": event["aggregate"],
+        "aggregate_id": event["aggregate_id"],
+        "actor_id": event["actor_id"],
+        "payload": json.dumps(event["payload"], default=str),
+        "created_at": datetime.fromisoformat(event["created_at"]),
+    }
+
+
+def write_events(db: Session, events: Sequence[dict], skip_existing: bool = False) -> int:
+    """Insert recorded events with multi-row INSERTs; the caller commits"""
+    if skip_existing:
+        stored = set()
+        uids = [event["uid"] for event in events]
+        for start in range(0, len(uids), INSERT_CHUNK):
+            stored.update(db.scalars(select(Event.uid).where(Event.uid.in_(uids[start:start + INSERT_CHUNK]))))
+        events = [event for event in events if event["uid"] not in stored]
+    rows = [_row(event) for event in events]
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.execute(insert(Event).values(rows[start:start + INSERT_CHUNK]))
+    return len(rows)
+
+
+class EventLog:
+    def __init__(self, session_factory=SessionLocal, wal_dir: str = EVENT_WAL_DIR,
+                 flush_size: int = EVENT_FLUSH_SIZE, flush_seconds: float = EVENT_FLUSH_SECONDS):
+        self.session_factory = session_factory
+        self.wal_dir = wal_dir
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()  # buffer and active WAL segment
+        self._flush_lock = threading.Lock()  # one batch in flight
+        self._buffer: List[dict] = []
+        self._wal = None
+        # Segments whose events are waiting to be written; kept open (and locked) until then
+        self._sealed = []
+        # A failed flush may have written part of its batch one event at a time
+        self._retrying = False
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def record(self, name: str, aggregate: str, aggregate_id: int,
+               actor_id: Optional[int] = None, **payload) -> str:
+        """Append an event to the log; returns its uid"""
+        event = {
+            "uid": uuid.uuid4().hex,
+            "name": name,
+            "aggregate": aggregate,
+            "aggregate_id": aggregate_id,
+            "actor_id": actor_id,
+            "payload": payload,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        line = json.dumps(event, default=str) + "\n"
+        with self._lock:
+            wal = self._active_wal()
+            wal.write(line)
+            wal.flush()
+            if EVENT_WAL_FSYNC:
+                os.fsync(wal.fileno())
+            self._buffer.append(event)
+            buffered = len(self._buffer)
+        metrics.inc("events_recorded_total", name=name)
+        metrics.set("event_buffer_size", buffered)
+        if buffered >= self.flush_size and self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return event["uid"]
+
+    def _active_wal(self):
+        if self._wal is None:
+            os.makedirs(self.wal_dir, exist_ok=True)
+            path = os.path.join(self.wal_dir, f"events-{os.getpid()}-{uuid.uuid4().hex[:8]}.wal")
+            self._wal = open(path, "a", encoding="utf-8")
+            _lock(self._wal)
+        return self._wal
+
+    def flush(self) -> int:
+        """Write buffered events in one transaction; returns how many were written"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._buffer:
+                    return 0
+                events, self._buffer = self._buffer, []
+                # New records go to a fresh segment while this batch is written
+                if self._wal is not None:
+                    self._sealed.append(self._wal)
+                    self._wal = None
+            started = datetime.utcnow()
+            try:
+                written = self._store(events, skip_existing=self._retrying)
+            except Exception:
+                with self._lock:
+                    # Retry with the next flush; the sealed segments still hold them
+                    self._buffer[:0] = events
+                self._retrying = True
+                raise
+            finally:
+                metrics.observe("event_flush_duration_seconds", (datetime.utcnow() - started).total_seconds())
+            self._retrying = False
+            for wal in self._sealed:
+                os.remove(wal.name)
+                wal.close()
+            self._sealed = []
+            metrics.set("event_buffer_size", len(self._buffer))
+            return written
+
+    def _store(self, events: List[dict], skip_existing: bool = False) -> int:
+        """Commit `events`, dead-lettering any the database rejects; returns how many were written.
+
+        Transient errors are raised for the caller to retry the whole batch.
+        """
+        db = self.session_factory()
+        try:
+            try:
+                written = write_events(db, events, skip_existing)
+                db.commit()
+                return written
+            except Exception as exc:
+                db.rollback()
+                if _transient(exc):
+                    raise
+                logger.warning("Event batch of %d rejected (%r); writing one at a time", len(events), exc)
+            written = 0
+            rejected = []
+            for event in events:
+                try:
+                    written += write_events(db, [event], skip_existing)
+                    db.commit()
+                except Exception as exc:
+                    db.rollback()
+                    if _transient(exc):
+                        raise
+                    rejected.append({**event, "error": repr(exc)})
+            self._dead_letter(rejected)
+            return written
+        finally:
+            db.close()
+
+    def _dead_letter(self, rejected: List[dict]):
+        if not rejected:
+            return
+        os.makedirs(self.wal_dir, exist_ok=True)
+        path = os.path.join(self.wal_dir, EVENT_DEAD_LETTER_FILE)
+        with open(path, "a", encoding="utf-8") as dead_letters:
+            for event in rejected:
+                dead_letters.write(json.dumps(event, default=str) + "\n")
+        logger.error("Moved %d rejected events to %s", len(rejected), path)
+        metrics.inc("events_dead_lettered_total", len(rejected))
+
+    def recover(self) -> int:
+        """Replay WAL segments left behind by processes that stopped before flushing"""
+        recovered = 0
+        for path in sorted(glob.glob(os.path.join(self.wal_dir, "*.wal"))):
+            try:
+                wal = open(path, "r+", encoding="utf-8")
+            except FileNotFoundError:
+                continue  # flushed and removed meanwhile
+            with wal:
+                if not _lock(wal):
+                    continue  # a live worker's segment
+                if not os.path.exists(path):
+                    continue  # flushed and removed while we waited
+                events = []
+                for line in wal:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        # Torn final line from a crash mid-write
+                        logger.warning("Skipping unreadable event in %s", path)
+                recovered += self._store(events, skip_existing=True)
+                os.remove(path)
+        if recovered:
+            logger.info("Recovered %d events from %s", recovered, self.wal_dir)
+        return recovered
+
+    async def _flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.exception("Event flush failed")
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self.recover)
+        self._task = asyncio.create_task(self._flusher())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await asyncio.to_thread(self.flush)
+        except Exception:
+            # Left in the WAL for the next start-up to recover
+            logger.exception("Final event flush failed")
+        with self._lock:
+            if self._wal is not None and not self._buffer:
+                os.remove(self._wal.name)
+                self._wal.close()
+                self._wal = None
+
+
+def read_events(db: Session, after_id: int = 0, limit: int = 500, names: Optional[Sequence[str]] = None,
+                aggregate: Optional[str] = None, aggregate_id: Optional[int] = None) -> List[Event]:
+    """Stored events with id > after_id, oldest first"""
+    query = select(Event).where(Event.id > after_id)
+    if names:
+        query = query.where(Event.name.in_(names))
+    if aggregate is not None:
+        query = query.where(Event.aggregate == aggregate)
+    if aggregate_id is not None:
+        query = query.where(Event.aggregate_id == aggregate_id)
+    return list(db.scalars(query.order_by(Event.id).limit(limit)))
+
+
+class EventConsumer:
+    """Named reader that feeds the log to `handler(db, events)` in order.
+
+    The handler must not commit: its writes and the consumer's new offset
+    commit together, so each event is applied exactly once.
+    """
+
+    def __init__(self, name: str, handler: Callable[[Session, List[Event]], None],
+                 names: Optional[Sequence[str]] = None, batch_size: int = 500):
+        self.name = name
+        self.handler = handler
+        self.names = names
+        self.batch_size = batch_size
+
+    def _offset(self, db: Session) -> EventOffset:
+        offset = db.get(EventOffset, self.name)
+        if offset is None:
+            offset = EventOffset(consumer=self.name, last_event_id=0)
+            db.add(offset)
+        return offset
+
+    def consume(self, db: Session) -> int:
+        """Apply the next batch of events; returns how many were handled"""
+        offset = self._offset(db)
+        events = read_events(db, offset.last_event_id, self.batch_size, self.names)
+        if events:
+            self.handler(db, events)
+            offset.last_event_id = events[-1].id
+        db.commit()
+        return len(events)
+
+    def consume_all(self, db: Session) -> int:
+        total = 0
+        while True:
+            handled = self.consume(db)
+            total += handled
+            if handled < self.batch_size:
+                return total
+
+    def replay(self, db: Session) -> int:
+        """Rewind to the start of the log and re-apply everything, e.g. to rebuild a projection"""
+        self._offset(db).last_event_id = 0
+        return self.consume_all(db)
+
+
+event_log = EventLog()
@@ -0,0 +1,158 @@
+"""Facet counts for the marketplace filters (`/api/items/facets`).
+
+For the current search, how many available items fall in each category,
+each price bucket and each condition. All facets come back from one SQL
+statement (per chunk of candidate ids, for radius searches): a UNION ALL of grouped counts, one branch per facet. Each
+branch leaves out its own facet's filter, so the category chips show what
+picking another category would return rather than zeros.
+
+The unfiltered counts are what the marketplace shows on first load, so
+they are cached until an item is written.
+"""
+import threading
+from typing import Dict, List, Optional
+
+from sqlalchemy import String, case, cast, func, literal, null, select, union_all
+from sqlalchemy.orm import Session
+
+from database import Category, Item, item_categories, on_commit
+from geo import items_channel
+from shared_state import Subscription
+
+# Candidate ids per statement; every branch binds them, so 4 x this stays
+# under SQLite's default limit of 999 bound parameters
+ID_CHUNK_SIZE = 200
+
+# (label, min inclusive, max exclusive) by daily rate
+PRICE_BUCKETS = [("0-10", 0, 10), ("10-25", 10, 25), ("25-50", 25, 50), ("50+", 50, None)]
+
+
+def item_filters(category_id: Optional[int] = None, search: Optional[str] = None,
+                 min_price: Optional[float] = None, max_price: Optional[float] = None) -> Dict[str, list]:
+    """Marketplace filter conditions on Item, grouped by the facet they belong to"""
+    filters = {"base": [Item.available == True], "category": [], "price": []}
+    if category_id:
+        filters["category"].append(
+            Item.id.in_(select(item_categories.c.item_id).where(item_categories.c.category_id == category_id))
+        )
+    if search:
+        filters["base"].append(Item.title.ilike(f"%{search}%") | Item.description.ilike(f"%{search}%"))
+    if min_price:
+        filters["price"].append(Item.daily_rate >= min_price)
+    if max_price:
+        filters["price"].append(Item.daily_rate <= max_price)
+    return filters
+
+
+def _price_bucket():
+    whens = []
+    for label, low, high in PRICE_BUCKETS:
+        condition = Item.daily_rate >= low
+        if high is not None:
+            condition = condition & (Item.daily_rate < high)
+        whens.append((condition, label))
+    return case(*whens, else_=null())
+
+
+def _facet_statement(filters: Dict[str, list], item_ids: Optional[List[int]] = None):
+    base = list(filters["base"])
+    if item_ids is not None:
+        base.append(Item.id.in_(item_ids))
+    everything = base + filters["category"] + filters["price"]
+
+    bucket = _price_bucket()
+    return union_all(
+        select(literal("total"), null(), null(), func.count())
+        .select_from(Item).where(*everything),
+        select(literal("category"), cast(Category.id, String), Category.name, func.count())
+        .select_from(Item)
+        .join(item_categories, item_categories.c.item_id == Item.id)
+        .join(Category, Category.id == item_categories.c.category_id)
+        .where(*base, *filters["price"])
+        .group_by(Category.id, Category.name),
+        select(literal("price"), bucket, null(), func.count())
+        .select_from(Item).where(*base, *filters["category"])
+        .group_by(bucket),
+        select(literal("condition"), Item.condition, null(), func.count())
+        .select_from(Item).where(*everything)
+        .group_by(Item.condition),
+    )
+
+
+def facet_counts(db: Session, filters: Dict[str, list], item_ids: Optional[List[int]] = None) -> dict:
+    """Counts per category, price bucket and condition, all facets in one query.
+
+    `item_ids` restricts the counts to a precomputed candidate set, e.g. the
+    items within a search radius. Large sets are counted ID_CHUNK_SIZE ids
+    per statement and summed, since each item lands in one chunk.
+    """
+    if item_ids is None:
+        statements = [_facet_statement(filters)]
+    else:
+        statements = [
+            _facet_statement(filters, item_ids[start:start + ID_CHUNK_SIZE])
+            for start in range(0, len(item_ids), ID_CHUNK_SIZE)
+        ] or [_facet_statement(filters, [])]
+
+    total = 0
+    # (facet, key) -> [label, count]
+    counts: Dict[tuple, list] = {}
+    for statement in statements:
+        for facet, key, label, count in db.execute(statement):
+            if facet == "total":
+                total += count
+            else:
+                counts.setdefault((facet, key), [label, 0])[1] += count
+
+    result = {"total": total, "categories": [], "price": [], "condition": []}
+    price_counts = {}
+    for (facet, key), (label, count) in counts.items():
+        if facet == "category":
+            result["categories"].append({"id": int(key), "name": label, "count": count})
+        elif facet == "price":
+            price_counts[key] = count
+        elif key is not None:
+            result["condition"].append({"value": key, "count": count})
+
+    result["categories"].sort(key=lambda entry: (-entry["count"], entry["id"]))
+    result["condition"].sort(key=lambda entry: (-entry["count"], entry["value"]))
+    result["price"] = [
+        {"bucket": label, "min": low, "max": high, "count": price_counts.get(label, 0)}
+        for label, low, high in PRICE_BUCKETS
+    ]
+    return result
+
+
+class FacetCache:
+    """Unfiltered facet counts, kept until an item is written"""
+
+    def __init__(self, changes: Optional[Subscription] = None):
+        self.changes = changes
+        self._lock = threading.Lock()
+        self._value = None
+        self._generation = 0
+
+    def get(self, db: Session) -> dict:
+        with self._lock:
+            if self.changes is not None and self.changes.changed():
+                # Another worker wrote items
+                self._value = None
+                self._generation += 1
+            if self._value is not None:
+                return self._value
+            generation = self._generation
+        value = facet_counts(db, item_filters())
+        with self._lock:
+            # Don't keep counts computed while an invalidation came in
+            if generation == self._generation:
+                self._value = value
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._generation += 1
+
+
+unfiltered_facets = FacetCache(changes=items_channel.subscribe())
+on_commit(Item, lambda changes: unfiltered_facets.invalidate())
@@ -0,0 +1,304 @@
+"""Distance helpers for location-based item search"""
+import heapq
+import threading
+from math import radians, degrees, cos, sin, asin, sqrt, floor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from database import Item, item_categories, on_commit
+from shared_state import Channel, Subscription
+
+EARTH_RADIUS_MILES = 3956
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """Calculate distance between two points in miles using Haversine formula"""
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+    miles = EARTH_RADIUS_MILES * c
+    return miles
+
+
+def haversine_miles(latitude: float, longitude: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Distances in miles from one point to arrays of points given in radians"""
+    lat1 = radians(latitude)
+    dlat = lats - lat1
+    dlon = lons - radians(longitude)
+    a = np.sin(dlat / 2) ** 2 + cos(lat1) * np.cos(lats) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+def bounding_box(latitude: float, longitude: float,
+                 miles: float) -> Tuple[float, float, List[Tuple[float, float]]]:
+    """(min_lat, max_lat, longitude ranges) enclosing a radius, for SQL pre-filtering.
+
+    A box that crosses the antimeridian gets two longitude ranges, one either
+    side; one that reaches a pole gets none, since every longitude qualifies.
+    """
+    angle = miles / EARTH_RADIUS_MILES
+    min_lat = latitude - degrees(angle)
+    max_lat = latitude + degrees(angle)
+    if min_lat <= -90 or max_lat >= 90 or angle >= asin(1):
+        return max(min_lat, -90.0), min(max_lat, 90.0), []
+    # Widest longitude offset of the circle, reached north or south of the centre
+    dlon = degrees(asin(sin(angle) / cos(radians(latitude))))
+    min_lon, max_lon = longitude - dlon, longitude + dlon
+    if min_lon < -180:
+        return min_lat, max_lat, [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return min_lat, max_lat, [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return min_lat, max_lat, [(min_lon, max_lon)]
+
+
+def within_box(latitude: float, longitude: float, miles: float) -> list:
+    """SQL conditions on Item keeping the bounding box of a radius"""
+    min_lat, max_lat, longitude_ranges = bounding_box(latitude, longitude, miles)
+    conditions = [Item.latitude.between(min_lat, max_lat)]
+    if longitude_ranges:
+        conditions.append(or_(*(Item.longitude.between(low, high) for low, high in longitude_ranges)))
+    return conditions
+
+
+class CoordinateCache:
+    """Item coordinates in radians, stored as columns sorted by item id.
+
+    Rows are added the first time an item is seen, so a search only pays
+    for the radians conversion once per item over the life of the process.
+    Items without coordinates are stored as NaN and never match a radius.
+    """
+
+    def __init__(self, changes: Optional[Subscription] = None):
+        self._lock = threading.Lock()
+        self.changes = changes
+        self._clear()
+
+    def _clear(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.lats = np.empty(0, dtype=np.float64)
+        self.lons = np.empty(0, dtype=np.float64)
+
+    def _positions(self, ids: np.ndarray) -> np.ndarray:
+        positions = np.searchsorted(self.ids, ids)
+        positions[positions >= len(self.ids)] = 0
+        return positions
+
+    def coordinates(self, items: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+        """Radian (lat, lon) arrays aligned with `items`"""
+        ids = np.fromiter((item.id for item in items), dtype=np.int64, count=len(items))
+        with self._lock:
+            if self.changes is not None and self.changes.changed():
+                # Another worker changed items; coordinates may have moved
+                self._clear()
+            positions = self._positions(ids)
+            missing = (
+                np.ones(len(ids), dtype=bool) if not len(self.ids)
+                else self.ids[positions] != ids
+            )
+            if missing.any():
+                new = [items[i] for i in np.flatnonzero(missing)]
+                self._add(
+                    [item.id for item in new],
+                    [np.nan if item.latitude is None else item.latitude for item in new],
+                    [np.nan if item.longitude is None else item.longitude for item in new],
+                )
+                positions = self._positions(ids)
+            return self.lats[positions], self.lons[positions]
+
+    def _add(self, ids, lats, lons):
+        ids = np.asarray(ids, dtype=np.int64)
+        keep = ~np.isin(self.ids, ids)
+        merged_ids = np.concatenate([self.ids[keep], ids])
+        order = np.argsort(merged_ids, kind="stable")
+        self.ids = merged_ids[order]
+        self.lats = np.concatenate([self.lats[keep], np.radians(np.asarray(lats, dtype=np.float64))])[order]
+        self.lons = np.concatenate([self.lons[keep], np.radians(np.asarray(lons, dtype=np.float64))])[order]
+
+    def invalidate(self, item_ids: Sequence[int]):
+        with self._lock:
+            keep = ~np.isin(self.ids, np.asarray(item_ids, dtype=np.int64))
+            self.ids, self.lats, self.lons = self.ids[keep], self.lats[keep], self.lons[keep]
+
+    def distances(self, items: Sequence, latitude: float, longitude: float) -> np.ndarray:
+        """Distances in miles from a point to each of `items`, in order"""
+        if not items:
+            return np.empty(0, dtype=np.float64)
+        lats, lons = self.coordinates(items)
+        return haversine_miles(latitude, longitude, lats, lons)
+
+
+class SpatialIndex:
+    """Grid-bucketed index of available items for k-nearest-neighbour queries.
+
+    Items are hashed into fixed-size lat/lon cells (like geohash buckets).
+    A query orders the occupied cells by a lower bound on the distance to
+    anything inside them (centre distance minus the cell's radius) and
+    visits them in that order until the k-th best distance is closer than
+    the next cell's bound. Empty map between the query and the data costs
+    nothing, so the work follows the number of occupied cells, not how far
+    away the query point is. The index is built from the database on first
+    use and then kept current by commit hooks as items are created, updated
+    or made unavailable.
+    """
+
+    def __init__(self, cell_degrees: float = 0.01, changes: Optional[Subscription] = None):
+        self.cell_degrees = cell_degrees
+        self.changes = changes
+        self._lock = threading.RLock()
+        self._loaded = False
+        # item_id -> (lat, lon, cell, category ids)
+        self._entries: Dict[int, Tuple[float, float, Tuple[int, int], frozenset]] = {}
+        self._cells: Dict[Tuple[int, int], set] = {}
+        # Occupied cells as arrays for ordering by distance; rebuilt when cells come or go
+        self._cell_arrays = None
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return floor(latitude / self.cell_degrees), floor(longitude / self.cell_degrees)
+
+    def ensure_loaded(self, db: Session):
+        if self.changes is not None and self.changes.changed():
+            self.invalidate()
+        if self._loaded:
+            return
+        rows = db.query(Item.id, Item.latitude, Item.longitude).filter(
+            Item.available == True,
+            Item.latitude.isnot(None),
+            Item.longitude.isnot(None)
+        ).all()
+        categories: Dict[int, set] = {}
+        for item_id, category_id in db.query(item_categories.c.item_id, item_categories.c.category_id):
+            categories.setdefault(item_id, set()).add(category_id)
+        with self._lock:
+            self._entries.clear()
+            self._cells.clear()
+            self._cell_arrays = None
+            for item_id, latitude, longitude in rows:
+                self._add(item_id, latitude, longitude, categories.get(item_id, ()))
+            self._loaded = True
+
+    def invalidate(self):
+        """Force a full rebuild on the next query"""
+        with self._lock:
+            self._loaded = False
+
+    def _add(self, item_id, latitude, longitude, category_ids):
+        self._remove(item_id)
+        cell = self._cell(latitude, longitude)
+        self._entries[item_id] = (latitude, longitude, cell, frozenset(category_ids))
+        if cell not in self._cells:
+            self._cells[cell] = set()
+            self._cell_arrays = None
+        self._cells[cell].add(item_id)
+
+    def _remove(self, item_id):
+        entry = self._entries.pop(item_id, None)
+        if entry is not None:
+            bucket = self._cells[entry[2]]
+            bucket.discard(item_id)
+            if not bucket:
+                del self._cells[entry[2]]
+                self._cell_arrays = None
+
+    def apply_changes(self, changes):
+        """Commit hook: fold item inserts/updates/deletes into the index"""
+        with self._lock:
+            if not self._loaded:
+                return
+            for operation, row in changes:
+                item_id = row.get("id")
+                if operation == "delete" or row.get("available") is False:
+                    self._remove(item_id)
+                    continue
+                if row.get("latitude", 0) is None or row.get("longitude", 0) is None:
+                    self._remove(item_id)
+                    continue
+                entry = self._entries.get(item_id)
+                latitude = row.get("latitude", entry[0] if entry else None)
+                longitude = row.get("longitude", entry[1] if entry else None)
+                category_ids = row.get("categories_ids", entry[3] if entry else None)
+                if operation == "update" and entry is None and "available" not in row:
+                    # An unavailable item changed but stayed unavailable
+                    continue
+                if latitude is None or longitude is None or category_ids is None:
+                    # Not enough loaded state to place the item; rebuild lazily
+                    self._loaded = False
+                    return
+                self._add(item_id, latitude, longitude, category_ids)
+
+    def _occupied_cells(self):
+        """(cell keys, centre lats, centre lons in radians, radius in miles) of occupied cells"""
+        if self._cell_arrays is None:
+            cells = list(self._cells)
+            keys = np.array(cells, dtype=np.float64).reshape(-1, 2)
+            lats = np.radians((keys[:, 0] + 0.5) * self.cell_degrees)
+            lons = np.radians((keys[:, 1] + 0.5) * self.cell_degrees)
+            # Farthest point of a cell from its centre is a corner; check the
+            # corners on both edges and pad a little for the sphere's curvature
+            radius = np.zeros(len(cells))
+            for edge in (0, 1):
+                corner_lats = np.radians((keys[:, 0] + edge) * self.cell_degrees)
+                corner_lons = np.radians(keys[:, 1] * self.cell_degrees)
+                dlat = corner_lats - lats
+                dlon = corner_lons - lons
+                a = np.sin(dlat / 2) ** 2 + np.cos(lats) * np.cos(corner_lats) * np.sin(dlon / 2) ** 2
+                radius = np.maximum(radius, 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a)))
+            self._cell_arrays = (cells, lats, lons, radius * 1.01 + 1e-6)
+        return self._cell_arrays
+
+    def nearest(
+        self, latitude: float, longitude: float, k: int,
+        category_id: Optional[int] = None, max_distance: Optional[float] = None
+    ) -> List[Tuple[float, int]]:
+        """Up to k (distance_miles, item_id) pairs ordered by distance"""
+        with self._lock:
+            if not self._entries or k <= 0:
+                return []
+            cells, lats, lons, radius = self._occupied_cells()
+            # Nothing in a cell can be closer than this
+            bounds = haversine_miles(latitude, longitude, lats, lons) - radius
+            order = np.argsort(bounds, kind="stable")
+
+            best: List[Tuple[float, int]] = []  # max-heap of (-distance, item_id)
+            for index in order:
+                bound = bounds[index]
+                if len(best) == k and bound > -best[0][0]:
+                    break
+                if max_distance is not None and bound > max_distance:
+                    break
+                for item_id in self._cells[cells[index]]:
+                    item_lat, item_lon, _, categories = self._entries[item_id]
+                    if category_id is not None and category_id not in categories:
+                        continue
+                    distance = calculate_distance(latitude, longitude, item_lat, item_lon)
+                    if max_distance is not None and distance > max_distance:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, item_id))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, item_id))
+            return sorted((-negative, item_id) for negative, item_id in best)
+
+
+# Workers publish item writes so their peers drop stale copies
+items_channel = Channel("items")
+item_coordinates = CoordinateCache(changes=items_channel.subscribe())
+nearby_items = SpatialIndex(changes=items_channel.subscribe())
+
+
+def _sync_items(changes):
+    items_channel.publish()
+    moved = [
+        row["id"] for operation, row in changes
+        if operation != "insert" and ("latitude" in row or "longitude" in row)
+    ]
+    if moved:
+        item_coordinates.invalidate(moved)
+    nearby_items.apply_changes(changes)
+
+
+on_commit(Item, _sync_items)
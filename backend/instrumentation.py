@@ -0,0 +1,240 @@
+"""Per-request timing, SQL instrumentation and Prometheus-format metrics"""
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger("campus_rentals.profiler")
+
+# Requests slower than this get a sampled profile logged (0 disables profiling)
+PROFILE_THRESHOLD_MS = float(os.getenv("PROFILE_THRESHOLD_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class RequestStats:
+    __slots__ = ("sql_count", "sql_time")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "request_stats", default=None
+)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+class Metrics:
+    """Thread-safe counters, gauges and histograms rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._values: Dict[str, Dict[LabelKey, float]] = defaultdict(dict)
+        self._histograms: Dict[str, Dict[LabelKey, list]] = defaultdict(dict)
+        self._buckets: Dict[str, tuple] = {}
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+        self._help[name] = (kind, help_text)
+        if kind == "histogram":
+            self._buckets[name] = buckets
+
+    def inc(self, name: str, value: float = 1.0, /, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, /, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[name][key] = value
+
+    def observe(self, name: str, value: float, /, **labels):
+        key = tuple(sorted(labels.items()))
+        buckets = self._buckets.get(name, DEFAULT_BUCKETS)
+        with self._lock:
+            series = self._histograms[name].get(key)
+            if series is None:
+                # Per-bucket counts, then sum and count
+                series = self._histograms[name][key] = [0] * len(buckets) + [0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted(set(self._values) | set(self._histograms)):
+                kind, help_text = self._help.get(name, ("untyped", ""))
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in self._values.get(name, {}).items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+                buckets = self._buckets.get(name, DEFAULT_BUCKETS)
+                for key, series in self._histograms.get(name, {}).items():
+                    for bound, count in zip(buckets, series):
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', str(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {series[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {series[-2]}")
+                    lines.append(f"{name}_count{_format_labels(key)} {series[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in key
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+metrics = Metrics()
+metrics.describe("http_requests_total", "counter", "HTTP requests by route and status")
+metrics.describe("http_request_duration_seconds", "histogram", "HTTP request wall time")
+metrics.describe("http_request_sql_queries", "histogram", "SQL statements per request",
+                 buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 1000))
+metrics.describe("http_request_sql_seconds", "histogram", "SQL time per request")
+
+
+def instrument_engine(engine):
+    """Attribute every statement executed on `engine` to the current request"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_time += elapsed
+
+
+class SamplingProfiler:
+    """Samples one thread's stack at a fixed interval into a ring buffer.
+
+    Handlers run on the event loop thread, so the samples taken while a slow
+    request was in flight show where that time went. Concurrent requests
+    share the thread, so their frames can appear in each other's profiles.
+    """
+
+    def __init__(self, interval_ms: float, max_samples: int = 20000):
+        self.interval = interval_ms / 1000
+        self.samples = deque(maxlen=max_samples)
+        self.target_thread: Optional[int] = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def ensure_started(self, target_thread: int):
+        with self._lock:
+            if self._started:
+                return
+            self.target_thread = target_thread
+            self._started = True
+            threading.Thread(target=self._run, name="request-profiler", daemon=True).start()
+
+    def _run(self):
+        while True:
+            frame = sys._current_frames().get(self.target_thread)
+            if frame is not None:
+                stack = []
+                while frame is not None and len(stack) < 16:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                self.samples.append((time.perf_counter(), ";".join(reversed(stack))))
+            time.sleep(self.interval)
+
+    def report(self, started: float, finished: float, top: int = 10) -> str:
+        stacks = Counter(stack for ts, stack in list(self.samples) if started <= ts <= finished)
+        total = sum(stacks.values())
+        lines = [f"{total} samples"]
+        for stack, count in stacks.most_common(top):
+            lines.append(f"  {count:>5} ({count / total:.0%}) {stack}")
+        return "\n".join(lines)
+
+
+profiler = SamplingProfiler(PROFILE_INTERVAL_MS) if PROFILE_THRESHOLD_MS > 0 else None
+
+
+class InstrumentationMiddleware:
+    """Records wall time and SQL usage per request.
+
+    Adds a Server-Timing header and feeds the `/metrics` registry; with
+    PROFILE_THRESHOLD_MS set, logs a sampled profile of slow requests.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if profiler is not None:
+            profiler.ensure_started(threading.get_ident())
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((
+                    b"server-timing",
+                    (
+                        f'app;dur={elapsed_ms:.1f}, '
+                        f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.sql_count} queries"'
+                    ).encode(),
+                ))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            finished = time.perf_counter()
+            route = scope.get("route")
+            labels = {"method": scope["method"], "route": getattr(route, "path", "unmatched")}
+            elapsed = finished - started
+            metrics.inc("http_requests_total", status=str(status_code), **labels)
+            metrics.observe("http_request_duration_seconds", elapsed, **labels)
+            metrics.observe("http_request_sql_queries", stats.sql_count, **labels)
+            metrics.observe("http_request_sql_seconds", stats.sql_time, **labels)
+
+            if profiler is not None and elapsed * 1000 >= PROFILE_THRESHOLD_MS:
+                logger.warning(
+                    "Slow request %s %s took %.1fms (%d queries, %.1fms SQL)\n%s",
+                    scope["method"], scope["path"], elapsed * 1000,
+                    stats.sql_count, stats.sql_time * 1000,
+                    profiler.report(started, finished),
+                )
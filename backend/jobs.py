@@ -0,0 +1,223 @@
+"""Durable in-process job queue for work that should happen after a commit.
+
+Handlers enqueue jobs on the request's own session, so the job row commits
+atomically with the state change that caused it:
+
+    enqueue(db, "notifications.deliver", recipient_id=owner.id)
+    db.commit()
+
+Background worker tasks claim due jobs in batches, group them by name and
+hand each group to its handler in one session. When a batch fails its jobs
+are rerun one at a time, so a single bad payload doesn't take the rest of
+the batch down with it; jobs that still fail are retried with exponential
+backoff until `max_attempts` is reached.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from database import Job, SessionLocal, on_commit
+from instrumentation import metrics
+
+logger = logging.getLogger("campus_rentals.jobs")
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "50"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2.0"))
+# Running jobs older than this are assumed orphaned by a crashed worker
+JOB_LEASE_SECONDS = 300
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 600.0
+DONE_RETENTION = timedelta(days=7)
+
+metrics.describe("jobs_processed_total", "counter", "Background jobs finished by name and outcome")
+metrics.describe("job_batch_duration_seconds", "histogram", "Time spent running one batch of jobs")
+
+# name -> handler(db, payloads)
+_handlers: Dict[str, Callable] = {}
+
+
+def job_handler(name: str):
+    """Register `fn(db, payloads)` to process batches of jobs called `name`.
+
+    The handler runs in its own session and should not commit; the runner
+    commits its writes together with the jobs' completion.
+    """
+    def decorator(fn):
+        _handlers[name] = fn
+        return fn
+    return decorator
+
+
+def enqueue(db, name: str, delay: Optional[timedelta] = None, max_attempts: int = 5, **payload) -> Job:
+    """Add a job to `db`'s current transaction; it becomes runnable on commit"""
+    job = Job(
+        name=name,
+        payload=json.dumps(payload, default=str),
+        status="queued",
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + (delay or timedelta()),
+    )
+    db.add(job)
+    return job
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Exponential backoff with jitter"""
+    seconds = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return timedelta(seconds=seconds * random.uniform(0.5, 1.0))
+
+
+class JobRunner:
+    def __init__(self, session_factory=SessionLocal, workers: int = JOB_WORKERS,
+                 batch_size: int = JOB_BATCH_SIZE, poll_seconds: float = JOB_POLL_SECONDS):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def claim(self, db) -> List[Job]:
+        """Atomically take up to `batch_size` due jobs, safe across processes"""
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+
+        # Requeue jobs whose worker died mid-run
+        db.query(Job).filter(
+            Job.status == "running",
+            Job.locked_at < now - timedelta(seconds=JOB_LEASE_SECONDS)
+        ).update({"status": "queued", "locked_by": None}, synchronize_session=False)
+
+        due = db.query(Job.id).filter(
+            Job.status == "queued", Job.run_at <= now
+        ).order_by(Job.run_at).limit(self.batch_size).subquery()
+        db.query(Job).filter(Job.id.in_(due.select()), Job.status == "queued").update(
+            {"status": "running", "locked_by": token, "locked_at": now, "attempts": Job.attempts + 1},
+            synchronize_session=False
+        )
+        db.commit()
+        return db.query(Job).filter(Job.locked_by == token, Job.status == "running").order_by(Job.id).all()
+
+    def run_pending(self) -> int:
+        """Claim and run one batch of due jobs; returns how many were claimed"""
+        db = self.session_factory()
+        try:
+            jobs = self.claim(db)
+            groups: Dict[str, List[Job]] = {}
+            for job in jobs:
+                groups.setdefault(job.name, []).append(job)
+            for name, group in groups.items():
+                self._run_group(db, name, group)
+            return len(jobs)
+        finally:
+            db.close()
+
+    def _run_group(self, db, name: str, group: List[Job]):
+        handler = _handlers.get(name)
+        started = datetime.utcnow()
+        try:
+            if handler is None:
+                self._fail(db, name, group, LookupError(f"No handler registered for job '{name}'"))
+                return
+            error = self._run_batch(db, handler, name, group)
+            if error is None:
+                return
+            if len(group) == 1:
+                self._fail(db, name, group, error)
+                return
+            # Rerun one at a time so only the jobs that fail on their own are retried
+            logger.warning("Job batch '%s' failed (%d jobs); retrying them one by one", name, len(group))
+            for job in group:
+                error = self._run_batch(db, handler, name, [job])
+                if error is not None:
+                    self._fail(db, name, [job], error)
+        finally:
+            metrics.observe(
+                "job_batch_duration_seconds", (datetime.utcnow() - started).total_seconds(), name=name
+            )
+
+    @staticmethod
+    def _run_batch(db, handler: Callable, name: str, batch: List[Job]) -> Optional[Exception]:
+        """Run `batch` in one transaction; returns the error if it was rolled back"""
+        try:
+            handler(db, [json.loads(job.payload) if job.payload else {} for job in batch])
+            for job in batch:
+                job.status = "done"
+                job.finished_at = datetime.utcnow()
+                job.locked_by = None
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            return exc
+        metrics.inc("jobs_processed_total", len(batch), name=name, outcome="done")
+        return None
+
+    @staticmethod
+    def _fail(db, name: str, batch: List[Job], exc: Exception):
+        logger.error("Job '%s' failed (%d jobs)", name, len(batch), exc_info=exc)
+        for job in batch:
+            job.last_error = repr(exc)
+            job.locked_by = None
+            if job.attempts >= job.max_attempts:
+                job.status = "dead"
+                job.finished_at = datetime.utcnow()
+            else:
+                job.status = "queued"
+                job.run_at = datetime.utcnow() + retry_delay(job.attempts)
+        db.commit()
+        metrics.inc("jobs_processed_total", len(batch), name=name, outcome="failed")
+
+    def purge_finished(self):
+        db = self.session_factory()
+        try:
+            db.query(Job).filter(
+                Job.status == "done", Job.finished_at < datetime.utcnow() - DONE_RETENTION
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def wake(self, changes):
+        """Commit hook: start on newly committed jobs without waiting for the poll"""
+        if not any(operation == "insert" for operation, _ in changes):
+            return
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _worker(self):
+        while True:
+            try:
+                claimed = await asyncio.to_thread(self.run_pending)
+            except Exception:
+                logger.exception("Job worker iteration failed")
+                claimed = 0
+            if claimed:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self.purge_finished)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+job_runner = JobRunner()
+on_commit(Job, job_runner.wake)
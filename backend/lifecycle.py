@@ -0,0 +1,176 @@
+"""Periodic sweep that moves stale rentals along their lifecycle.
+
+Without it a rental only changes state when someone calls its PATCH
+endpoint, so abandoned requests stay `pending` forever and unreturned
+items stay `active`. Every RENTAL_SWEEP_SECONDS each worker:
+
+- cancels `pending` requests whose start date passed without approval,
+  and `approved` rentals whose end date passed without a pickup;
+- stamps `overdue_at` on `active` rentals not returned OVERDUE_GRACE_HOURS
+  after their end date;
+- completes `active` rentals still unreturned AUTO_COMPLETE_DAYS after
+  their end date, crediting the owner's earning as verify_return would.
+
+Each step is an index range scan on `(status, start_date)` or
+`(status, end_date)` limited to RENTAL_SWEEP_BATCH rows, followed by a
+conditional UPDATE of just those rows in its own short transaction, so a
+sweep never holds the write lock for more than one batch. The UPDATEs
+re-check the status, which keeps concurrent sweeps in other workers (or
+a user acting at the same moment) from applying a change twice.
+
+The UPDATEs are Core statements, so each batch reports the rows it
+changed through `record_bulk_changes`; Rental commit hooks (such as the
+availability bitmaps) then see sweeper changes like any other commit.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import insert, select, update
+
+from database import Item, Rental, SessionLocal, Transaction, record_bulk_changes
+from events import event_log
+from instrumentation import metrics
+
+logger = logging.getLogger("campus_rentals.lifecycle")
+
+RENTAL_SWEEP_SECONDS = float(os.getenv("RENTAL_SWEEP_SECONDS", "300"))
+RENTAL_SWEEP_BATCH = int(os.getenv("RENTAL_SWEEP_BATCH", "200"))
+# Caps the work per step and sweep; the rest waits for the next run
+RENTAL_SWEEP_MAX_BATCHES = int(os.getenv("RENTAL_SWEEP_MAX_BATCHES", "50"))
+OVERDUE_GRACE_HOURS = float(os.getenv("OVERDUE_GRACE_HOURS", "24"))
+AUTO_COMPLETE_DAYS = float(os.getenv("AUTO_COMPLETE_DAYS", "14"))
+# Pause between batches so request handlers can take the write lock
+BATCH_PAUSE_SECONDS = 0.05
+
+metrics.describe("rental_sweep_rows_total", "counter", "Rentals changed by the lifecycle sweeper by action")
+metrics.describe("rental_sweep_duration_seconds", "histogram", "Time spent in one lifecycle sweep")
+metrics.describe("rental_sweep_last_run_timestamp", "gauge", "Unix time the last lifecycle sweep finished")
+
+
+def _candidates(status: str, column, before: datetime, limit: int, *criteria):
+    return (
+        select(Rental.id)
+        .where(Rental.status == status, column < before, *criteria)
+        .order_by(column)
+        .limit(limit)
+        .scalar_subquery()
+    )
+
+
+class LifecycleSweeper:
+    def __init__(self, session_factory=SessionLocal, interval: float = RENTAL_SWEEP_SECONDS,
+                 batch_size: int = RENTAL_SWEEP_BATCH, max_batches: int = RENTAL_SWEEP_MAX_BATCHES):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._task = None
+
+    def _update_batch(self, db, status: str, column, before: datetime, values: dict, *criteria) -> List[tuple]:
+        candidates = _candidates(status, column, before, self.batch_size, *criteria)
+        rows = db.execute(
+            update(Rental)
+            .where(Rental.id.in_(candidates), Rental.status == status, *criteria)
+            .values(**values)
+            .returning(Rental.id, Rental.owner_id, Rental.item_id, Rental.owner_earnings)
+            .execution_options(synchronize_session=False)
+        ).all()
+        record_bulk_changes(db, Rental, "update", [
+            {"id": row.id, "owner_id": row.owner_id, "item_id": row.item_id, **values} for row in rows
+        ])
+        return rows
+
+    def expire_pending(self, db, now: datetime) -> List[tuple]:
+        return self._update_batch(db, "pending", Rental.start_date, now, {"status": "cancelled"})
+
+    def expire_approved(self, db, now: datetime) -> List[tuple]:
+        return self._update_batch(db, "approved", Rental.end_date, now, {"status": "cancelled"})
+
+    def flag_overdue(self, db, now: datetime) -> List[tuple]:
+        # Lower bound keeps the scan to rentals not yet due for auto-completion
+        return self._update_batch(
+            db, "active", Rental.end_date, now - timedelta(hours=OVERDUE_GRACE_HOURS), {"overdue_at": now},
+            Rental.overdue_at.is_(None), Rental.end_date >= now - timedelta(days=AUTO_COMPLETE_DAYS),
+        )
+
+    def auto_complete(self, db, now: datetime) -> List[tuple]:
+        rows = self._update_batch(
+            db, "active", Rental.end_date, now - timedelta(days=AUTO_COMPLETE_DAYS), {"status": "completed"}
+        )
+        if rows:
+            titles = dict(db.execute(
+                select(Item.id, Item.title).where(Item.id.in_({row.item_id for row in rows}))
+            ).all())
+            db.execute(insert(Transaction).values([
+                {
+                    "user_id": row.owner_id,
+                    "rental_id": row.id,
+                    "amount": row.owner_earnings,
+                    "type": "earning",
+                    "status": "completed",
+                    "description": f"Earned from renting '{titles.get(row.item_id, 'item')}' (auto-completed)",
+                    "created_at": now,
+                }
+                for row in rows
+            ]))
+        return rows
+
+    def run_once(self) -> Dict[str, int]:
+        """One sweep of every step; returns rows changed per action"""
+        started = time.perf_counter()
+        steps = {
+            "expired_pending": (self.expire_pending, "rental.expired"),
+            "expired_approved": (self.expire_approved, "rental.expired"),
+            "overdue": (self.flag_overdue, "rental.overdue"),
+            "auto_completed": (self.auto_complete, "rental.auto_completed"),
+        }
+        counts = dict.fromkeys(steps, 0)
+        db = self.session_factory()
+        try:
+            for action, (step, event_name) in steps.items():
+                for _ in range(self.max_batches):
+                    rows = step(db, datetime.utcnow())
+                    db.commit()
+                    for row in rows:
+                        event_log.record(event_name, "rental", row.id, reason=action)
+                    counts[action] += len(rows)
+                    if len(rows) < self.batch_size:
+                        break
+                    time.sleep(BATCH_PAUSE_SECONDS)
+        finally:
+            db.close()
+            metrics.observe("rental_sweep_duration_seconds", time.perf_counter() - started)
+        for action, count in counts.items():
+            metrics.inc("rental_sweep_rows_total", count, action=action)
+        metrics.set("rental_sweep_last_run_timestamp", time.time())
+        if any(counts.values()):
+            logger.info("Rental sweep: %s", ", ".join(f"{action}={count}" for action, count in counts.items()))
+        return counts
+
+    async def _loop(self):
+        # Spread the workers' sweeps apart
+        await asyncio.sleep(random.uniform(0, min(self.interval, 30)))
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception:
+                logger.exception("Rental sweep failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+lifecycle_sweeper = LifecycleSweeper()
@@ -0,0 +1,103 @@
+"""Per-request batching of lookups by id (the DataLoader pattern).
+
+Code that needs many rows by id calls `await loader.load(id)` (or
+`load_many`) instead of querying one row at a time. Every key requested
+during the same event-loop tick is collected and resolved with a single
+`IN` query, and each key is fetched at most once per request:
+
+    loaders: Loaders = Depends(get_loaders)
+    senders = await loaders.users.load_many([m.sender_id for m in messages])
+"""
+import asyncio
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+from fastapi import Depends, HTTPException
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from database import get_db, Item, User
+
+MAX_BATCH_IDS = 100
+# Keeps IN lists well under SQLite's bound-parameter limit
+QUERY_CHUNK_SIZE = 500
+
+
+class DataLoader:
+    """Coalesces `load` calls made in the same tick into one batch call.
+
+    `batch_load(keys)` returns a dict of key -> value; missing keys resolve
+    to None. Results are cached for the loader's lifetime (one request).
+    """
+
+    def __init__(self, batch_load: Callable[[List[Hashable]], Dict[Hashable, Any]]):
+        self.batch_load = batch_load
+        self._cache: Dict[Hashable, asyncio.Future] = {}
+        self._queue: List[Hashable] = []
+
+    def load(self, key: Hashable) -> asyncio.Future:
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._cache[key] = loop.create_future()
+            self._queue.append(key)
+            if len(self._queue) == 1:
+                loop.call_soon(self._dispatch)
+        return future
+
+    async def load_many(self, keys: Iterable[Hashable]) -> List[Any]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key: Hashable, value: Any):
+        """Seed the cache with a value the caller already has"""
+        if key not in self._cache:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+            self._cache[key] = future
+
+    def _dispatch(self):
+        keys, self._queue = self._queue, []
+        try:
+            results = self.batch_load(keys)
+        except Exception as exc:
+            for key in keys:
+                self._cache.pop(key).set_exception(exc)
+            return
+        for key in keys:
+            self._cache[key].set_result(results.get(key))
+
+
+def model_loader(db: Session, model, *options) -> DataLoader:
+    """Loader resolving primary keys of `model` with `IN` queries"""
+    def batch_load(ids):
+        rows = {}
+        for start in range(0, len(ids), QUERY_CHUNK_SIZE):
+            chunk = ids[start:start + QUERY_CHUNK_SIZE]
+            for row in db.query(model).options(*options).filter(model.id.in_(chunk)):
+                rows[row.id] = row
+        return rows
+    return DataLoader(batch_load)
+
+
+class Loaders:
+    """Request-scoped loaders sharing the request's session"""
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.items = model_loader(db, Item, selectinload(Item.categories), joinedload(Item.owner))
+        self.users = model_loader(db, User)
+
+
+def get_loaders(db: Session = Depends(get_db)) -> Loaders:
+    return Loaders(db)
+
+
+def parse_ids(ids: Optional[str], limit: int = MAX_BATCH_IDS) -> List[int]:
+    """Parse a comma-separated id list, keeping first-seen order"""
+    try:
+        parsed = list(dict.fromkeys(int(part) for part in (ids or "").split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if not parsed:
+        raise HTTPException(status_code=400, detail="ids must not be empty")
+    if len(parsed) > limit:
+        raise HTTPException(status_code=400, detail=f"At most {limit} ids per request")
+    return parsed
@@ -1,34 +1,54 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Query
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, load_only, selectinload
 from typing import List, Optional
 from datetime import datetime, timedelta
 from pydantic import BaseModel, EmailStr
+import asyncio
 import json
-import qrcode
 import io
 import base64
-from math import radians, cos, sin, asin, sqrt
 import os
+import numpy as np
 
 from database import (
-    get_db, init_db, User, Category, Item, Rental, Review,
+    engine, get_db, get_read_db, init_db, User, Category, Item, Rental, Review,
     Transaction, Message, AvailabilityBlock
 )
 from auth import (
-    verify_password, get_password_hash, create_access_token,
-    decode_access_token, verify_edu_email, UserCreate, UserLogin
+    verify_password, get_password_hash, issue_tokens, decode_token,
+    decode_access_token, verify_edu_email, UserCreate, UserLogin, TokenRefresh
 )
+from instrumentation import InstrumentationMiddleware, instrument_engine, metrics
+from geo import item_coordinates, nearby_items, within_box
+from jobs import job_runner
+from notifications import notify
+from ratings import queue_rating
+from events import event_log, read_events
+from lifecycle import lifecycle_sweeper
+from archive import message_archive, message_archiver
+from analytics import MEASURES, UNCATEGORIZED, read_rollups, rollup_refresher, watermark
+from revocation import revoked_tokens
+from ratelimit import RateLimitMiddleware
+from compression import CompressionMiddleware
+from static_assets import asset_url, manifest, serve_static
+from projection import Projection
+from loaders import Loaders, get_loaders, model_loader, parse_ids
+from ranking import parse_weights, rank_scores, ranking_features, top_k
+from facets import facet_counts, item_filters, unfiltered_facets
+from pricing import build_quotes, quote_cache, rental_charges
+from availability import as_utc, day_start, item_availability
+from suggest import search_suggestions
 
 app = FastAPI(title="Campus Rentals API")
 
-# Create static directory if it doesn't exist
-os.makedirs("static/images", exist_ok=True)
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Per-client token buckets and a global concurrency cap (inside CORS so 429s carry CORS headers)
+app.add_middleware(RateLimitMiddleware)
 
 # CORS middleware
 app.add_middleware(
@@ -39,6 +59,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Brotli/gzip for large JSON responses
+app.add_middleware(CompressionMiddleware)
+
+# Request timing, SQL counts and Server-Timing headers
+instrument_engine(engine)
+app.add_middleware(InstrumentationMiddleware)
+
 security = HTTPBearer()
 
 
@@ -59,6 +86,10 @@ class UserResponse(BaseModel):
         from_attributes = True
 
 
+class CurrentUserResponse(UserResponse):
+    is_admin: bool = False
+
+
 class ItemCreate(BaseModel):
     title: str
     description: str
@@ -167,19 +198,17 @@ def get_current_user(
     return user
 
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two points in miles using Haversine formula"""
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    miles = 3956 * c
-    return miles
+def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
 
 
 def generate_qr_code(data: str) -> str:
     """Generate QR code and return as base64 string"""
+    # qrcode (and Pillow behind it) load on first use to keep start-up light
+    import qrcode
+
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
     qr.add_data(data)
     qr.make(fit=True)
@@ -191,10 +220,170 @@ def generate_qr_code(data: str) -> str:
     return f"data:image/png;base64,{img_str}"
 
 
+def load_images(images: Optional[str]) -> List[str]:
+    """Stored image URLs, rewritten to fingerprinted (and CDN) asset URLs"""
+    return [asset_url(url) for url in json.loads(images)] if images else []
+
+
+MAX_PAGE_SIZE = 200
+# Results per page for sort=rank when no limit is given
+RANK_PAGE_SIZE = 50
+
+# Seconds a change must age before /api/items/changes hands it out
+SYNC_SETTLE_SECONDS = float(os.getenv("SYNC_SETTLE_SECONDS", "2"))
+
+# Response keys -> columns/relationships they need, for `fields=` selection
+ITEM_COLUMNS = {
+    "id": (Item.id,),
+    "owner_id": (Item.owner_id,),
+    "title": (Item.title,),
+    "description": (Item.description,),
+    "daily_rate": (Item.daily_rate,),
+    "weekly_rate": (Item.weekly_rate,),
+    "deposit": (Item.deposit,),
+    "condition": (Item.condition,),
+    "available": (Item.available,),
+    "location_name": (Item.location_name,),
+    "latitude": (Item.latitude,),
+    "longitude": (Item.longitude,),
+    "insurance_value": (Item.insurance_value,),
+    "created_at": (Item.created_at,),
+    "images": (Item.images,),
+}
+OWNER_SUMMARY_COLUMNS = (User.id, User.full_name, User.rating, User.total_ratings, User.verified)
+
+ITEM_FIELDS = Projection(
+    Item,
+    {**ITEM_COLUMNS, "distance": (Item.latitude, Item.longitude)},
+    {
+        "categories": ((), selectinload(Item.categories)),
+        "owner": ((Item.owner_id,), joinedload(Item.owner).load_only(*OWNER_SUMMARY_COLUMNS)),
+    },
+)
+ITEM_DETAIL_FIELDS = Projection(
+    Item,
+    ITEM_COLUMNS,
+    {
+        "categories": ((), selectinload(Item.categories)),
+        "owner": ((Item.owner_id,), joinedload(Item.owner)),
+    },
+)
+RENTAL_FIELDS = Projection(
+    Rental,
+    {
+        "id": (Rental.id,),
+        "start_date": (Rental.start_date,),
+        "end_date": (Rental.end_date,),
+        "total_cost": (Rental.total_cost,),
+        "deposit_amount": (Rental.deposit_amount,),
+        "platform_fee": (Rental.platform_fee,),
+        "owner_earnings": (Rental.owner_earnings,),
+        "status": (Rental.status,),
+        "overdue_at": (Rental.overdue_at,),
+        "pickup_qr": (Rental.pickup_qr,),
+        "return_qr": (Rental.return_qr,),
+        "created_at": (Rental.created_at,),
+    },
+    {
+        "item": ((Rental.item_id,), joinedload(Rental.item).load_only(Item.id, Item.title, Item.images)),
+        "renter": ((Rental.renter_id,), joinedload(Rental.renter)),
+        "owner": ((Rental.owner_id,), joinedload(Rental.owner)),
+    },
+)
+
+ITEM_SERIALIZERS = {
+    "id": lambda item: item.id,
+    "owner_id": lambda item: item.owner_id,
+    "title": lambda item: item.title,
+    "description": lambda item: item.description,
+    "daily_rate": lambda item: item.daily_rate,
+    "weekly_rate": lambda item: item.weekly_rate,
+    "deposit": lambda item: item.deposit,
+    "condition": lambda item: item.condition,
+    "available": lambda item: item.available,
+    "location_name": lambda item: item.location_name,
+    "latitude": lambda item: item.latitude,
+    "longitude": lambda item: item.longitude,
+    "insurance_value": lambda item: item.insurance_value,
+    "created_at": lambda item: item.created_at,
+    "images": lambda item: load_images(item.images),
+    "categories": lambda item: [{"id": c.id, "name": c.name, "icon": c.icon} for c in item.categories],
+    "owner": lambda item: {
+        "id": item.owner.id,
+        "full_name": item.owner.full_name,
+        "rating": item.owner.rating,
+        "total_ratings": item.owner.total_ratings,
+        "verified": item.owner.verified,
+    },
+}
+
+RENTAL_SERIALIZERS = {
+    "id": lambda rental: rental.id,
+    "item": lambda rental: {
+        "id": rental.item.id,
+        "title": rental.item.title,
+        "images": load_images(rental.item.images)
+    },
+    "renter": lambda rental: UserResponse.from_orm(rental.renter),
+    "owner": lambda rental: UserResponse.from_orm(rental.owner),
+    "start_date": lambda rental: rental.start_date,
+    "end_date": lambda rental: rental.end_date,
+    "total_cost": lambda rental: rental.total_cost,
+    "deposit_amount": lambda rental: rental.deposit_amount,
+    "platform_fee": lambda rental: rental.platform_fee,
+    "owner_earnings": lambda rental: rental.owner_earnings,
+    "status": lambda rental: rental.status,
+    "overdue_at": lambda rental: rental.overdue_at,
+    "pickup_qr": lambda rental: generate_qr_code(rental.pickup_qr) if rental.pickup_qr else None,
+    "return_qr": lambda rental: generate_qr_code(rental.return_qr) if rental.return_qr else None,
+    "created_at": lambda rental: rental.created_at,
+}
+
+
+def format_item(item: Item, fields=ITEM_FIELDS.names) -> dict:
+    """Listing representation of an item with a compact owner summary"""
+    return {name: serialize(item) for name, serialize in ITEM_SERIALIZERS.items() if name in fields}
+
+
+def format_rental(rental: Rental, fields=RENTAL_FIELDS.names) -> dict:
+    """Rental with item summary, both parties and QR codes (rendered only when selected)"""
+    return {name: serialize(rental) for name, serialize in RENTAL_SERIALIZERS.items() if name in fields}
+
+
 # Routes
 @app.on_event("startup")
 async def startup_event():
+    # Create static directory if it doesn't exist
+    os.makedirs("static/images", exist_ok=True)
     init_db()
+    await asyncio.to_thread(revoked_tokens.prune)
+    await asyncio.to_thread(revoked_tokens.load)
+    await asyncio.to_thread(manifest.load)
+    await job_runner.start()
+    await event_log.start()
+    await lifecycle_sweeper.start()
+    await message_archiver.start()
+    await rollup_refresher.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_runner.stop()
+    await lifecycle_sweeper.stop()
+    await message_archiver.stop()
+    await rollup_refresher.stop()
+    await event_log.stop()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# Static files with content-hash fingerprints, ETags and range support
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+def get_static_file(path: str, request: Request):
+    return serve_static(path, request)
 
 
 @app.post("/api/auth/register")
@@ -225,12 +414,8 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     db.commit()
     db.refresh(user)
 
-    # Create access token
-    access_token = create_access_token(data={"sub": user.email})
-
     return {
-        "access_token": access_token,
-        "token_type": "bearer",
+        **issue_tokens(user.email),
         "user": UserResponse.from_orm(user)
     }
 
@@ -244,22 +429,83 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)):
             detail="Incorrect email or password"
         )
 
-    access_token = create_access_token(data={"sub": user.email})
-
     return {
-        "access_token": access_token,
-        "token_type": "bearer",
+        **issue_tokens(user.email),
         "user": UserResponse.from_orm(user)
     }
 
 
-@app.get("/api/auth/me", response_model=UserResponse)
+@app.post("/api/auth/refresh")
+async def refresh_tokens(body: TokenRefresh, db: Session = Depends(get_db)):
+    """Trade a refresh token for a new token pair; the old refresh token is revoked"""
+    payload = decode_token(body.refresh_token, "refresh")
+    if not payload:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token"
+        )
+    if not db.query(User.id).filter(User.email == payload["sub"]).first():
+        raise HTTPException(status_code=404, detail="User not found")
+
+    revoked_tokens.consume(
+        db, payload["jti"], "refresh", datetime.utcfromtimestamp(payload["exp"]), subject=payload["sub"]
+    )
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent refresh, possibly in another worker, spent this token first
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token"
+        )
+    return issue_tokens(payload["sub"])
+
+
+@app.post("/api/auth/logout")
+async def logout(
+    body: Optional[TokenRefresh] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """Revoke the bearer access token and, if given, its refresh token"""
+    payload = decode_token(credentials.credentials)
+    if not payload:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials"
+        )
+    revoked = [(payload, "access")]
+    if body is not None:
+        refresh = decode_token(body.refresh_token, "refresh")
+        if refresh and refresh["sub"] == payload["sub"]:
+            revoked.append((refresh, "refresh"))
+    for claims, token_type in revoked:
+        revoked_tokens.revoke(
+            db, claims["jti"], token_type, datetime.utcfromtimestamp(claims["exp"]), subject=claims["sub"]
+        )
+    db.commit()
+    return {"message": "Logged out successfully"}
+
+
+@app.get("/api/auth/me", response_model=CurrentUserResponse)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
     return current_user
 
 
+@app.get("/api/users/batch", response_model=List[UserResponse])
+async def get_users_batch(
+    ids: str,
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    loaders.users.prime(current_user.id, current_user)
+    users = await loaders.users.load_many(parse_ids(ids))
+    return [user for user in users if user is not None]
+
+
 @app.get("/api/categories")
-async def get_categories(db: Session = Depends(get_db)):
+async def get_categories(db: Session = Depends(get_read_db)):
     categories = db.query(Category).all()
     return [{"id": c.id, "name": c.name, "icon": c.icon} for c in categories]
 
@@ -307,99 +553,277 @@ async def get_items(
     latitude: Optional[float] = None,
     longitude: Optional[float] = None,
     max_distance: Optional[float] = 10.0,
-    db: Session = Depends(get_db)
+    sort: Optional[str] = Query(None, pattern="^(distance|rank)$"),
+    weights: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    fields: Optional[str] = None,
+    ids: Optional[str] = None,
+    available_from: Optional[datetime] = None,
+    available_to: Optional[datetime] = None,
+    db: Session = Depends(get_read_db)
 ):
-    query = db.query(Item).filter(Item.available == True)
+    selected = ITEM_FIELDS.select(fields)
+    if ids is not None:
+        # Batch lookup: the listed items in the requested order, like repeated /api/items/{id}
+        loader = model_loader(db, Item, *ITEM_FIELDS.options(selected))
+        items = await loader.load_many(parse_ids(ids))
+        return [format_item(item, selected) for item in items if item is not None]
+
+    has_location = bool(latitude and longitude)
+    if sort == "distance" and not has_location:
+        raise HTTPException(status_code=400, detail="Sorting by distance requires latitude and longitude")
+
+    rank_weights = parse_weights(weights) if sort == "rank" else None
+    if available_from or available_to:
+        available_from, available_to = check_availability_range(db, available_from, available_to)
+
+    # Coordinates are needed for the radius check even when not returned
+    location_columns = (Item.latitude, Item.longitude) if has_location else ()
+    if sort == "rank":
+        # Candidates only need what ranking reads; the page is loaded in full below
+        query = db.query(Item).options(load_only(Item.id, *location_columns))
+    else:
+        query = db.query(Item).options(*ITEM_FIELDS.options(selected, always=location_columns))
+    filters = item_filters(category_id, search, min_price, max_price)
+    query = query.filter(*filters["base"], *filters["category"], *filters["price"])
+
+    # Cheap bounding-box pre-filter in SQL before the exact radius check
+    if has_location and max_distance is not None:
+        query = query.filter(*within_box(latitude, longitude, max_distance))
+
+    items = query.all()
+
+    # Filter by distance if location provided
+    distances = None
+    if has_location:
+        distances = item_coordinates.distances(items, latitude, longitude)
+        if max_distance is not None:
+            within = distances <= max_distance
+            items = [item for item, keep in zip(items, within) if keep]
+            distances = distances[within]
+        if sort == "distance":
+            order = np.argsort(distances, kind="stable")
+            items = [items[i] for i in order]
+            distances = distances[order]
+
+    # Only items with no booked or blocked day in the range
+    if available_from and available_to:
+        free = item_availability.free(db, (item.id for item in items), available_from, available_to)
+        items = [item for item, keep in zip(items, free) if keep]
+        if distances is not None:
+            distances = distances[free]
+
+    if sort == "rank":
+        candidate_ids = np.fromiter((item.id for item in items), dtype=np.int64, count=len(items))
+        scores = rank_scores(ranking_features.features(db, candidate_ids), distances, rank_weights)
+        page = top_k(scores, offset + (limit or RANK_PAGE_SIZE))[offset:]
+        loader = model_loader(db, Item, *ITEM_FIELDS.options(selected))
+        items = await loader.load_many(int(candidate_ids[i]) for i in page)
+        if distances is not None:
+            distances = distances[page]
+    elif limit is not None or offset:
+        end = None if limit is None else offset + limit
+        items = items[offset:end]
+        if distances is not None:
+            distances = distances[offset:end]
+
+    # Format response
+    result = []
+    for index, item in enumerate(items):
+        item_dict = format_item(item, selected)
+        if "distance" in selected and distances is not None and not np.isnan(distances[index]):
+            item_dict["distance"] = round(float(distances[index]), 1)
+        result.append(item_dict)
+
+    return result
+
+
+def check_availability_range(db: Session, start: Optional[datetime], end: Optional[datetime]):
+    """(start, end) as naive UTC; rejects ranges the availability bitmaps can't answer"""
+    if not start or not end:
+        raise HTTPException(status_code=400, detail="available_from and available_to go together")
+    start, end = as_utc(start), as_utc(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="available_to must be after available_from")
+    first_day, horizon_days = item_availability.window(db)
+    if start < first_day or end > first_day + timedelta(days=horizon_days):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Availability is known from today for {horizon_days} days"
+        )
+    return start, end
+
+
+def encode_sync_token(updated_at: datetime, item_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{updated_at.isoformat()},{item_id}".encode()).decode()
 
-    if category_id:
-        query = query.join(Item.categories).filter(Category.id == category_id)
 
-    if search:
+def decode_sync_token(token: str):
+    try:
+        updated_at, item_id = base64.urlsafe_b64decode(token.encode()).decode().split(",")
+        return datetime.fromisoformat(updated_at), int(item_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token; start over without `since`")
+
+
+@app.get("/api/items/changes")
+async def get_item_changes(
+    since: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=1000),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Items changed since a sync token; unavailable items come back as deletions.
+
+    Without `since` every available item is returned. Keep calling with
+    `next_token` while `has_more` is true, then store it for the next refresh.
+    """
+    selected = ITEM_FIELDS.select(fields) - {"distance"}
+    # Rows stamped in the last moments may still belong to uncommitted
+    # transactions; leaving them for the next call keeps the cursor from
+    # skipping past them.
+    settled = datetime.utcnow() - timedelta(seconds=SYNC_SETTLE_SECONDS)
+
+    query = db.query(Item).options(*ITEM_FIELDS.options(selected, always=(Item.available, Item.updated_at)))
+    query = query.filter(Item.updated_at <= settled)
+    if since:
+        updated_at, item_id = decode_sync_token(since)
         query = query.filter(
-            (Item.title.ilike(f"%{search}%")) |
-            (Item.description.ilike(f"%{search}%"))
+            (Item.updated_at > updated_at) |
+            ((Item.updated_at == updated_at) & (Item.id > item_id))
         )
+    else:
+        query = query.filter(Item.available == True)
+    items = query.order_by(Item.updated_at, Item.id).limit(limit + 1).all()
 
-    if min_price:
-        query = query.filter(Item.daily_rate >= min_price)
+    has_more = len(items) > limit
+    items = items[:limit]
+    if items:
+        next_token = encode_sync_token(items[-1].updated_at, items[-1].id)
+    else:
+        next_token = since or encode_sync_token(settled, 0)
 
-    if max_price:
-        query = query.filter(Item.daily_rate <= max_price)
+    return {
+        "changed": [format_item(item, selected) for item in items if item.available],
+        "deleted": [item.id for item in items if not item.available],
+        "next_token": next_token,
+        "has_more": has_more,
+    }
 
-    items = query.all()
 
-    # Filter by distance if location provided
-    if latitude and longitude:
-        items = [
-            item for item in items
-            if item.latitude and item.longitude and
-            calculate_distance(latitude, longitude, item.latitude, item.longitude) <= max_distance
-        ]
+@app.get("/api/items/facets")
+async def get_item_facets(
+    category_id: Optional[int] = None,
+    search: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    max_distance: Optional[float] = 10.0,
+    db: Session = Depends(get_read_db)
+):
+    """Counts per category, price bucket and condition for the same filters as /api/items"""
+    has_location = bool(latitude and longitude)
+    if not (category_id or search or min_price or max_price or has_location):
+        return unfiltered_facets.get(db)
+
+    filters = item_filters(category_id, search, min_price, max_price)
+    item_ids = None
+    if has_location and max_distance is not None:
+        # The exact radius check happens in Python, as in get_items
+        candidates = (
+            db.query(Item).options(load_only(Item.id, Item.latitude, Item.longitude))
+            .filter(*filters["base"], *within_box(latitude, longitude, max_distance))
+            .all()
+        )
+        within = item_coordinates.distances(candidates, latitude, longitude) <= max_distance
+        item_ids = [item.id for item, keep in zip(candidates, within) if keep]
+
+    return facet_counts(db, filters, item_ids)
 
-    # Format response
-    result = []
-    for item in items:
-        item_dict = {
-            "id": item.id,
-            "owner_id": item.owner_id,
-            "title": item.title,
-            "description": item.description,
-            "daily_rate": item.daily_rate,
-            "weekly_rate": item.weekly_rate,
-            "deposit": item.deposit,
-            "condition": item.condition,
-            "available": item.available,
-            "location_name": item.location_name,
-            "latitude": item.latitude,
-            "longitude": item.longitude,
-            "insurance_value": item.insurance_value,
-            "created_at": item.created_at,
-            "images": json.loads(item.images) if item.images else [],
-            "categories": [{"id": c.id, "name": c.name, "icon": c.icon} for c in item.categories],
-            "owner": {
-                "id": item.owner.id,
-                "full_name": item.owner.full_name,
-                "rating": item.owner.rating,
-                "total_ratings": item.owner.total_ratings,
-                "verified": item.owner.verified,
-            }
-        }
 
-        if latitude and longitude and item.latitude and item.longitude:
-            item_dict["distance"] = round(
-                calculate_distance(latitude, longitude, item.latitude, item.longitude), 1
-            )
+@app.get("/api/search/suggest")
+async def suggest_search(
+    q: str = Query(..., max_length=100),
+    limit: int = Query(8, ge=1, le=20),
+    db: Session = Depends(get_read_db)
+):
+    """Autocomplete for the search box from the in-memory prefix index, no SQL per keystroke"""
+    return {"query": q, "suggestions": search_suggestions.suggest(db, q, limit)}
+
 
+@app.get("/api/items/nearby")
+def get_nearby_items(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=100),
+    category_id: Optional[int] = None,
+    max_distance: Optional[float] = Query(None, ge=0),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    selected = ITEM_FIELDS.select(fields)
+    nearby_items.ensure_loaded(db)
+    nearest = nearby_items.nearest(latitude, longitude, k, category_id, max_distance)
+    if not nearest:
+        return []
+
+    query = db.query(Item).options(*ITEM_FIELDS.options(selected, always=(Item.available,)))
+    items = {item.id: item for item in query.filter(Item.id.in_([item_id for _, item_id in nearest]))}
+    result = []
+    for distance, item_id in nearest:
+        item = items.get(item_id)
+        if item is None or not item.available:
+            continue
+        item_dict = format_item(item, selected)
+        if "distance" in selected:
+            item_dict["distance"] = round(distance, 1)
         result.append(item_dict)
 
     return result
 
 
+@app.get("/api/items/{item_id}/calendar")
+async def get_item_calendar(
+    item_id: int,
+    start: Optional[datetime] = None,
+    days: int = Query(31, ge=1, le=366),
+    db: Session = Depends(get_read_db)
+):
+    """Day-by-day availability for a month view, from the occupancy bitmaps"""
+    if not db.query(Item.id).filter(Item.id == item_id).first():
+        raise HTTPException(status_code=404, detail="Item not found")
+    first_day, horizon_days = item_availability.window(db)
+    start = day_start(as_utc(start)) if start else first_day
+    days = min(days, (first_day + timedelta(days=horizon_days) - start).days)
+    if start < first_day or days < 1:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Availability is known from today for {horizon_days} days"
+        )
+    occupied = item_availability.calendar(db, item_id, start, days)
+    return {
+        "item_id": item_id,
+        "start": start.date(),
+        "days": [
+            {"date": (start + timedelta(days=offset)).date(), "available": not busy}
+            for offset, busy in enumerate(occupied)
+        ],
+    }
+
+
 @app.get("/api/items/{item_id}")
-async def get_item(item_id: int, db: Session = Depends(get_db)):
-    item = db.query(Item).filter(Item.id == item_id).first()
+async def get_item(item_id: int, fields: Optional[str] = None, db: Session = Depends(get_read_db)):
+    selected = ITEM_DETAIL_FIELDS.select(fields)
+    item = db.query(Item).options(*ITEM_DETAIL_FIELDS.options(selected)).filter(Item.id == item_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    return {
-        "id": item.id,
-        "owner_id": item.owner_id,
-        "title": item.title,
-        "description": item.description,
-        "daily_rate": item.daily_rate,
-        "weekly_rate": item.weekly_rate,
-        "deposit": item.deposit,
-        "condition": item.condition,
-        "available": item.available,
-        "location_name": item.location_name,
-        "latitude": item.latitude,
-        "longitude": item.longitude,
-        "insurance_value": item.insurance_value,
-        "created_at": item.created_at,
-        "images": json.loads(item.images) if item.images else [],
-        "categories": [{"id": c.id, "name": c.name, "icon": c.icon} for c in item.categories],
-        "owner": UserResponse.from_orm(item.owner)
-    }
+    result = format_item(item, selected - {"owner"})
+    if "owner" in selected:
+        result["owner"] = UserResponse.from_orm(item.owner)
+    return result
 
 
 @app.post("/api/rentals")
@@ -420,10 +844,6 @@ async def create_rental(
     if days < 1:
         raise HTTPException(status_code=400, detail="Rental must be at least 1 day")
 
-    total_cost = item.daily_rate * days
-    platform_fee = total_cost * 0.15
-    owner_earnings = total_cost - platform_fee
-
     # Generate QR codes
     pickup_qr_data = f"PICKUP-{item.id}-{current_user.id}-{int(datetime.utcnow().timestamp())}"
     return_qr_data = f"RETURN-{item.id}-{current_user.id}-{int(datetime.utcnow().timestamp())}"
@@ -434,72 +854,124 @@ async def create_rental(
         owner_id=item.owner_id,
         start_date=rental_data.start_date,
         end_date=rental_data.end_date,
-        total_cost=total_cost,
-        deposit_amount=item.deposit,
-        platform_fee=platform_fee,
-        owner_earnings=owner_earnings,
+        **rental_charges(item, days),
         status="pending",
         pickup_qr=pickup_qr_data,
         return_qr=return_qr_data
     )
 
-    db.add(rental)
-    db.commit()
-    db.refresh(rental)
-
     # Add initial message if provided
     if rental_data.message:
-        message = Message(
-            rental_id=rental.id,
+        rental.messages.append(Message(
             sender_id=current_user.id,
             receiver_id=item.owner_id,
             content=rental_data.message
-        )
-        db.add(message)
-        db.commit()
+        ))
+
+    db.add(rental)
+    db.flush()
+    notify(
+        db, item.owner_id, "rental_requested", rental_id=rental.id,
+        item_title=item.title, renter_name=current_user.full_name,
+        start_date=rental.start_date, end_date=rental.end_date, message=rental_data.message,
+    )
+    db.commit()
+    db.refresh(rental)
+    event_log.record("rental.requested", "rental", rental.id, actor_id=current_user.id,
+                     item_id=rental.item_id, start_date=rental.start_date, end_date=rental.end_date,
+                     total_cost=rental.total_cost)
 
     return {"id": rental.id, "message": "Rental request created successfully"}
 
 
+@app.get("/api/rentals/quotes")
+async def get_rental_quotes(
+    item_ids: str,
+    start_date: datetime,
+    end_date: datetime,
+    db: Session = Depends(get_read_db)
+):
+    """Price several items over one date range, exactly as create_rental would"""
+    days = (end_date - start_date).days
+    if days < 1:
+        raise HTTPException(status_code=400, detail="Rental must be at least 1 day")
+    ids = parse_ids(item_ids)
+
+    quotes, generation = quote_cache.get_many(ids, start_date, end_date)
+    missing = [item_id for item_id in ids if item_id not in quotes]
+    if missing:
+        rows = (
+            db.query(Item.id, Item.daily_rate, Item.weekly_rate, Item.deposit)
+            .filter(Item.id.in_(missing))
+            .all()
+        )
+        fresh = build_quotes([tuple(row) for row in rows], days)
+        quote_cache.put_many(fresh, start_date, end_date, generation)
+        quotes.update(fresh)
+
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "quotes": [quotes[item_id] for item_id in ids if item_id in quotes],
+        "not_found": [item_id for item_id in ids if item_id not in quotes],
+    }
+
+
 @app.get("/api/rentals/my-rentals")
 async def get_my_rentals(
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    selected = RENTAL_FIELDS.select(fields)
+    query = db.query(Rental).options(*RENTAL_FIELDS.options(selected))
+
     # Get rentals where user is renter
-    as_renter = db.query(Rental).filter(Rental.renter_id == current_user.id).all()
+    as_renter = query.filter(Rental.renter_id == current_user.id).all()
 
     # Get rentals where user is owner
-    as_owner = db.query(Rental).filter(Rental.owner_id == current_user.id).all()
-
-    def format_rental(rental):
-        return {
-            "id": rental.id,
-            "item": {
-                "id": rental.item.id,
-                "title": rental.item.title,
-                "images": json.loads(rental.item.images) if rental.item.images else []
-            },
-            "renter": UserResponse.from_orm(rental.renter),
-            "owner": UserResponse.from_orm(rental.owner),
-            "start_date": rental.start_date,
-            "end_date": rental.end_date,
-            "total_cost": rental.total_cost,
-            "deposit_amount": rental.deposit_amount,
-            "platform_fee": rental.platform_fee,
-            "owner_earnings": rental.owner_earnings,
-            "status": rental.status,
-            "pickup_qr": generate_qr_code(rental.pickup_qr) if rental.pickup_qr else None,
-            "return_qr": generate_qr_code(rental.return_qr) if rental.return_qr else None,
-            "created_at": rental.created_at
-        }
+    as_owner = query.filter(Rental.owner_id == current_user.id).all()
 
     return {
-        "as_renter": [format_rental(r) for r in as_renter],
-        "as_owner": [format_rental(r) for r in as_owner]
+        "as_renter": [format_rental(r, selected) for r in as_renter],
+        "as_owner": [format_rental(r, selected) for r in as_owner]
     }
 
 
+@app.get("/api/rentals/{rental_id}/events")
+async def get_rental_events(
+    rental_id: int,
+    after_id: int = 0,
+    limit: int = Query(100, ge=1, le=500),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """History of a rental from the event log, oldest first.
+
+    Events are written in batches, so the latest may take up to
+    EVENT_FLUSH_SECONDS to appear.
+    """
+    rental = db.query(Rental).options(load_only(Rental.renter_id, Rental.owner_id)).filter(
+        Rental.id == rental_id
+    ).first()
+    if not rental:
+        raise HTTPException(status_code=404, detail="Rental not found")
+    if current_user.id not in (rental.renter_id, rental.owner_id):
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    events = read_events(db, after_id, limit, aggregate="rental", aggregate_id=rental_id)
+    return [
+        {
+            "id": event.id,
+            "name": event.name,
+            "actor_id": event.actor_id,
+            "payload": json.loads(event.payload) if event.payload else {},
+            "created_at": event.created_at,
+        }
+        for event in events
+    ]
+
+
 @app.patch("/api/rentals/{rental_id}/approve")
 async def approve_rental(
     rental_id: int,
@@ -516,6 +988,7 @@ async def approve_rental(
     rental.status = "approved"
     rental.approved_at = datetime.utcnow()
     db.commit()
+    event_log.record("rental.approved", "rental", rental_id, actor_id=current_user.id)
 
     return {"message": "Rental approved successfully"}
 
@@ -533,6 +1006,7 @@ async def verify_pickup(
     rental.pickup_verified_at = datetime.utcnow()
     rental.status = "active"
     db.commit()
+    event_log.record("rental.picked_up", "rental", rental_id, actor_id=current_user.id)
 
     return {"message": "Pickup verified successfully"}
 
@@ -549,9 +1023,8 @@ async def verify_return(
 
     rental.return_verified_at = datetime.utcnow()
     rental.status = "completed"
-    db.commit()
 
-    # Create transaction for owner
+    # Create transaction for owner in the same commit as the status change
     transaction = Transaction(
         user_id=rental.owner_id,
         rental_id=rental.id,
@@ -562,6 +1035,8 @@ async def verify_return(
     )
     db.add(transaction)
     db.commit()
+    event_log.record("rental.returned", "rental", rental_id, actor_id=current_user.id,
+                     transaction_id=transaction.id, owner_earnings=transaction.amount)
 
     return {"message": "Return verified successfully"}
 
@@ -570,6 +1045,7 @@ async def verify_return(
 async def get_messages(
     rental_id: Optional[int] = None,
     current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders),
     db: Session = Depends(get_db)
 ):
     query = db.query(Message).filter(
@@ -581,6 +1057,8 @@ async def get_messages(
         query = query.filter(Message.rental_id == rental_id)
 
     messages = query.order_by(Message.created_at.desc()).all()
+    senders = await loaders.users.load_many({m.sender_id for m in messages})
+    senders = {user.id: user for user in senders if user is not None}
 
     return [
         {
@@ -591,12 +1069,42 @@ async def get_messages(
             "content": m.content,
             "created_at": m.created_at,
             "read": m.read,
-            "sender": UserResponse.from_orm(m.sender)
+            "sender": UserResponse.from_orm(senders[m.sender_id])
         }
         for m in messages
     ]
 
 
+@app.get("/api/messages/archive")
+async def get_archived_messages(
+    rental_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders),
+):
+    """Archived conversations: the user's threads, or one thread's messages with `rental_id`"""
+    if rental_id is None:
+        threads = await asyncio.to_thread(message_archive.threads_for, current_user.id, limit, offset)
+        return {"threads": threads}
+
+    thread = await asyncio.to_thread(message_archive.thread, rental_id)
+    if thread is None:
+        raise HTTPException(status_code=404, detail="No archived messages for this rental")
+    if current_user.id not in (thread["renter_id"], thread["owner_id"]):
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    senders = await loaders.users.load_many({m["sender_id"] for m in thread["messages"]})
+    senders = {user.id: UserResponse.from_orm(user) for user in senders if user is not None}
+    messages = thread.pop("messages")
+    # Newest first, like /api/messages
+    thread["messages"] = [
+        {**m, "rental_id": rental_id, "sender": senders.get(m["sender_id"])}
+        for m in reversed(messages)
+    ][offset:offset + limit]
+    return thread
+
+
 @app.post("/api/messages")
 async def send_message(
     message_data: MessageCreate,
@@ -618,8 +1126,14 @@ async def send_message(
     )
 
     db.add(message)
+    notify(
+        db, receiver_id, "message_received", rental_id=message_data.rental_id,
+        sender_name=current_user.full_name, preview=message_data.content[:140],
+    )
     db.commit()
     db.refresh(message)
+    event_log.record("message.sent", "rental", message.rental_id, actor_id=current_user.id,
+                     message_id=message.id, receiver_id=receiver_id)
 
     return {"id": message.id, "message": "Message sent successfully"}
 
@@ -654,15 +1168,11 @@ async def create_review(
     )
 
     db.add(review)
-
-    # Update reviewee's rating
-    reviewee = db.query(User).filter(User.id == review_data.reviewee_id).first()
-    if reviewee:
-        total_rating = reviewee.rating * reviewee.total_ratings + review_data.rating
-        reviewee.total_ratings += 1
-        reviewee.rating = round(total_rating / reviewee.total_ratings, 1)
-
+    # The reviewee's average is updated by the job queue, after this commit
+    queue_rating(db, review_data.reviewee_id, review_data.rating)
     db.commit()
+    event_log.record("review.created", "rental", review_data.rental_id, actor_id=current_user.id,
+                     review_id=review.id, reviewee_id=review_data.reviewee_id, rating=review_data.rating)
 
     return {"message": "Review submitted successfully"}
 
@@ -686,12 +1196,12 @@ async def get_earnings(
     monthly_transactions = [t for t in transactions if t.created_at >= month_start]
     monthly_earnings = sum(t.amount for t in monthly_transactions)
 
-    # Get pending earnings (approved but not completed)
-    pending_rentals = db.query(Rental).filter(
+    # Get pending earnings: picked up, or approved and still able to start.
+    # Approved rentals past their end date are stale; the lifecycle sweeper cancels them.
+    pending_earnings = db.query(func.coalesce(func.sum(Rental.owner_earnings), 0.0)).filter(
         Rental.owner_id == current_user.id,
-        Rental.status.in_(["approved", "active"])
-    ).all()
-    pending_earnings = sum(r.owner_earnings for r in pending_rentals)
+        (Rental.status == "active") | ((Rental.status == "approved") & (Rental.end_date >= now))
+    ).scalar()
 
     # Get active rentals count
     active_count = db.query(Rental).filter(
@@ -737,7 +1247,7 @@ async def get_my_items(
             "deposit": item.deposit,
             "condition": item.condition,
             "available": item.available,
-            "images": json.loads(item.images) if item.images else [],
+            "images": load_images(item.images),
             "categories": [{"id": c.id, "name": c.name, "icon": c.icon} for c in item.categories],
             "created_at": item.created_at
         }
@@ -745,6 +1255,39 @@ async def get_my_items(
     ]
 
 
+@app.get("/api/admin/analytics")
+async def get_platform_analytics(
+    period: str = Query("week", pattern="^(day|week)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    category_id: Optional[int] = None,
+    admin: User = Depends(get_current_admin),
+    db: Session = Depends(get_read_db)
+):
+    """Rental volume, GMV, fees and earnings per bucket and category, from the rollups only"""
+    names = {category.id: category.name for category in db.query(Category).all()}
+    buckets = {}
+    for row in read_rollups(db, period, start, end, category_id):
+        bucket = buckets.setdefault(row.bucket_start, {
+            "bucket_start": row.bucket_start,
+            "totals": dict.fromkeys(MEASURES, 0),
+            "categories": [],
+        })
+        measures = {name: getattr(row, name) for name in MEASURES}
+        for name, value in measures.items():
+            bucket["totals"][name] += value
+        bucket["categories"].append({
+            "category_id": row.category_id if row.category_id != UNCATEGORIZED else None,
+            "name": names.get(row.category_id, "Uncategorized"),
+            **measures,
+        })
+    for bucket in buckets.values():
+        bucket["totals"] = {name: round(value, 2) for name, value in bucket["totals"].items()}
+    return {"period": period, "as_of": watermark(db), "buckets": list(buckets.values())}
+
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
+
@@ -0,0 +1,196 @@
+"""Email digests for new rental requests and messages.
+
+Handlers queue a notification in their own transaction:
+
+    notify(db, item.owner_id, "rental_requested", rental_id=rental.id, item_title=item.title)
+    db.commit()
+
+`notify` stores a `notifications` row and a `notifications.deliver` job
+that runs NOTIFICATION_DIGEST_SECONDS later. By then the recipient may have
+collected more notifications; the job sends all of them as one digest, and
+the jobs for the later ones find nothing left to send. The job runner
+claims due jobs in batches, so one handler call builds the digests for
+many recipients and sends them over a single transport connection. A
+failed send leaves the notifications undelivered and the jobs are retried
+with backoff.
+
+NOTIFICATION_TRANSPORT picks where digests go:
+    file://notification_outbox.mbox   append to an mbox file (default; open it with any mail client)
+    smtp://localhost:1025             an SMTP relay, e.g. `python -m aiosmtpd -n -l localhost:1025`
+    smtp+starttls://user:pw@host:587  SMTP upgraded with STARTTLS (submission port by default)
+    smtps://user:pw@host              SMTP over implicit TLS (port 465 by default)
+"""
+import json
+import mailbox
+import os
+import smtplib
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Dict, List
+from urllib.parse import urlparse
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from database import Notification, User
+from instrumentation import metrics
+from jobs import enqueue, job_handler
+
+NOTIFICATION_DIGEST_SECONDS = float(os.getenv("NOTIFICATION_DIGEST_SECONDS", "300"))
+NOTIFICATION_TRANSPORT = os.getenv("NOTIFICATION_TRANSPORT", "file://notification_outbox.mbox")
+NOTIFICATION_FROM = os.getenv("NOTIFICATION_FROM", "Campus Rentals <no-reply@campusrentals.local>")
+# Most entries listed in one digest; the rest are summarized as a count
+DIGEST_MAX_ENTRIES = 20
+SMTP_DEFAULT_PORTS = {"smtp": 25, "smtp+starttls": 587, "smtps": 465}
+
+metrics.describe("notifications_queued_total", "counter", "Notifications queued by kind")
+metrics.describe("notifications_delivered_total", "counter", "Notifications delivered in digests")
+metrics.describe("notification_digests_sent_total", "counter", "Digest emails sent by transport")
+metrics.describe("notification_send_duration_seconds", "histogram", "Time spent sending one batch of digests")
+
+
+class FileTransport:
+    """Appends digests to an mbox file, for development and tests"""
+
+    name = "file"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def send_many(self, messages: List[EmailMessage]):
+        box = mailbox.mbox(self.path)
+        box.lock()
+        try:
+            for message in messages:
+                box.add(message)
+            box.flush()
+        finally:
+            box.unlock()
+            box.close()
+
+
+class SMTPTransport:
+    """Sends a batch of digests over one SMTP connection"""
+
+    name = "smtp"
+
+    def __init__(self, host: str, port: int, username: str = None, password: str = None,
+                 starttls: bool = False, implicit_tls: bool = False):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.implicit_tls = implicit_tls
+
+    def send_many(self, messages: List[EmailMessage]):
+        connect = smtplib.SMTP_SSL if self.implicit_tls else smtplib.SMTP
+        with connect(self.host, self.port, timeout=30) as client:
+            if self.starttls:
+                client.starttls()
+            if self.username:
+                client.login(self.username, self.password)
+            for message in messages:
+                client.send_message(message)
+
+
+def create_transport(url: str = NOTIFICATION_TRANSPORT):
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        return FileTransport(parsed.netloc + parsed.path)
+    if parsed.scheme in SMTP_DEFAULT_PORTS:
+        return SMTPTransport(
+            parsed.hostname or "localhost", parsed.port or SMTP_DEFAULT_PORTS[parsed.scheme],
+            parsed.username, parsed.password,
+            starttls=parsed.scheme == "smtp+starttls", implicit_tls=parsed.scheme == "smtps",
+        )
+    raise ValueError(f"Unsupported NOTIFICATION_TRANSPORT: {url}")
+
+
+transport = create_transport()
+
+
+def notify(db: Session, recipient_id: int, kind: str, rental_id: int = None, **payload) -> Notification:
+    """Queue a notification in `db`'s transaction; its digest goes out after the window"""
+    notification = Notification(
+        recipient_id=recipient_id,
+        kind=kind,
+        rental_id=rental_id,
+        payload=json.dumps(payload, default=str),
+    )
+    db.add(notification)
+    enqueue(db, "notifications.deliver", delay=timedelta(seconds=NOTIFICATION_DIGEST_SECONDS),
+            recipient_id=recipient_id)
+    metrics.inc("notifications_queued_total", kind=kind)
+    return notification
+
+
+def _describe(notification: Notification) -> str:
+    payload = json.loads(notification.payload) if notification.payload else {}
+    if notification.kind == "rental_requested":
+        line = (f"{payload.get('renter_name', 'Someone')} wants to rent \"{payload.get('item_title', 'your item')}\""
+                f" from {payload.get('start_date', '?')[:10]} to {payload.get('end_date', '?')[:10]}.")
+        if payload.get("message"):
+            line += f" They wrote: {payload['message'][:140]}"
+        return line
+    if notification.kind == "message_received":
+        return f"{payload.get('sender_name', 'Someone')}: {payload.get('preview', '')}"
+    return notification.kind.replace("_", " ").capitalize()
+
+
+def render_digest(user: User, notifications: List[Notification]) -> EmailMessage:
+    requests = sum(1 for n in notifications if n.kind == "rental_requested")
+    messages = sum(1 for n in notifications if n.kind == "message_received")
+    parts = []
+    if requests:
+        parts.append(f"{requests} rental request{'s' if requests != 1 else ''}")
+    if messages:
+        parts.append(f"{messages} new message{'s' if messages != 1 else ''}")
+    summary = " and ".join(parts) or f"{len(notifications)} updates"
+
+    lines = [f"Hi {user.full_name},", "", f"You have {summary} on Campus Rentals:", ""]
+    lines += [f"- {_describe(n)}" for n in notifications[:DIGEST_MAX_ENTRIES]]
+    if len(notifications) > DIGEST_MAX_ENTRIES:
+        lines.append(f"- ...and {len(notifications) - DIGEST_MAX_ENTRIES} more")
+    lines += ["", "Open Campus Rentals to reply."]
+
+    message = EmailMessage()
+    message["From"] = NOTIFICATION_FROM
+    message["To"] = user.email
+    message["Subject"] = f"Campus Rentals: {summary}"
+    message.set_content("\n".join(lines))
+    return message
+
+
+@job_handler("notifications.deliver")
+def deliver_notifications(db: Session, payloads: List[dict]):
+    """Send each recipient in the batch one digest of everything still undelivered"""
+    recipient_ids = {payload["recipient_id"] for payload in payloads}
+    pending: Dict[int, List[Notification]] = defaultdict(list)
+    for notification in db.scalars(
+        select(Notification)
+        .where(Notification.recipient_id.in_(recipient_ids), Notification.delivered_at.is_(None))
+        .order_by(Notification.created_at, Notification.id)
+    ):
+        pending[notification.recipient_id].append(notification)
+    if not pending:
+        return  # already sent with an earlier digest
+
+    users = {user.id: user for user in db.scalars(select(User).where(User.id.in_(pending)))}
+    digests = [render_digest(users[user_id], notifications)
+               for user_id, notifications in pending.items() if user_id in users]
+    started = time.perf_counter()
+    transport.send_many(digests)
+    metrics.observe("notification_send_duration_seconds", time.perf_counter() - started)
+
+    delivered_ids = [n.id for notifications in pending.values() for n in notifications]
+    db.execute(
+        update(Notification)
+        .where(Notification.id.in_(delivered_ids))
+        .values(delivered_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    metrics.inc("notification_digests_sent_total", len(digests), transport=transport.name)
+    metrics.inc("notifications_delivered_total", len(delivered_ids))
@@ -0,0 +1,135 @@
+"""Rental pricing: daily and weekly rates, platform fee and owner earnings.
+
+A rental is charged whole weeks at the item's weekly rate (when it has
+one and it beats seven daily rates) and the remaining days at the daily
+rate, never more than one more week would cost. create_rental, the seed
+data and the quote endpoint all price through here, so a quote is
+exactly what the rental will charge.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database import Item, on_commit
+from geo import items_channel
+from shared_state import Subscription
+
+PLATFORM_FEE_RATE = 0.15
+QUOTE_CACHE_ENTRIES = 10000
+
+
+def price_many(daily_rates: np.ndarray, weekly_rates: np.ndarray, days: int) -> Dict[str, np.ndarray]:
+    """Vectorized breakdown for many items over the same number of days.
+
+    `weekly_rates` uses NaN for items without a weekly rate.
+    """
+    daily_rates = np.asarray(daily_rates, dtype=np.float64)
+    weekly_rates = np.asarray(weekly_rates, dtype=np.float64)
+    full_week = 7 * daily_rates
+    has_weekly = ~np.isnan(weekly_rates) & (weekly_rates < full_week)
+    week_price = np.where(has_weekly, weekly_rates, full_week)
+
+    weeks, extra_days = divmod(days, 7)
+    extra_cost = np.minimum(extra_days * daily_rates, week_price)
+    total_cost = np.round(weeks * week_price + extra_cost, 2)
+    platform_fee = np.round(total_cost * PLATFORM_FEE_RATE, 2)
+    return {
+        "weeks": np.full(len(daily_rates), weeks),
+        "extra_days": np.full(len(daily_rates), extra_days),
+        "weekly_rate_applied": has_weekly & (weeks > 0),
+        "total_cost": total_cost,
+        "platform_fee": platform_fee,
+        "owner_earnings": np.round(total_cost - platform_fee, 2),
+    }
+
+
+def rental_charges(item: Item, days: int) -> Dict[str, float]:
+    """Rental column values (total_cost, platform_fee, ...) for renting `item` for `days`"""
+    prices = price_many(
+        [item.daily_rate], [np.nan if item.weekly_rate is None else item.weekly_rate], days
+    )
+    return {
+        "total_cost": float(prices["total_cost"][0]),
+        "deposit_amount": item.deposit,
+        "platform_fee": float(prices["platform_fee"][0]),
+        "owner_earnings": float(prices["owner_earnings"][0]),
+    }
+
+
+def build_quotes(rows: Sequence[Tuple], days: int) -> Dict[int, dict]:
+    """Quotes for (id, daily_rate, weekly_rate, deposit) rows over `days` days"""
+    if not rows:
+        return {}
+    prices = price_many(
+        [row[1] for row in rows],
+        [np.nan if row[2] is None else row[2] for row in rows],
+        days,
+    )
+    quotes = {}
+    for index, (item_id, daily_rate, weekly_rate, deposit) in enumerate(rows):
+        total_cost = float(prices["total_cost"][index])
+        quotes[item_id] = {
+            "item_id": item_id,
+            "days": days,
+            "weeks": int(prices["weeks"][index]),
+            "extra_days": int(prices["extra_days"][index]),
+            "weekly_rate_applied": bool(prices["weekly_rate_applied"][index]),
+            "daily_rate": daily_rate,
+            "weekly_rate": weekly_rate,
+            "total_cost": total_cost,
+            "platform_fee": float(prices["platform_fee"][index]),
+            "owner_earnings": float(prices["owner_earnings"][index]),
+            "deposit": deposit,
+            "amount_due": round(total_cost + deposit, 2),
+        }
+    return quotes
+
+
+class QuoteCache:
+    """LRU of quotes keyed by (item id, start, end), dropped when the item changes"""
+
+    def __init__(self, max_entries: int = QUOTE_CACHE_ENTRIES, changes: Optional[Subscription] = None):
+        self.max_entries = max_entries
+        self.changes = changes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[int, datetime, datetime], dict]" = OrderedDict()
+        self._generation = 0
+
+    def get_many(self, item_ids: Iterable[int], start: datetime, end: datetime) -> Tuple[Dict[int, dict], int]:
+        """Cached quotes, plus the generation to hand back to put_many"""
+        found = {}
+        with self._lock:
+            if self.changes is not None and self.changes.changed():
+                # Another worker changed items; prices may have moved
+                self._entries.clear()
+                self._generation += 1
+            for item_id in item_ids:
+                quote = self._entries.get((item_id, start, end))
+                if quote is not None:
+                    self._entries.move_to_end((item_id, start, end))
+                    found[item_id] = quote
+            return found, self._generation
+
+    def put_many(self, quotes: Dict[int, dict], start: datetime, end: datetime, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                # Items changed while these were computed
+                return
+            for item_id, quote in quotes.items():
+                self._entries[(item_id, start, end)] = quote
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, item_ids: Iterable[int]):
+        item_ids = set(item_ids)
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries if key[0] in item_ids]:
+                del self._entries[key]
+
+
+quote_cache = QuoteCache(changes=items_channel.subscribe())
+on_commit(Item, lambda changes: quote_cache.invalidate(row["id"] for _, row in changes if "id" in row))
@@ -0,0 +1,184 @@
+"""Relevance ranking for marketplace listings (`/api/items?sort=rank`).
+
+Each candidate gets a weighted score from four features, all in [0, 1]:
+
+    distance  closer is better (only when the search has a location)
+    price     cheaper daily rate is better
+    rating    owner rating, shrunk toward a prior for owners with few ratings
+    recency   newer listings are better
+
+Per-item features that don't depend on the query (price, owner rating,
+listing time) are precomputed into id-sorted numpy columns and kept
+current by commit hooks, so scoring a candidate set is a few vector
+operations. Only the requested page is then selected with a partial heap
+and loaded in full.
+"""
+import heapq
+import os
+import threading
+import time
+from datetime import timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from database import Item, User, on_commit
+from geo import items_channel
+from shared_state import Channel, Subscription
+
+RANK_FEATURES = ("distance", "price", "rating", "recency")
+DEFAULT_RANK_WEIGHTS = os.getenv("RANK_WEIGHTS", "distance:0.35,price:0.2,rating:0.3,recency:0.15")
+# Miles at which the distance feature has decayed to 1/e
+DISTANCE_SCALE_MILES = 2.0
+# Daily rate at which the price feature is 0.5
+PRICE_SCALE = 25.0
+# Owners start from this many ratings of PRIOR_RATING
+PRIOR_RATINGS = 3
+PRIOR_RATING = 3.5
+# Days at which the recency feature has decayed to 1/e
+RECENCY_SCALE_DAYS = 30.0
+
+
+def parse_weights(spec: Optional[str]) -> Dict[str, float]:
+    """Parse "distance:0.5,price:0.2"; features left out get weight 0"""
+    weights = dict.fromkeys(RANK_FEATURES, 0.0)
+    try:
+        for part in (spec or DEFAULT_RANK_WEIGHTS).split(","):
+            name, _, value = part.partition(":")
+            name = name.strip()
+            if name not in weights:
+                raise ValueError(name)
+            weights[name] = float(value)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"weights must look like 'distance:0.4,price:0.2' using {', '.join(RANK_FEATURES)}"
+        )
+    return weights
+
+
+class RankingFeatures:
+    """Query-independent ranking features as columns sorted by item id.
+
+    Rows are loaded the first time an item is ranked and dropped when the
+    item or its owner changes, so owner rating updates from reviews reach
+    the ranking without rescanning the catalog.
+    """
+
+    def __init__(self, item_changes: Optional[Subscription] = None,
+                 user_changes: Optional[Subscription] = None):
+        self._lock = threading.Lock()
+        self.item_changes = item_changes
+        self.user_changes = user_changes
+        self._clear()
+
+    def _clear(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.owner_ids = np.empty(0, dtype=np.int64)
+        self.price = np.empty(0, dtype=np.float64)
+        self.rating = np.empty(0, dtype=np.float64)
+        self.created = np.empty(0, dtype=np.float64)
+
+    def _positions(self, ids: np.ndarray) -> np.ndarray:
+        positions = np.searchsorted(self.ids, ids)
+        positions[positions >= len(self.ids)] = 0
+        return positions
+
+    def features(self, db: Session, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(price, rating, created timestamp) arrays aligned with `ids`"""
+        with self._lock:
+            stale = [s for s in (self.item_changes, self.user_changes) if s is not None and s.changed()]
+            if stale:
+                # Another worker changed items or owners
+                self._clear()
+            positions = self._positions(ids)
+            missing = np.ones(len(ids), dtype=bool) if not len(self.ids) else self.ids[positions] != ids
+            if missing.any():
+                self._load(db, ids[missing].tolist())
+                positions = self._positions(ids)
+            return self.price[positions], self.rating[positions], self.created[positions]
+
+    def _load(self, db: Session, ids: Sequence[int]):
+        rows = (
+            db.query(Item.id, Item.owner_id, Item.daily_rate, Item.created_at, User.rating, User.total_ratings)
+            .join(User, Item.owner_id == User.id)
+            .filter(Item.id.in_(ids))
+            .all()
+        )
+        found = {row[0] for row in rows}
+        # Unknown ids still get a row so they are not looked up again
+        rows += [(item_id, 0, None, None, None, None) for item_id in ids if item_id not in found]
+
+        new_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        owner_ids = np.array([row[1] for row in rows], dtype=np.int64)
+        daily_rate = np.array([row[2] if row[2] is not None else np.inf for row in rows], dtype=np.float64)
+        created = np.array(
+            [row[3].replace(tzinfo=timezone.utc).timestamp() if row[3] else 0.0 for row in rows],
+            dtype=np.float64
+        )
+        rating = np.array([row[4] or 0.0 for row in rows], dtype=np.float64)
+        total_ratings = np.array([row[5] or 0 for row in rows], dtype=np.float64)
+
+        shrunk = (rating * total_ratings + PRIOR_RATING * PRIOR_RATINGS) / (total_ratings + PRIOR_RATINGS)
+        keep = ~np.isin(self.ids, new_ids)
+        merged_ids = np.concatenate([self.ids[keep], new_ids])
+        order = np.argsort(merged_ids, kind="stable")
+        self.ids = merged_ids[order]
+        self.owner_ids = np.concatenate([self.owner_ids[keep], owner_ids])[order]
+        self.price = np.concatenate([self.price[keep], PRICE_SCALE / (PRICE_SCALE + daily_rate)])[order]
+        self.rating = np.concatenate([self.rating[keep], shrunk / 5.0])[order]
+        self.created = np.concatenate([self.created[keep], created])[order]
+
+    def _drop(self, keep: np.ndarray):
+        self.ids, self.owner_ids = self.ids[keep], self.owner_ids[keep]
+        self.price, self.rating, self.created = self.price[keep], self.rating[keep], self.created[keep]
+
+    def invalidate_items(self, item_ids: Sequence[int]):
+        with self._lock:
+            self._drop(~np.isin(self.ids, np.asarray(item_ids, dtype=np.int64)))
+
+    def invalidate_owners(self, user_ids: Sequence[int]):
+        with self._lock:
+            self._drop(~np.isin(self.owner_ids, np.asarray(user_ids, dtype=np.int64)))
+
+
+def rank_scores(features: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                distances: Optional[np.ndarray], weights: Dict[str, float],
+                now: Optional[float] = None) -> np.ndarray:
+    price, rating, created = features
+    age_days = np.maximum((now or time.time()) - created, 0.0) / 86400
+    scores = (
+        weights["price"] * price
+        + weights["rating"] * rating
+        + weights["recency"] * np.exp(-age_days / RECENCY_SCALE_DAYS)
+    )
+    if distances is not None and weights["distance"]:
+        closeness = np.exp(-distances / DISTANCE_SCALE_MILES)
+        scores += weights["distance"] * np.nan_to_num(closeness, nan=0.0)
+    return scores
+
+
+def top_k(scores: np.ndarray, k: int) -> List[int]:
+    """Indices of the k best scores, best first; ties keep candidate order"""
+    return heapq.nlargest(k, range(len(scores)), key=scores.__getitem__)
+
+
+users_channel = Channel("users")
+ranking_features = RankingFeatures(
+    item_changes=items_channel.subscribe(), user_changes=users_channel.subscribe()
+)
+
+
+def _sync_items(changes):
+    ranking_features.invalidate_items([row["id"] for _, row in changes if "id" in row])
+
+
+def _sync_users(changes):
+    users_channel.publish()
+    ranking_features.invalidate_owners([row["id"] for _, row in changes if "id" in row])
+
+
+on_commit(Item, _sync_items)
+on_commit(User, _sync_users)
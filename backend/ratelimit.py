@@ -0,0 +1,152 @@
+"""Token-bucket rate limiting and admission control for the API.
+
+Every client gets a bucket keyed by the user in its bearer token, or by IP
+address for anonymous requests and tokens that fail verification. Requests spend tokens according to the
+route's cost, so one login (argon2) or one my-rentals (QR rendering) call
+costs as much as several cheap reads. A global concurrency cap bounds how
+many API requests are in flight; excess requests wait in line for up to
+RATE_LIMIT_QUEUE_SECONDS before being turned away.
+
+Limits are enforced per worker process.
+
+The user key is only trusted once the token's signature checks out, so a
+made-up token can neither mint a fresh bucket nor drain someone else's.
+`auth.verified_subject` caches verified tokens until they expire, so the
+check costs a signature verification once per token rather than per request.
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from typing import Dict, List, Optional
+
+from auth import verified_subject
+from instrumentation import metrics
+
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "10"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "60"))
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "64"))
+RATE_LIMIT_QUEUE_SECONDS = float(os.getenv("RATE_LIMIT_QUEUE_SECONDS", "2.0"))
+EVICTION_INTERVAL_SECONDS = 30.0
+
+# (method, path) -> tokens per request; everything else costs 1
+ROUTE_COSTS = {
+    ("POST", "/api/auth/login"): 10,
+    ("POST", "/api/auth/register"): 10,
+    ("GET", "/api/rentals/my-rentals"): 5,
+}
+# Listing the whole catalog is expensive; any filter narrows it
+UNFILTERED_ITEMS_COST = 5
+ITEM_FILTER_PARAMS = {"ids", "category_id", "search", "min_price", "max_price", "latitude", "longitude"}
+
+metrics.describe("rate_limited_requests_total", "counter", "Requests rejected by the rate limiter")
+metrics.describe("rate_limit_active_keys", "gauge", "Clients with a partially drained bucket")
+
+
+def request_cost(method: str, path: str, query_string: bytes) -> float:
+    if method == "GET" and path == "/api/items":
+        params = {pair.split(b"=", 1)[0].decode() for pair in query_string.split(b"&") if pair}
+        return 1 if params & ITEM_FILTER_PARAMS else UNFILTERED_ITEMS_COST
+    return ROUTE_COSTS.get((method, path), 1)
+
+
+class TokenBuckets:
+    """One [tokens, last_refill] pair per client key"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, List[float]] = {}
+        self._last_eviction = time.monotonic()
+
+    def take(self, key: str, cost: float) -> float:
+        """Spend `cost` tokens; returns 0 on success or the seconds to wait"""
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if now - self._last_eviction > EVICTION_INTERVAL_SECONDS:
+            self.evict(now)
+
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        return (cost - bucket[0]) / self.rate
+
+    def evict(self, now: Optional[float] = None):
+        """Forget clients whose bucket has refilled; they'd start full anyway"""
+        now = now or time.monotonic()
+        full_after = self.burst / self.rate
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if now - bucket[1] < full_after
+        }
+        self._last_eviction = now
+        metrics.set("rate_limit_active_keys", len(self._buckets))
+
+
+def client_key(scope) -> str:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization" and value[:7].lower() == b"bearer ":
+            email = verified_subject(value[7:].decode("latin-1"))
+            if email:
+                return f"user:{email}"
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, rate: float = RATE_LIMIT_PER_SECOND, burst: float = RATE_LIMIT_BURST,
+                 max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+                 queue_seconds: float = RATE_LIMIT_QUEUE_SECONDS):
+        self.app = app
+        self.buckets = TokenBuckets(rate, burst)
+        self.max_concurrent = max_concurrent
+        self.queue_seconds = queue_seconds
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        cost = request_cost(scope["method"], scope["path"], scope.get("query_string", b""))
+        wait = self.buckets.take(client_key(scope), cost)
+        if wait:
+            metrics.inc("rate_limited_requests_total", reason="rate")
+            await self._reject(send, wait, "Too many requests")
+            return
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_seconds)
+        except asyncio.TimeoutError:
+            metrics.inc("rate_limited_requests_total", reason="concurrency")
+            await self._reject(send, 1, "Server is busy")
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    async def _reject(send, retry_after: float, detail: str):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
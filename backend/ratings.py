@@ -0,0 +1,45 @@
+"""Owner ratings, folded in from reviews by the job queue.
+
+`create_review` commits the review with a `ratings.apply` job instead of
+updating the reviewee inline. The handler sums a batch's new ratings per
+reviewee and applies each sum with one UPDATE whose arithmetic runs in the
+database, so reviews landing at the same time never overwrite each other.
+"""
+from collections import defaultdict
+from typing import Dict, List
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from database import User, record_bulk_changes
+from jobs import enqueue, job_handler
+
+
+def queue_rating(db: Session, reviewee_id: int, rating: int):
+    """Add `rating` to the reviewee's average once `db` commits"""
+    enqueue(db, "ratings.apply", reviewee_id=reviewee_id, rating=rating)
+
+
+@job_handler("ratings.apply")
+def apply_ratings(db: Session, payloads: List[dict]):
+    new_ratings: Dict[int, List[int]] = defaultdict(list)
+    for payload in payloads:
+        new_ratings[payload["reviewee_id"]].append(payload["rating"])
+    changed = []
+    for reviewee_id, ratings in new_ratings.items():
+        row = db.execute(
+            update(User)
+            .where(User.id == reviewee_id)
+            .values(
+                rating=func.round(
+                    (User.rating * User.total_ratings + sum(ratings)) / (User.total_ratings + len(ratings)), 1
+                ),
+                total_ratings=User.total_ratings + len(ratings),
+            )
+            .returning(User.id, User.rating, User.total_ratings)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if row is not None:
+            changed.append({"id": row.id, "rating": row.rating, "total_ratings": row.total_ratings})
+    # Ranking caches owner ratings; let its User commit hook see the change
+    record_bulk_changes(db, User, "update", changed)
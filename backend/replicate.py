@@ -0,0 +1,65 @@
+"""Keep SQLite read replicas in step with the primary, for local development.
+
+Stands in for real replication (e.g. Postgres streaming replicas) so the
+read/write routing behind REPLICA_URLS can be exercised on one machine:
+
+    DATABASE_URL=sqlite:///./campus_rentals.db REPLICA_URLS=sqlite:///./replica.db \\
+        python replicate.py --interval 2
+
+Each pass copies the primary into every replica with SQLite's online
+backup API, so replicas lag the primary by up to one interval.
+"""
+import argparse
+import logging
+import sqlite3
+import time
+
+from sqlalchemy.engine import make_url
+
+from database import REPLICA_URLS, SQLALCHEMY_DATABASE_URL
+
+logger = logging.getLogger("replicate")
+
+
+def sqlite_path(url: str) -> str:
+    parsed = make_url(url)
+    if not parsed.drivername.startswith("sqlite") or not parsed.database:
+        raise SystemExit(f"{url} is not a SQLite file database")
+    return parsed.database
+
+
+def copy_database(source_path: str, replica_path: str):
+    source = sqlite3.connect(source_path)
+    replica = sqlite3.connect(replica_path, timeout=5)
+    try:
+        source.backup(replica, pages=4096)
+    finally:
+        replica.close()
+        source.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between copies")
+    parser.add_argument("--once", action="store_true", help="copy once and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if not REPLICA_URLS:
+        raise SystemExit("Set REPLICA_URLS to the replica database(s)")
+    source_path = sqlite_path(SQLALCHEMY_DATABASE_URL)
+    replica_paths = [sqlite_path(url) for url in REPLICA_URLS]
+
+    while True:
+        started = time.perf_counter()
+        for replica_path in replica_paths:
+            copy_database(source_path, replica_path)
+        logger.info("Copied %s to %d replica(s) in %.0f ms", source_path, len(replica_paths),
+                    (time.perf_counter() - started) * 1000)
+        if args.once:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
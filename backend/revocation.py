@@ -0,0 +1,115 @@
+"""Denylist of revoked JWTs (logout and refresh-token rotation).
+
+Revocations are stored in `revoked_tokens` and mirrored in a per-process
+set of token ids, so `auth.decode_token` turns a revoked token away with
+one set lookup, before any signature work and without a query. Workers
+load the set at start-up and reload it in a background thread when another
+worker publishes on the `revoked_tokens` channel, so request handlers never
+wait on the query; their own revocations are added by a commit hook. Rows
+are pruned once the token would have expired anyway, which keeps the set
+to tokens that are still otherwise valid.
+
+The set is a fast path only. Single-use tokens are spent with `consume`,
+whose INSERT on the `jti` primary key is the atomic check: of two
+concurrent refreshes with one token, in this worker or any other, exactly
+one commits.
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from database import RevokedToken, SessionLocal, on_commit
+from shared_state import Channel, Subscription
+
+logger = logging.getLogger("campus_rentals.revocation")
+revocations_channel = Channel("revoked_tokens")
+
+
+class RevocationList:
+    def __init__(self, session_factory=SessionLocal, changes: Optional[Subscription] = None):
+        self.session_factory = session_factory
+        self.changes = changes
+        self._lock = threading.Lock()
+        # jti -> expiry
+        self._jtis: Dict[str, datetime] = {}
+        self._loaded = False
+        self._reloading = False
+
+    def is_revoked(self, jti: str) -> bool:
+        if not self._loaded:
+            # Only before start-up has loaded the set, e.g. in scripts
+            self.load()
+        elif self.changes is not None and self.changes.changed():
+            self._reload_in_background()
+        return jti in self._jtis
+
+    def _reload_in_background(self):
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._background_load, name="revocation-reload", daemon=True).start()
+
+    def _background_load(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Reloading revoked tokens failed")
+        finally:
+            self._reloading = False
+
+    def load(self):
+        """Replace the in-memory set with the unexpired revocations in the database"""
+        now = datetime.utcnow()
+        db = self.session_factory()
+        try:
+            jtis = dict(db.execute(
+                select(RevokedToken.jti, RevokedToken.expires_at).where(RevokedToken.expires_at > now)
+            ).all())
+        finally:
+            db.close()
+        with self._lock:
+            # Keep local revocations committed while the rows were being read
+            jtis.update((jti, expires_at) for jti, expires_at in self._jtis.items() if expires_at > now)
+            self._jtis = jtis
+            self._loaded = True
+
+    def revoke(self, db: Session, jti: str, token_type: str, expires_at: datetime, subject: Optional[str] = None):
+        """Add a revocation to `db`'s transaction; it takes effect on commit"""
+        db.merge(RevokedToken(jti=jti, token_type=token_type, subject=subject, expires_at=expires_at))
+
+    def consume(self, db: Session, jti: str, token_type: str, expires_at: datetime, subject: Optional[str] = None):
+        """Spend a single-use token in `db`'s transaction.
+
+        The commit raises IntegrityError when the token was already spent.
+        """
+        db.add(RevokedToken(jti=jti, token_type=token_type, subject=subject, expires_at=expires_at))
+
+    def prune(self) -> int:
+        """Drop revocations of tokens that have expired"""
+        db = self.session_factory()
+        try:
+            deleted = db.execute(
+                delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow())
+            ).rowcount
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    def committed(self, changes):
+        """Commit hook: apply this worker's revocations locally and tell the others"""
+        with self._lock:
+            self._jtis.update(
+                (row["jti"], row["expires_at"]) for operation, row in changes
+                if operation != "delete" and "jti" in row
+            )
+        revocations_channel.publish()
+
+
+revoked_tokens = RevocationList(changes=revocations_channel.subscribe())
+on_commit(RevokedToken, revoked_tokens.committed)
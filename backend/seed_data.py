@@ -2,6 +2,7 @@ import json
 from datetime import datetime, timedelta
 from database import SessionLocal, init_db, User, Category, Item, Rental, Review, Transaction, Message
 from auth import get_password_hash
+from pricing import rental_charges
 import random
 import base64
 
@@ -98,6 +99,7 @@ SAMPLE_USERS = [
         "phone": "+1-609-555-0100",
         "bio": "Demo account for testing Campus Rentals!",
         "verified": True,
+        "is_admin": True,
     }
 ]
 
@@ -205,6 +207,7 @@ def seed_database():
             phone=user_data.get("phone"),
             bio=user_data.get("bio"),
             verified=user_data.get("verified", False),
+            is_admin=user_data.get("is_admin", False),
             rating=round(random.uniform(4.3, 5.0), 1),
             total_ratings=random.randint(5, 25),
             latitude=location["lat"],
@@ -265,20 +268,13 @@ def seed_database():
         end_date = datetime.utcnow() - timedelta(days=days_ago)
         rental_days = (end_date - start_date).days
 
-        total_cost = item.daily_rate * rental_days
-        platform_fee = total_cost * 0.15
-        owner_earnings = total_cost - platform_fee
-
         rental = Rental(
             item_id=item.id,
             renter_id=renter.id,
             owner_id=owner.id,
             start_date=start_date,
             end_date=end_date,
-            total_cost=total_cost,
-            deposit_amount=item.deposit,
-            platform_fee=platform_fee,
-            owner_earnings=owner_earnings,
+            **rental_charges(item, rental_days),
             status="completed",
             approved_at=start_date - timedelta(days=1),
             pickup_verified_at=start_date,
@@ -293,7 +289,7 @@ def seed_database():
         transaction = Transaction(
             user_id=owner.id,
             rental_id=rental.id,
-            amount=owner_earnings,
+            amount=rental.owner_earnings,
             type="earning",
             status="completed",
             description=f"Earned from renting '{item.title}'"
@@ -328,20 +324,13 @@ def seed_database():
         end_date = start_date + timedelta(days=random.randint(2, 5))
         rental_days = (end_date - start_date).days
 
-        total_cost = item.daily_rate * rental_days
-        platform_fee = total_cost * 0.15
-        owner_earnings = total_cost - platform_fee
-
         rental = Rental(
             item_id=item.id,
             renter_id=renter.id,
             owner_id=owner.id,
             start_date=start_date,
             end_date=end_date,
-            total_cost=total_cost,
-            deposit_amount=item.deposit,
-            platform_fee=platform_fee,
-            owner_earnings=owner_earnings,
+            **rental_charges(item, rental_days),
             status=status,
             approved_at=datetime.utcnow() if status in ["approved", "active"] else None,
             pickup_qr=f"PICKUP-{random.randint(100000, 999999)}",
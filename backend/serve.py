@@ -0,0 +1,46 @@
+"""Production entry point running the API on several worker processes.
+
+    python serve.py --workers 4
+
+Each worker is a separate uvicorn process with its own in-process caches;
+they coordinate through the backend named by SHARED_STATE_URL, which
+defaults to a SQLite file next to the database when more than one worker
+is started.
+"""
+import argparse
+import os
+
+import uvicorn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument(
+        "--workers", type=int,
+        default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+        help="worker processes (default: WEB_CONCURRENCY or CPU count)"
+    )
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        os.environ.setdefault("SHARED_STATE_URL", "sqlite:///./shared_state.db")
+
+    # Create the schema once here rather than racing in every worker's startup
+    from database import init_db
+    init_db()
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+        access_log=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""State shared between worker processes.
+
+In-process caches (the nearby-items index, coordinate cache, ...) stay
+local to each worker, and the workers coordinate through versioned
+channels. A worker that changes the data behind a cache bumps the channel,
+and the other workers notice the new version and drop their copy.
+
+Keys set with a TTL are swept out by `set`, at most once every
+EXPIRY_SWEEP_SECONDS per process, so short-lived markers (one per writing
+client for read-your-writes) don't pile up.
+
+SHARED_STATE_URL picks the backend:
+    local                       single process, nothing is shared (default)
+    sqlite:///./shared_state.db a small SQLite file every worker on the host opens
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", "local")
+# How long a worker trusts its last version read before asking the backend again
+VERSION_CHECK_SECONDS = float(os.getenv("SHARED_STATE_CHECK_SECONDS", "0.5"))
+EXPIRY_SWEEP_SECONDS = 30.0
+
+
+class LocalState:
+    """Single-process backend; versions only change when this process bumps them"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._values = {}
+        self._swept_at = time.monotonic()
+
+    def version(self, channel: str) -> int:
+        return self._versions.get(channel, 0)
+
+    def bump(self, channel: str) -> int:
+        with self._lock:
+            self._versions[channel] = self._versions.get(channel, 0) + 1
+            return self._versions[channel]
+
+    def get(self, key: str) -> Optional[str]:
+        value, expires_at = self._values.get(key, (None, None))
+        if expires_at is not None and expires_at < time.time():
+            with self._lock:
+                if self._values.get(key, (None, None))[1] == expires_at:
+                    del self._values[key]
+            return None
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        now = time.time()
+        with self._lock:
+            self._values[key] = (value, now + ttl if ttl else None)
+            if time.monotonic() - self._swept_at >= EXPIRY_SWEEP_SECONDS:
+                self._values = {
+                    name: entry for name, entry in self._values.items() if entry[1] is None or entry[1] >= now
+                }
+                self._swept_at = time.monotonic()
+
+
+class SQLiteState:
+    """Backend for several workers on one host, stored in a WAL-mode SQLite file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._swept_at = time.monotonic()
+        db = self._connection()
+        db.execute("CREATE TABLE IF NOT EXISTS versions (channel TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS ix_kv_expires_at ON kv (expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def version(self, channel: str) -> int:
+        row = self._connection().execute(
+            "SELECT version FROM versions WHERE channel = ?", (channel,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, channel: str) -> int:
+        return self._connection().execute(
+            "INSERT INTO versions (channel, version) VALUES (?, 1) "
+            "ON CONFLICT(channel) DO UPDATE SET version = version + 1 RETURNING version",
+            (channel,)
+        ).fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at >= ?)",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        now = time.time()
+        db = self._connection()
+        db.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, now + ttl if ttl else None)
+        )
+        if time.monotonic() - self._swept_at >= EXPIRY_SWEEP_SECONDS:
+            self._swept_at = time.monotonic()
+            db.execute("DELETE FROM kv WHERE expires_at < ?", (now,))
+
+
+def create_shared_state(url: str = SHARED_STATE_URL):
+    if url == "local":
+        return LocalState()
+    if url.startswith("sqlite:///"):
+        return SQLiteState(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported SHARED_STATE_URL: {url}")
+
+
+shared_state = create_shared_state()
+
+
+class Channel:
+    """A named version counter shared by all workers.
+
+    Local caches `subscribe()` to a channel and check `changed()` before
+    serving; a writer calls `publish()` after changing the underlying data.
+    Publishes made by this process do not mark its own subscriptions as
+    changed, since local caches are expected to apply local writes directly.
+    """
+
+    def __init__(self, name: str, state=None):
+        self.name = name
+        self.state = state or shared_state
+        self._lock = threading.Lock()
+        self._version = self.state.version(name)
+        self._subscriptions = []
+
+    def subscribe(self) -> "Subscription":
+        subscription = Subscription(self)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def publish(self):
+        with self._lock:
+            version = self.state.bump(self.name)
+            if version == self._version + 1:
+                for subscription in self._subscriptions:
+                    if subscription.seen == self._version:
+                        subscription.seen = version
+            self._version = max(self._version, version)
+
+
+class Subscription:
+    def __init__(self, channel: Channel):
+        self.channel = channel
+        self.seen = channel._version
+        self._checked_at = time.monotonic()
+
+    def changed(self) -> bool:
+        """True when another worker has published since the last check"""
+        now = time.monotonic()
+        if now - self._checked_at < VERSION_CHECK_SECONDS:
+            return False
+        self._checked_at = now
+        channel = self.channel
+        version = channel.state.version(channel.name)
+        with channel._lock:
+            channel._version = max(channel._version, version)
+            if version == self.seen:
+                return False
+            self.seen = version
+            return True
@@ -0,0 +1,193 @@
+"""Static asset serving with content fingerprints and long-lived caching.
+
+Image URLs stored in the database (e.g. http://localhost:8000/static/images/camera/1.jpg)
+are rewritten on the way out to a fingerprinted form such as
+`<STATIC_BASE_URL>/images/camera/1.3f2a9c1b7d4e.jpg`, where the hash is taken
+from the file's contents. A fingerprinted URL never changes meaning, so it is
+served with an immutable Cache-Control. STATIC_BASE_URL points the URLs at a
+CDN without touching stored data; it defaults to the URL's own `/static` prefix.
+Only root-relative `/static/` URLs and those on one of PUBLIC_ORIGINS are
+ours; images hosted anywhere else pass through untouched.
+
+Digests are computed at start-up (`load`, off the event loop) and rewriting
+URLs only reads the manifest. A file that is new, or hasn't been checked for
+RECHECK_SECONDS, is re-hashed in a background thread; until then its URL
+keeps the digest it had, or goes out unfingerprinted.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+STATIC_DIR = os.getenv("STATIC_DIR", "static")
+STATIC_BASE_URL = os.getenv("STATIC_BASE_URL", "").rstrip("/")
+# Origins the stored image URLs point at when they are absolute
+PUBLIC_ORIGINS = [
+    origin.strip().rstrip("/") for origin in os.getenv("PUBLIC_ORIGINS", "http://localhost:8000").split(",")
+    if origin.strip()
+]
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "public, max-age=0, must-revalidate"
+# How long a computed digest is trusted before the file is stat'ed again
+RECHECK_SECONDS = 5.0
+
+_FINGERPRINTED = re.compile(r"^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<ext>\.[^./]+)$")
+
+logger = logging.getLogger("campus_rentals.static_assets")
+
+
+def _static_url_pattern(origins: List[str]) -> re.Pattern:
+    hosts = "|".join(re.escape(origin) for origin in origins)
+    return re.compile(rf"^(?P<prefix>(?:{hosts})?/static)/(?P<path>[^?#]+)$" if hosts
+                      else r"^(?P<prefix>/static)/(?P<path>[^?#]+)$")
+
+
+class AssetManifest:
+    """Content digests of files under the static directory, refreshed on change"""
+
+    def __init__(self, directory: str = STATIC_DIR, origins: List[str] = PUBLIC_ORIGINS):
+        self.directory = os.path.realpath(directory)
+        self._static_url = _static_url_pattern(origins)
+        self._lock = threading.Lock()
+        # relpath -> (mtime_ns, size, digest or None if missing, checked_at)
+        self._entries: Dict[str, Tuple[int, int, Optional[str], float]] = {}
+        self._stale: Set[str] = set()
+        self._refreshing = False
+
+    def resolve(self, relpath: str) -> Optional[str]:
+        """Absolute path of `relpath` if it is a file inside the static directory"""
+        path = os.path.realpath(os.path.join(self.directory, relpath))
+        if not path.startswith(self.directory + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def load(self):
+        """Digest every file under the static directory; blocking"""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                self.digest(os.path.relpath(os.path.join(root, name), self.directory))
+
+    def digest(self, relpath: str) -> Optional[str]:
+        """Current digest of `relpath`, hashing it if it changed; blocking"""
+        now = time.monotonic()
+        entry = self._entries.get(relpath)
+        if entry is not None and now - entry[3] < RECHECK_SECONDS:
+            return entry[2]
+
+        path = self.resolve(relpath)
+        if path is None:
+            with self._lock:
+                self._entries[relpath] = (0, 0, None, now)
+            return None
+        stat = os.stat(path)
+        if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+            digest = entry[2]
+        else:
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    sha.update(chunk)
+            digest = sha.hexdigest()[:12]
+        with self._lock:
+            self._entries[relpath] = (stat.st_mtime_ns, stat.st_size, digest, now)
+        return digest
+
+    def cached_digest(self, relpath: str) -> Optional[str]:
+        """Digest from the manifest without touching the disk; stale entries are refreshed behind"""
+        entry = self._entries.get(relpath)
+        if entry is None or time.monotonic() - entry[3] >= RECHECK_SECONDS:
+            self._refresh_in_background(relpath)
+        return entry[2] if entry is not None else None
+
+    def _refresh_in_background(self, relpath: str):
+        with self._lock:
+            self._stale.add(relpath)
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_stale, name="asset-digests", daemon=True).start()
+
+    def _refresh_stale(self):
+        while True:
+            with self._lock:
+                if not self._stale:
+                    self._refreshing = False
+                    return
+                relpath = self._stale.pop()
+            try:
+                self.digest(relpath)
+            except OSError:
+                logger.exception("Digesting static asset %s failed", relpath)
+
+    def url(self, url: str) -> str:
+        """Fingerprinted (and CDN-based, if configured) form of a static asset URL"""
+        match = self._static_url.match(url)
+        if not match:
+            return url
+        relpath = match.group("path")
+        digest = self.cached_digest(relpath)
+        if digest is not None:
+            stem, ext = os.path.splitext(relpath)
+            relpath = f"{stem}.{digest}{ext}"
+        return f"{STATIC_BASE_URL or match.group('prefix')}/{relpath}"
+
+
+manifest = AssetManifest()
+
+
+def asset_url(url: str) -> str:
+    return manifest.url(url)
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag in tags or "*" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def serve_static(path: str, request: Request) -> Response:
+    """Serve a static file, honouring fingerprints, conditional and range requests.
+
+    Range handling comes from FileResponse, which streams the file in chunked
+    reads. Uvicorn (what serve.py runs) doesn't offer the ASGI pathsend
+    extension, so there is no sendfile/zero-copy path; put a CDN or reverse
+    proxy in front (STATIC_BASE_URL) if static traffic matters.
+    """
+    requested_digest = None
+    match = _FINGERPRINTED.match(path)
+    if match and manifest.resolve(path) is None:
+        path = match.group("stem") + match.group("ext")
+        requested_digest = match.group("digest")
+
+    file_path = manifest.resolve(path)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    digest = manifest.digest(path)
+    stat = os.stat(file_path)
+    etag = f'"{digest}"'
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat.st_mtime, usegmt=True),
+        # An outdated fingerprint gets the current file, but must not be cached for good
+        "cache-control": IMMUTABLE_CACHE if requested_digest == digest else REVALIDATE_CACHE,
+    }
+    if _not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(file_path, headers=headers, stat_result=stat)
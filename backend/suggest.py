@@ -0,0 +1,185 @@
+"""Search-as-you-type suggestions over item titles and category names.
+
+Titles and category names are split into normalized tokens (lowercase,
+accents stripped, alphanumeric runs) and kept in one sorted list of
+(token, entry) pairs. A prefix lookup is a `bisect` to the first token at or
+after the prefix and a scan while tokens still start with it, so the cost
+follows the number of matches rather than the number of items.
+
+Listings with the same normalized title collapse into one suggestion
+counting them; categories count their available items. Suggestions whose
+text starts with the query rank first, then by count, then shorter text.
+Every query token but the last must be a full-word prefix of the
+suggestion too, so "ti 8" finds "TI-84 Calculator".
+
+The index is built on first use and item commits are folded in by a hook,
+so a new listing is suggested as soon as `create_item` commits. Other
+workers' item writes arrive on the `items` channel and trigger a rebuild;
+category changes also rebuild, in this worker only, since categories are
+seeded rather than edited at runtime.
+"""
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from database import Category, Item, item_categories, on_commit
+from geo import items_channel
+from shared_state import Subscription
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    folded = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode().lower()
+    return _TOKEN.findall(folded)
+
+
+class SuggestIndex:
+    def __init__(self, changes: Optional[Subscription] = None):
+        self.changes = changes
+        self._lock = threading.RLock()
+        self._loaded = False
+        # Sorted (token, entry) pairs; entries are ("title", normalized title) or ("category", id)
+        self._terms: List[Tuple[str, tuple]] = []
+        # entry -> [display text, tokens, count]
+        self._entries: Dict[tuple, list] = {}
+        # item_id -> (title entry, category ids)
+        self._items: Dict[int, Tuple[tuple, frozenset]] = {}
+
+    def ensure_loaded(self, db: Session):
+        if self.changes is not None and self.changes.changed():
+            self.invalidate()
+        if self._loaded:
+            return
+        categories = db.query(Category.id, Category.name).all()
+        items = db.query(Item.id, Item.title).filter(Item.available == True).all()
+        item_category_ids: Dict[int, set] = {}
+        for item_id, category_id in db.query(item_categories.c.item_id, item_categories.c.category_id):
+            item_category_ids.setdefault(item_id, set()).add(category_id)
+        with self._lock:
+            self._terms = []
+            self._entries.clear()
+            self._items.clear()
+            for category_id, name in categories:
+                self._entries[("category", category_id)] = [name, tuple(tokenize(name)), 0]
+            for item_id, title in items:
+                self._add(item_id, title, item_category_ids.get(item_id, ()))
+            # One sort instead of an insort per token
+            self._terms = sorted(
+                (token, entry) for entry, (_, tokens, _) in self._entries.items() for token in set(tokens)
+            )
+            self._loaded = True
+
+    def invalidate(self):
+        """Force a full rebuild on the next query"""
+        with self._lock:
+            self._loaded = False
+
+    def _index(self, entry: tuple):
+        for token in set(self._entries[entry][1]):
+            insort(self._terms, (token, entry))
+
+    def _unindex(self, entry: tuple):
+        for token in set(self._entries[entry][1]):
+            index = bisect_left(self._terms, (token, entry))
+            if index < len(self._terms) and self._terms[index] == (token, entry):
+                del self._terms[index]
+
+    def _add(self, item_id: int, title: str, category_ids):
+        self._remove(item_id)
+        tokens = tuple(tokenize(title))
+        if not tokens:
+            return
+        entry = ("title", " ".join(tokens))
+        if entry in self._entries:
+            self._entries[entry][2] += 1
+        else:
+            self._entries[entry] = [title.strip(), tokens, 1]
+            if self._loaded:
+                self._index(entry)
+        category_ids = frozenset(category_ids)
+        for category_id in category_ids:
+            if ("category", category_id) in self._entries:
+                self._entries[("category", category_id)][2] += 1
+        self._items[item_id] = (entry, category_ids)
+
+    def _remove(self, item_id: int):
+        known = self._items.pop(item_id, None)
+        if known is None:
+            return
+        entry, category_ids = known
+        self._entries[entry][2] -= 1
+        if not self._entries[entry][2]:
+            self._unindex(entry)
+            del self._entries[entry]
+        for category_id in category_ids:
+            if ("category", category_id) in self._entries:
+                self._entries[("category", category_id)][2] -= 1
+
+    def apply_changes(self, changes):
+        """Commit hook: fold item inserts/updates/deletes into the index"""
+        with self._lock:
+            if not self._loaded:
+                return
+            for operation, row in changes:
+                item_id = row.get("id")
+                if operation == "delete" or row.get("available") is False:
+                    self._remove(item_id)
+                    continue
+                known = self._items.get(item_id)
+                if operation == "update" and known is None and "available" not in row:
+                    # An unavailable item changed but stayed unavailable
+                    continue
+                if operation == "update" and known is not None and "title" not in row \
+                        and "categories_ids" not in row:
+                    continue
+                title = row.get("title", self._entries[known[0]][0] if known else None)
+                # A new item whose categories were never touched has none
+                category_ids = row.get("categories_ids", known[1] if known else
+                                       () if operation == "insert" else None)
+                if title is None or category_ids is None:
+                    # An unknown item became available without enough loaded state; rebuild lazily
+                    self._loaded = False
+                    return
+                self._add(item_id, title, category_ids)
+
+    def suggest(self, db: Session, query: str, limit: int = 8) -> List[dict]:
+        """Ranked suggestions for a partially typed query"""
+        words = tokenize(query)
+        if not words:
+            return []
+        *complete, prefix = words
+        phrase = " ".join(words)
+        self.ensure_loaded(db)
+        with self._lock:
+            candidates = set()
+            index = bisect_left(self._terms, (prefix,))
+            while index < len(self._terms) and self._terms[index][0].startswith(prefix):
+                candidates.add(self._terms[index][1])
+                index += 1
+
+            ranked = []
+            for entry in candidates:
+                text, tokens, count = self._entries[entry]
+                if not count or not all(any(token.startswith(word) for token in tokens) for word in complete):
+                    continue
+                leading = not " ".join(tokens).startswith(phrase)
+                ranked.append(((leading, -count, len(text), text.lower(), entry[0]), entry, text, count))
+
+            suggestions = []
+            for _, entry, text, count in heapq.nsmallest(limit, ranked, key=lambda candidate: candidate[0]):
+                suggestion = {"type": entry[0], "text": text, "count": count}
+                if entry[0] == "category":
+                    suggestion["category_id"] = entry[1]
+                suggestions.append(suggestion)
+            return suggestions
+
+
+search_suggestions = SuggestIndex(changes=items_channel.subscribe())
+on_commit(Item, search_suggestions.apply_changes)
+on_commit(Category, lambda changes: search_suggestions.invalidate())
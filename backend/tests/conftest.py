@@ -0,0 +1,112 @@
+"""Shared fixtures: the app against a throwaway SQLite database.
+
+The environment is set before any backend module is imported, since they
+read their configuration at import time.
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix="campus-rentals-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_workdir, 'test.db')}")
+os.environ.setdefault("EVENT_WAL_DIR", os.path.join(_workdir, "event_wal"))
+os.environ.setdefault("MESSAGE_ARCHIVE_PATH", os.path.join(_workdir, "message_archive.db"))
+os.environ.setdefault("NOTIFICATION_TRANSPORT", f"file://{os.path.join(_workdir, 'outbox.mbox')}")
+# Tests share one client address; the limiter has its own tests
+os.environ.setdefault("RATE_LIMIT_PER_SECOND", "100000")
+os.environ.setdefault("RATE_LIMIT_BURST", "100000")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+from database import Category, Item, Rental, SessionLocal, User, init_db
+
+_emails = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def app():
+    init_db()
+    db = SessionLocal()
+    try:
+        if not db.query(Category).count():
+            db.add_all([Category(name="Electronics", icon="💻"), Category(name="Tools", icon="🔧")])
+            db.commit()
+    finally:
+        db.close()
+    from main import app
+    return app
+
+
+@pytest.fixture
+def client(app):
+    # Not used as a context manager, so background services stay off
+    return TestClient(app)
+
+
+@pytest.fixture
+def db(app):
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def register(client):
+    """Register a fresh user; returns the login response body"""
+    def register_user(full_name="Test User"):
+        response = client.post("/api/auth/register", json={
+            "email": f"user{next(_emails)}-{os.getpid()}@test.edu",
+            "password": "password123",
+            "full_name": full_name,
+        })
+        assert response.status_code == 200, response.text
+        return response.json()
+    return register_user
+
+
+def auth_headers(tokens: dict) -> dict:
+    return {"Authorization": f"Bearer {tokens['access_token']}"}
+
+
+@pytest.fixture
+def make_user(db):
+    def make(**values):
+        user = User(**{"email": f"user{next(_emails)}@test.edu", "hashed_password": "-",
+                       "full_name": "Test User", **values})
+        db.add(user)
+        db.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def make_item(db, make_user):
+    def make(**values):
+        owner_id = values.pop("owner_id", None) or make_user().id
+        item = Item(**{"owner_id": owner_id, "title": "Test Item", "description": "For tests",
+                       "daily_rate": 10.0, "deposit": 50.0, "available": True,
+                       "latitude": 40.34, "longitude": -74.65, **values})
+        db.add(item)
+        db.commit()
+        return item
+    return make
+
+
+@pytest.fixture
+def make_rental(db, make_user):
+    def make(item, start_date, end_date, **values):
+        renter_id = values.pop("renter_id", None) or make_user().id
+        rental = Rental(**{"item_id": item.id, "renter_id": renter_id, "owner_id": item.owner_id,
+                           "start_date": start_date, "end_date": end_date, "total_cost": 10.0,
+                           "deposit_amount": 50.0, "platform_fee": 1.0, "owner_earnings": 9.0,
+                           "status": "approved", **values})
+        db.add(rental)
+        db.commit()
+        return rental
+    return make
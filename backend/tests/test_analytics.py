@@ -0,0 +1,110 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import analytics
+from analytics import UNCATEGORIZED, WATERMARK_NAME, read_rollups, refresh_rollups
+from database import Category, Rental, RollupWatermark
+
+
+def _snapshot(db):
+    db.expire_all()
+    return {
+        (row.period, row.bucket_start, row.category_id): tuple(getattr(row, name) for name in analytics.MEASURES)
+        for period in ("day", "week") for row in read_rollups(db, period)
+    }
+
+
+def _settled():
+    # updated_at is compared against a watermark taken from the clock
+    time.sleep(0.01)
+
+
+def test_incremental_refresh_matches_a_full_rebuild(db, make_item, make_rental, monkeypatch):
+    monkeypatch.setattr(analytics, "ROLLUP_SETTLE_SECONDS", 0)
+    category = db.query(Category).first()
+    tagged = make_item()
+    tagged.categories = [category]
+    db.commit()
+    untagged = make_item()
+    base = datetime(2031, 3, 3, 10)  # a Monday
+
+    make_rental(tagged, base, base + timedelta(days=1), total_cost=30.0, platform_fee=3.0, owner_earnings=27.0)
+    approved = make_rental(untagged, base + timedelta(days=1), base + timedelta(days=2))
+    _settled()
+    refresh_rollups(db)
+
+    # Changes after the first refresh: new rentals in this week and the next, and a status change
+    make_rental(untagged, base + timedelta(days=2, hours=5), base + timedelta(days=3), status="completed",
+                total_cost=20.0, platform_fee=2.0, owner_earnings=18.0)
+    make_rental(untagged, base + timedelta(days=8), base + timedelta(days=9))
+    approved.status = "cancelled"
+    db.commit()
+    _settled()
+    assert refresh_rollups(db) >= 2
+    incremental = _snapshot(db)
+
+    refresh_rollups(db, full=True)
+    assert incremental == _snapshot(db)
+
+    week = incremental[("week", base.replace(hour=0), UNCATEGORIZED)]
+    # (rentals, booked, active, completed, cancelled)
+    assert week[:5] == (2, 1, 0, 1, 1)
+    assert incremental[("week", base.replace(hour=0) + timedelta(days=7), UNCATEGORIZED)][:2] == (1, 1)
+    assert incremental[("day", base.replace(hour=0), category.id)][5] == 30.0
+
+
+def test_rentals_committed_late_are_picked_up_after_the_settle_window(db, make_item, make_rental, monkeypatch):
+    item = make_item()
+    start = datetime(2031, 6, 2, 9)
+    rental = make_rental(item, start, start + timedelta(days=1))
+    monkeypatch.setattr(analytics, "ROLLUP_SETTLE_SECONDS", 5)
+    refresh_rollups(db)
+    # Still inside the settle window, so not in this refresh
+    assert ("day", start.replace(hour=0), UNCATEGORIZED) not in _snapshot(db)
+
+    # As if its transaction committed late, with an updated_at from before the last refresh's clock
+    mark = db.get(RollupWatermark, WATERMARK_NAME)
+    db.query(Rental).filter(Rental.id == rental.id).update(
+        {"updated_at": mark.watermark + timedelta(seconds=1)}, synchronize_session=False
+    )
+    db.commit()
+    monkeypatch.setattr(analytics, "ROLLUP_SETTLE_SECONDS", 0)
+    _settled()
+    refresh_rollups(db)
+    assert _snapshot(db)[("day", start.replace(hour=0), UNCATEGORIZED)][0] == 1
+
+
+def test_one_worker_refreshes_at_a_time(db, monkeypatch):
+    refresh_rollups(db)
+    mark = db.get(RollupWatermark, WATERMARK_NAME)
+    mark.locked_by = "another-worker"
+    mark.locked_until = datetime.utcnow() + timedelta(minutes=1)
+    db.commit()
+    before = mark.watermark
+
+    assert refresh_rollups(db) is None
+    db.expire_all()
+    assert db.get(RollupWatermark, WATERMARK_NAME).watermark == before
+
+    # A crashed worker's lease lapses
+    db.get(RollupWatermark, WATERMARK_NAME).locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    assert refresh_rollups(db) is not None
+    db.expire_all()
+    mark = db.get(RollupWatermark, WATERMARK_NAME)
+    assert (mark.locked_by, mark.locked_until) == (None, None)
+    assert mark.watermark > before
+
+
+def test_a_failed_refresh_releases_its_lease(db, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(analytics, "_insert_rows", broken)
+    monkeypatch.setattr(analytics, "_rebuild_weeks", broken)
+    with pytest.raises(RuntimeError):
+        refresh_rollups(db, full=True)
+    db.expire_all()
+    assert db.get(RollupWatermark, WATERMARK_NAME).locked_by is None
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from archive import MessageArchive, MessageArchiver, message_archive
+from auth import create_access_token
+from database import Message, SessionLocal
+
+
+@pytest.fixture
+def quiet_thread(db, make_user, make_item, make_rental):
+    """A completed rental whose two messages are long past the archive cutoff"""
+    def make(count=2):
+        old = datetime.utcnow() - timedelta(days=90)
+        renter = make_user()
+        item = make_item()
+        rental = make_rental(item, old - timedelta(days=3), old, renter_id=renter.id,
+                             status="completed", updated_at=old)
+        messages = [
+            Message(rental_id=rental.id, sender_id=renter.id, receiver_id=item.owner_id,
+                    content=f"message {n}", created_at=old + timedelta(minutes=n))
+            for n in range(count)
+        ]
+        db.add_all(messages)
+        db.commit()
+        return renter, rental, messages
+    return make
+
+
+def _archiver(archive):
+    return MessageArchiver(archive, session_factory=SessionLocal, interval=0, batch_size=1000)
+
+
+def _hot_ids(db, rental_id):
+    db.expire_all()
+    return {message.id for message in db.query(Message).filter(Message.rental_id == rental_id)}
+
+
+def test_archived_threads_are_read_back_through_the_api(client, db, quiet_thread, make_user):
+    renter, rental, messages = quiet_thread()
+    assert _archiver(message_archive).run_once() >= 2
+    assert _hot_ids(db, rental.id) == set()
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': renter.email})}"}
+    threads = client.get("/api/messages/archive", headers=headers).json()["threads"]
+    assert [(thread["rental_id"], thread["message_count"]) for thread in threads] == [(rental.id, 2)]
+
+    thread = client.get(f"/api/messages/archive?rental_id={rental.id}", headers=headers).json()
+    # Newest first, with the sender attached
+    assert [message["content"] for message in thread["messages"]] == ["message 1", "message 0"]
+    assert thread["messages"][0]["sender"]["id"] == renter.id
+
+    stranger = {"Authorization": f"Bearer {create_access_token({'sub': make_user().email})}"}
+    assert client.get(f"/api/messages/archive?rental_id={rental.id}", headers=stranger).status_code == 403
+
+
+def test_archiving_a_thread_again_merges_by_message_id(tmp_path, db, quiet_thread):
+    archive = MessageArchive(str(tmp_path / "archive.db"))
+    renter, rental, messages = quiet_thread()
+    first = {"renter_id": renter.id, "owner_id": rental.owner_id, "messages": [
+        {"id": message.id, "sender_id": renter.id, "receiver_id": rental.owner_id,
+         "content": message.content, "created_at": message.created_at.isoformat(), "read": False}
+        for message in messages
+    ]}
+    # As if a crash left the first message in both places
+    archive.store({rental.id: {**first, "messages": first["messages"][:1]}})
+    _archiver(archive).run_once()
+
+    thread = archive.thread(rental.id)
+    assert [message["id"] for message in thread["messages"]] == [message.id for message in messages]
+    assert thread["message_count"] == 2
+
+    archive.store({rental.id: first})
+    assert archive.thread(rental.id)["message_count"] == 2
+
+
+def test_nothing_is_deleted_when_the_archive_write_fails(tmp_path, db, quiet_thread, monkeypatch):
+    archive = MessageArchive(str(tmp_path / "archive.db"))
+    renter, rental, messages = quiet_thread()
+
+    def fail(threads):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(archive, "store", fail)
+    with pytest.raises(OSError):
+        _archiver(archive).run_once()
+    assert _hot_ids(db, rental.id) == {message.id for message in messages}
+
+
+def test_messages_arriving_mid_run_stay_in_the_hot_table(tmp_path, db, quiet_thread, monkeypatch):
+    archive = MessageArchive(str(tmp_path / "archive.db"))
+    renter, rental, messages = quiet_thread()
+    archived_ids = [message.id for message in messages]
+    store = archive.store
+    late = []
+
+    def store_then_receive(threads):
+        store(threads)
+        session = SessionLocal()
+        try:
+            message = Message(rental_id=rental.id, sender_id=rental.owner_id, receiver_id=renter.id,
+                              content="late reply")
+            session.add(message)
+            session.commit()
+            late.append(message.id)
+        finally:
+            session.close()
+
+    monkeypatch.setattr(archive, "store", store_then_receive)
+    _archiver(archive).run_once()
+
+    assert _hot_ids(db, rental.id) == set(late)
+    assert [message["id"] for message in archive.thread(rental.id)["messages"]] == archived_ids
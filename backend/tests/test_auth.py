@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+from conftest import auth_headers
+
+import auth
+from auth import create_access_token, decode_token
+from database import RevokedToken
+from revocation import revoked_tokens
+
+
+def test_refresh_rotates_and_rejects_replay(client, register):
+    tokens = register()
+    rotated = client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert rotated.status_code == 200
+    assert rotated.json()["refresh_token"] != tokens["refresh_token"]
+    assert client.get("/api/auth/me", headers=auth_headers(rotated.json())).status_code == 200
+
+    replay = client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert replay.status_code == 401
+    assert client.post("/api/auth/refresh", json={"refresh_token": rotated.json()["refresh_token"]}).status_code == 200
+
+
+def test_refresh_is_single_use_even_when_the_denylist_is_stale(client, register, monkeypatch):
+    # Another worker that hasn't reloaded its set yet: only the database can tell
+    tokens = register()
+    monkeypatch.setattr(revoked_tokens, "is_revoked", lambda jti: False)
+    first = client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    second = client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert first.status_code == 200
+    assert second.status_code == 401
+
+
+def test_refresh_rejects_access_tokens_and_garbage(client, register):
+    tokens = register()
+    assert client.post("/api/auth/refresh", json={"refresh_token": tokens["access_token"]}).status_code == 401
+    assert client.post("/api/auth/refresh", json={"refresh_token": "not-a-jwt"}).status_code == 401
+
+
+def test_logout_revokes_access_and_refresh_tokens(client, register):
+    tokens = register()
+    response = client.post("/api/auth/logout", json={"refresh_token": tokens["refresh_token"]},
+                           headers=auth_headers(tokens))
+    assert response.status_code == 200
+    assert client.get("/api/auth/me", headers=auth_headers(tokens)).status_code == 401
+    assert client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+
+def test_decode_checks_type_expiry_and_key(monkeypatch):
+    token = create_access_token({"sub": "someone@test.edu"})
+    assert decode_token(token)["sub"] == "someone@test.edu"
+    assert decode_token(token, "refresh") is None
+    assert decode_token(create_access_token({"sub": "x@test.edu"}, timedelta(seconds=-1))) is None
+
+    monkeypatch.setattr(auth, "SIGNING_KEYS", {"other": "another-secret"})
+    assert decode_token(token) is None
+
+
+def test_denylist_reloads_in_the_background(db):
+    revoked_tokens.load()
+    # Written by "another worker": the row exists but this worker's set hasn't seen it
+    db.add(RevokedToken(jti="elsewhere", token_type="access", expires_at=datetime.utcnow() + timedelta(hours=1)))
+    db.commit()
+    revoked_tokens._jtis.pop("elsewhere", None)
+    assert not revoked_tokens.is_revoked("elsewhere")
+
+    revoked_tokens._background_load()
+    assert revoked_tokens.is_revoked("elsewhere")
+
+
+_LAZY_IMPORTS = """
+import sys
+import auth
+assert "passlib" not in sys.modules and "jose" not in sys.modules, "imported eagerly"
+hashed = auth.get_password_hash("secret")
+assert "passlib" in sys.modules and "jose" not in sys.modules
+assert auth.decode_token(auth.create_access_token({"sub": "a@example.com"}))["sub"] == "a@example.com"
+assert "jose" in sys.modules
+"""
+
+
+def test_passlib_and_jose_load_on_first_use():
+    # A fresh interpreter, since this session has imported both already
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", _LAZY_IMPORTS], cwd=backend,
+                            env=os.environ.copy(), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from availability import OccupancyIndex, as_utc, day_start, item_availability
+from database import AvailabilityBlock, Rental, SessionLocal
+from lifecycle import LifecycleSweeper
+
+
+@pytest.fixture
+def today():
+    return day_start(datetime.utcnow())
+
+
+def test_days_touched_by_a_booking_are_occupied(db, make_item, make_rental, today):
+    item = make_item()
+    # 10:00 on day 2 until midnight ending day 3; midnight itself is not occupied
+    make_rental(item, today + timedelta(days=2, hours=10), today + timedelta(days=4))
+    # One second into day 6 still takes day 6
+    make_rental(item, today + timedelta(days=5, hours=23), today + timedelta(days=6, seconds=1))
+    index = OccupancyIndex(horizon_days=30)
+
+    assert index.calendar(db, item.id, today, 8) == [False, False, True, True, False, True, True, False]
+    assert index.free(db, [item.id], today + timedelta(days=4), today + timedelta(days=5)).tolist() == [True]
+    assert index.free(db, [item.id], today + timedelta(days=3, hours=23), today + timedelta(days=4)).tolist() == [False]
+    assert index.free(db, [item.id], today, today + timedelta(days=2)).tolist() == [True]
+    assert index.free(db, [item.id], today + timedelta(days=7), today + timedelta(days=30)).tolist() == [True]
+
+
+def test_free_checks_many_items_in_order(db, make_item, make_rental, today):
+    busy, idle, blocked, unblocked = make_item(), make_item(), make_item(), make_item()
+    make_rental(busy, today + timedelta(days=1), today + timedelta(days=2))
+    make_rental(idle, today + timedelta(days=1), today + timedelta(days=2), status="pending")
+    db.add_all([
+        AvailabilityBlock(item_id=blocked.id, start_date=today + timedelta(days=1), end_date=today + timedelta(days=3)),
+        AvailabilityBlock(item_id=unblocked.id, start_date=today, end_date=today + timedelta(days=9), is_blocked=False),
+    ])
+    db.commit()
+    index = OccupancyIndex(horizon_days=30)
+
+    ids = [unblocked.id, busy.id, idle.id, blocked.id, 10 ** 9]
+    assert index.free(db, ids, today + timedelta(days=1), today + timedelta(days=2)).tolist() == [
+        True, False, True, False, True
+    ]
+
+
+def test_bookings_past_the_window_are_clipped(db, make_item, make_rental, today):
+    item = make_item()
+    make_rental(item, today - timedelta(days=3), today + timedelta(days=1, hours=1))
+    make_rental(item, today + timedelta(days=9), today + timedelta(days=40))
+    index = OccupancyIndex(horizon_days=10)
+
+    assert index.window(db) == (today, 10)
+    assert index.calendar(db, item.id, today, 10) == [True, True] + [False] * 7 + [True]
+
+
+def test_commits_update_the_shared_index(db, make_item, make_rental, today):
+    item = make_item()
+    start, end = today + timedelta(days=3), today + timedelta(days=4)
+    rental = make_rental(item, start, end, status="pending")
+    assert item_availability.free(db, [item.id], start, end).tolist() == [True]
+
+    rental.status = "approved"
+    db.commit()
+    assert item_availability.free(db, [item.id], start, end).tolist() == [False]
+
+    rental.status = "cancelled"
+    db.commit()
+    assert item_availability.free(db, [item.id], start, end).tolist() == [True]
+
+
+def test_sweeper_expiry_frees_today(db, make_item, make_rental, today):
+    item = make_item()
+    ended = today + (datetime.utcnow() - today) / 2
+    make_rental(item, today - timedelta(days=1), ended, status="approved")
+    assert item_availability.calendar(db, item.id, today, 1) == [True]
+
+    LifecycleSweeper(session_factory=SessionLocal).run_once()
+    assert item_availability.calendar(db, item.id, today, 1) == [False]
+
+
+def test_endpoints_accept_offset_datetimes(client, make_item, make_rental, today):
+    item = make_item()
+    make_rental(item, today + timedelta(days=2), today + timedelta(days=3))
+    day_two = (today + timedelta(days=2)).isoformat()
+
+    response = client.get("/api/items", params={
+        "available_from": day_two + "Z", "available_to": (today + timedelta(days=3)).isoformat() + "+00:00",
+        "fields": "id",
+    })
+    assert response.status_code == 200
+    assert item.id not in {entry["id"] for entry in response.json()}
+
+    # 23:00 the day before in UTC-01:00 is midnight on day 2 in UTC
+    shifted = (today + timedelta(days=1, hours=23)).isoformat() + "-01:00"
+    calendar = client.get(f"/api/items/{item.id}/calendar", params={"start": shifted, "days": 2}).json()
+    assert calendar["start"] == (today + timedelta(days=2)).date().isoformat()
+    assert [day["available"] for day in calendar["days"]] == [False, True]
+
+
+def test_endpoints_reject_unanswerable_ranges(client, make_item, today):
+    item = make_item()
+    tomorrow = (today + timedelta(days=1)).isoformat()
+    assert client.get("/api/items", params={"available_from": tomorrow}).status_code == 400
+    assert client.get("/api/items", params={"available_from": tomorrow, "available_to": tomorrow}).status_code == 400
+    assert client.get("/api/items", params={
+        "available_from": (today - timedelta(days=1)).isoformat(), "available_to": tomorrow,
+    }).status_code == 400
+    assert client.get("/api/items/999999999/calendar").status_code == 404
+    assert client.get(f"/api/items/{item.id}/calendar", params={
+        "start": (today + timedelta(days=400)).isoformat(),
+    }).status_code == 400
+
+
+def test_as_utc():
+    aware = datetime.fromisoformat("2026-10-25T01:30:00+02:00")
+    assert as_utc(aware) == datetime(2026, 10, 24, 23, 30)
+    assert as_utc(datetime(2026, 1, 1)) == datetime(2026, 1, 1)
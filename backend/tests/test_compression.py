@@ -0,0 +1,68 @@
+import asyncio
+
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware, choose_encoding
+
+BIG = "campus rentals " * 200
+
+
+def _client():
+    app = FastAPI()
+
+    @app.get("/big")
+    def big():
+        return Response(BIG, media_type="text/plain", headers={"etag": '"abc123"'})
+
+    @app.get("/small")
+    def small():
+        return Response("tiny", media_type="text/plain")
+
+    @app.get("/image")
+    def image():
+        return Response(b"\x89PNG" * 1000, media_type="image/png")
+
+    app.add_middleware(CompressionMiddleware)
+    return TestClient(app)
+
+
+def test_compresses_large_text_and_weakens_the_etag():
+    response = _client().get("/big", headers={"accept-encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"abc123"'
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.text == BIG
+
+
+def test_leaves_small_binary_and_unrequested_bodies_alone():
+    client = _client()
+    assert "content-encoding" not in client.get("/small", headers={"accept-encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/image", headers={"accept-encoding": "gzip"}).headers
+    plain = client.get("/big", headers={"accept-encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["etag"] == '"abc123"'
+
+
+def test_pathsend_responses_get_their_start_message():
+    async def file_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/plain"), (b"etag", b'"f1"')]})
+        await send({"type": "http.response.pathsend", "path": "/srv/static/notes.txt"})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/static/notes.txt",
+             "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(CompressionMiddleware(file_app)(scope, None, send))
+    assert [message["type"] for message in sent] == ["http.response.start", "http.response.pathsend"]
+    assert dict(sent[0]["headers"])[b"etag"] == b'"f1"'
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip;q=0, identity") is None
+    assert choose_encoding("gzip") == "gzip"
+    assert choose_encoding("*") in ("br", "gzip")
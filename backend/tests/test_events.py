@@ -0,0 +1,131 @@
+import json
+import os
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from database import Event, EventOffset, SessionLocal
+from events import EVENT_DEAD_LETTER_FILE, EventConsumer, EventLog, read_events, write_events
+
+
+@pytest.fixture
+def event_log(app, tmp_path):
+    return EventLog(session_factory=SessionLocal, wal_dir=str(tmp_path / "wal"))
+
+
+def _stored(db, uids):
+    return {event.uid: event for event in db.query(Event).filter(Event.uid.in_(uids))}
+
+
+def _segments(event_log):
+    return sorted(name for name in os.listdir(event_log.wal_dir) if name.endswith(".wal"))
+
+
+def test_recorded_events_are_written_on_flush(db, event_log):
+    uids = [event_log.record("tests.flushed", "rental", n, actor_id=7, n=n) for n in range(3)]
+    assert _stored(db, uids) == {}
+    assert len(_segments(event_log)) == 1
+
+    assert event_log.flush() == 3
+    stored = _stored(db, uids)
+    assert [json.loads(stored[uid].payload) for uid in uids] == [{"n": 0}, {"n": 1}, {"n": 2}]
+    assert stored[uids[0]].actor_id == 7
+    # The segment goes once its batch has committed
+    assert _segments(event_log) == []
+    assert event_log.flush() == 0
+
+
+def test_recover_replays_a_crashed_process_segment(db, event_log):
+    os.makedirs(event_log.wal_dir)
+    events = [
+        {"uid": uuid.uuid4().hex, "name": "tests.recovered", "aggregate": "rental", "aggregate_id": n,
+         "actor_id": None, "payload": {}, "created_at": datetime.utcnow().isoformat()}
+        for n in range(3)
+    ]
+    # The first event had already been flushed before the crash
+    write_events(db, events[:1])
+    db.commit()
+    with open(os.path.join(event_log.wal_dir, "events-999-dead.wal"), "w", encoding="utf-8") as wal:
+        wal.writelines(json.dumps(event) + "\n" for event in events)
+        wal.write('{"uid": "torn')
+
+    assert event_log.recover() == 2
+    assert set(_stored(db, [event["uid"] for event in events])) == {event["uid"] for event in events}
+    assert _segments(event_log) == []
+
+
+def test_a_rejected_event_is_dead_lettered_without_blocking_the_rest(db, event_log):
+    uids = [event_log.record("tests.poison", "rental", n) for n in range(3)]
+    # A row with the same uid already exists, so the batch insert fails
+    write_events(db, [{**event_log._buffer[1]}])
+    db.commit()
+    first = db.query(Event).filter(Event.uid == uids[1]).one().id
+
+    assert event_log.flush() == 2
+    assert set(_stored(db, uids)) == set(uids)
+    assert db.query(Event).filter(Event.uid == uids[1]).one().id == first
+    with open(os.path.join(event_log.wal_dir, EVENT_DEAD_LETTER_FILE), encoding="utf-8") as dead_letters:
+        rejected = [json.loads(line) for line in dead_letters]
+    assert [event["uid"] for event in rejected] == [uids[1]]
+    assert "IntegrityError" in rejected[0]["error"]
+    assert _segments(event_log) == []
+
+
+def test_transient_failures_keep_the_batch_for_the_next_flush(db, event_log, monkeypatch):
+    uids = [event_log.record("tests.transient", "rental", n) for n in range(2)]
+
+    class LockedSession:
+        def __init__(self):
+            self.session = SessionLocal()
+
+        def execute(self, *args, **kwargs):
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+        def __getattr__(self, name):
+            return getattr(self.session, name)
+
+    monkeypatch.setattr(event_log, "session_factory", LockedSession)
+    with pytest.raises(OperationalError):
+        event_log.flush()
+    assert len(event_log._buffer) == 2
+    assert len(_segments(event_log)) == 1
+    assert not os.path.exists(os.path.join(event_log.wal_dir, EVENT_DEAD_LETTER_FILE))
+
+    monkeypatch.setattr(event_log, "session_factory", SessionLocal)
+    assert event_log.flush() == 2
+    assert set(_stored(db, uids)) == set(uids)
+
+
+def test_consumers_resume_from_their_offset(db, event_log):
+    name = f"tests.consumed.{uuid.uuid4().hex[:8]}"
+    seen = []
+    consumer = EventConsumer(name, lambda session, events: seen.extend(e.aggregate_id for e in events),
+                             names=[name], batch_size=2)
+
+    for n in range(3):
+        event_log.record(name, "rental", n)
+    event_log.flush()
+    assert consumer.consume_all(db) == 3
+    assert seen == [0, 1, 2]
+
+    event_log.record(name, "rental", 3)
+    event_log.flush()
+    assert consumer.consume_all(db) == 1
+    assert seen == [0, 1, 2, 3]
+    stored = read_events(db, names=[name])
+    assert db.get(EventOffset, consumer.name).last_event_id == stored[-1].id
+
+    # A failing handler rolls back with the offset where it was
+    failing = EventConsumer(consumer.name, lambda session, events: 1 / 0, names=[name])
+    event_log.record(name, "rental", 4)
+    event_log.flush()
+    with pytest.raises(ZeroDivisionError):
+        failing.consume(db)
+    db.rollback()
+    assert db.get(EventOffset, consumer.name).last_event_id == stored[-1].id
+
+    seen.clear()
+    assert consumer.replay(db) == 5
+    assert seen == [0, 1, 2, 3, 4]
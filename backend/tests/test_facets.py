@@ -0,0 +1,40 @@
+from sqlalchemy import event
+
+import facets
+from database import Category, engine
+from facets import facet_counts, item_filters
+
+
+def test_large_candidate_sets_are_counted_in_chunks(db, make_item, monkeypatch):
+    category = db.query(Category).first()
+    items = [make_item(daily_rate=rate, condition=condition)
+             for rate, condition in [(5, "Good"), (15, "Good"), (30, "Fair"), (60, "Excellent"), (8, "Fair")]]
+    items[0].categories = [category]
+    items[3].categories = [category]
+    db.commit()
+    item_ids = [item.id for item in items]
+
+    whole = facet_counts(db, item_filters(), item_ids)
+    assert whole["total"] == 5
+    assert [entry for entry in whole["categories"] if entry["id"] == category.id][0]["count"] == 2
+    assert [entry["count"] for entry in whole["price"]] == [2, 1, 1, 1]
+    assert {entry["value"]: entry["count"] for entry in whole["condition"]} == {"Good": 2, "Fair": 2, "Excellent": 1}
+
+    monkeypatch.setattr(facets, "ID_CHUNK_SIZE", 2)
+    assert facet_counts(db, item_filters(), item_ids) == whole
+    assert facet_counts(db, item_filters(), [])["total"] == 0
+
+
+def test_every_statement_stays_under_the_sqlite_parameter_limit(db):
+    bound = []
+
+    def count_parameters(conn, cursor, statement, parameters, context, executemany):
+        bound.append(len(parameters))
+
+    event.listen(engine, "before_cursor_execute", count_parameters)
+    try:
+        result = facet_counts(db, item_filters(), list(range(1, 5001)))
+    finally:
+        event.remove(engine, "before_cursor_execute", count_parameters)
+    assert result["total"] <= 5000
+    assert len(bound) > 1 and max(bound) < 999
@@ -0,0 +1,112 @@
+import random
+
+import pytest
+
+from geo import SpatialIndex, bounding_box, calculate_distance
+
+
+def _index(points):
+    index = SpatialIndex()
+    with index._lock:
+        for item_id, (latitude, longitude, categories) in enumerate(points, start=1):
+            index._add(item_id, latitude, longitude, categories)
+        index._loaded = True
+    return index
+
+
+def _brute_force(points, latitude, longitude, k, category_id=None, max_distance=None):
+    distances = [
+        (calculate_distance(latitude, longitude, lat, lon), item_id)
+        for item_id, (lat, lon, categories) in enumerate(points, start=1)
+        if category_id is None or category_id in categories
+    ]
+    distances = [pair for pair in distances if max_distance is None or pair[0] <= max_distance]
+    return sorted(distances)[:k]
+
+
+@pytest.fixture(scope="module")
+def campus_points():
+    rng = random.Random(7)
+    return [
+        (40.34 + rng.uniform(-0.2, 0.2), -74.65 + rng.uniform(-0.2, 0.2), {rng.randint(1, 3)})
+        for _ in range(500)
+    ]
+
+
+@pytest.mark.parametrize("latitude,longitude", [(40.34, -74.65), (40.5, -74.9), (35.0, -70.0), (-89.0, 179.9)])
+def test_nearest_matches_brute_force(campus_points, latitude, longitude):
+    index = _index(campus_points)
+    assert index.nearest(latitude, longitude, 10) == _brute_force(campus_points, latitude, longitude, 10)
+
+
+def test_nearest_honours_category_and_radius(campus_points):
+    index = _index(campus_points)
+    got = index.nearest(40.34, -74.65, 20, category_id=2, max_distance=3)
+    assert got == _brute_force(campus_points, 40.34, -74.65, 20, category_id=2, max_distance=3)
+    assert all(distance <= 3 for distance, _ in got)
+
+
+def test_nearest_across_the_antimeridian():
+    points = [(0.0, 179.999, ()), (0.0, -179.999, ()), (0.0, 170.0, ())]
+    index = _index(points)
+    assert [item_id for _, item_id in index.nearest(0.0, -179.9995, 2)] == [2, 1]
+
+
+def test_nearest_edge_cases(campus_points):
+    index = _index(campus_points)
+    assert index.nearest(40.34, -74.65, 0) == []
+    assert index.nearest(-60.0, 100.0, 5, max_distance=100) == []
+    assert len(index.nearest(40.34, -74.65, 1000)) == len(campus_points)
+    assert SpatialIndex().nearest(40.34, -74.65, 5) == []
+
+
+def test_nearby_endpoint_rejects_out_of_range_coordinates(client):
+    assert client.get("/api/items/nearby", params={"latitude": 999, "longitude": 999}).status_code == 422
+    assert client.get("/api/items/nearby", params={"latitude": 40, "longitude": -181}).status_code == 422
+    assert client.get("/api/items/nearby", params={"latitude": 40, "longitude": -74, "max_distance": -1}).status_code == 422
+    assert client.get("/api/items/nearby", params={"latitude": 40, "longitude": -74}).status_code == 200
+
+
+def _in_box(box, latitude, longitude):
+    min_lat, max_lat, longitude_ranges = box
+    return min_lat <= latitude <= max_lat and (
+        not longitude_ranges or any(low <= longitude <= high for low, high in longitude_ranges)
+    )
+
+
+@pytest.mark.parametrize("latitude,longitude,miles", [
+    (40.34, -74.65, 10), (0.0, 179.99, 50), (0.0, -179.99, 50), (-10.0, 179.0, 300), (89.5, 20.0, 100),
+    (-85.0, -120.0, 200), (70.0, 0.0, 600),
+])
+def test_bounding_box_holds_every_point_in_the_radius(latitude, longitude, miles):
+    box = bounding_box(latitude, longitude, miles)
+    rng = random.Random(11)
+    for _ in range(2000):
+        lat = max(-90.0, min(90.0, latitude + rng.uniform(-15, 15)))
+        lon = (longitude + rng.uniform(-60, 60) + 180) % 360 - 180
+        if calculate_distance(latitude, longitude, lat, lon) <= miles:
+            assert _in_box(box, lat, lon), (lat, lon)
+
+
+def test_bounding_box_splits_at_the_antimeridian_and_opens_at_the_poles():
+    min_lat, max_lat, ranges = bounding_box(0.0, 179.99, 50)
+    assert len(ranges) == 2 and ranges[0][1] == 180.0 and ranges[1][0] == -180.0
+    assert bounding_box(89.9, 0.0, 50)[2] == []
+    assert len(bounding_box(40.0, 0.0, 50)[2]) == 1
+
+
+def test_radius_search_finds_items_across_the_antimeridian(client, make_item):
+    east = make_item(title="Fiji East", latitude=-17.0, longitude=179.995)
+    west = make_item(title="Fiji West", latitude=-17.0, longitude=-179.995)
+    far = make_item(title="Fiji Far", latitude=-17.0, longitude=170.0)
+    for longitude in (179.999, -179.999):
+        params = {"latitude": -17.0, "longitude": longitude, "max_distance": 5}
+        ids = {item["id"] for item in client.get("/api/items", params=params).json()}
+        assert {east.id, west.id} <= ids and far.id not in ids
+        assert client.get("/api/items/facets", params=params).json()["total"] >= 2
+
+
+def test_radius_search_near_a_pole(client, make_item):
+    across = make_item(title="Polar Station", latitude=89.95, longitude=180.0 - 45.0)
+    params = {"latitude": 89.95, "longitude": -45.0, "max_distance": 10}
+    assert across.id in {item["id"] for item in client.get("/api/items", params=params).json()}
@@ -0,0 +1,101 @@
+import re
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from instrumentation import InstrumentationMiddleware, Metrics, SamplingProfiler, instrument_engine, metrics
+
+
+def _server_timing(response):
+    match = re.fullmatch(r'app;dur=([\d.]+), db;dur=([\d.]+);desc="(\d+) queries"', response.headers["server-timing"])
+    assert match, response.headers["server-timing"]
+    return float(match.group(1)), float(match.group(2)), int(match.group(3))
+
+
+def _series(name, **labels):
+    wanted = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    for line in metrics.render().splitlines():
+        if line.startswith(f"{name}{{{wanted}}} "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_requests_report_their_own_query_count():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    app = FastAPI()
+
+    @app.get("/queries/{count}")
+    def run_queries(count: int):
+        with engine.connect() as connection:
+            for _ in range(count):
+                connection.execute(text("SELECT 1"))
+        return {"ok": True}
+
+    app.add_middleware(InstrumentationMiddleware)
+    client = TestClient(app)
+    labels = {"method": "GET", "route": "/queries/{count}"}
+    before = _series("http_request_sql_queries_count", **labels)
+
+    app_ms, db_ms, queries = _server_timing(client.get("/queries/3"))
+    assert queries == 3
+    assert 0 <= db_ms <= app_ms
+    # Counts are per request, not cumulative
+    assert _server_timing(client.get("/queries/0"))[2] == 0
+
+    assert _series("http_request_sql_queries_count", **labels) == before + 2
+    assert _series("http_requests_total", status="200", **labels) >= 2
+
+
+def test_metrics_endpoint_lists_the_described_series(client, register):
+    register()
+    body = client.get("/metrics").text
+    for name, kind in [("http_requests_total", "counter"), ("http_request_duration_seconds", "histogram"),
+                       ("http_request_sql_queries", "histogram"), ("http_request_sql_seconds", "histogram")]:
+        assert f"# TYPE {name} {kind}" in body
+    assert 'http_requests_total{method="POST",route="/api/auth/register",status="200"}' in body
+    assert 'http_request_duration_seconds_bucket{method="POST",route="/api/auth/register",le="+Inf"}' in body
+    # The app's own query count shows up on real endpoints too
+    assert _server_timing(client.get("/api/categories"))[2] >= 1
+
+
+def test_histograms_render_cumulative_buckets():
+    registry = Metrics()
+    registry.describe("latency_seconds", "histogram", "Test latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        registry.observe("latency_seconds", value, route="/x")
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP latency_seconds Test latency", "# TYPE latency_seconds histogram"]
+    assert 'latency_seconds_bucket{route="/x",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/x",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{route="/x",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{route="/x"} 3' in lines
+
+
+def _spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_sampling_profiler_attributes_samples_to_the_busy_frame():
+    profiler = SamplingProfiler(interval_ms=1)
+    ready = threading.Event()
+
+    def busy():
+        ready.wait()
+        _spin(0.2)
+
+    worker = threading.Thread(target=busy)
+    worker.start()
+    profiler.ensure_started(worker.ident)
+    started = time.perf_counter()
+    ready.set()
+    worker.join()
+
+    report = profiler.report(started, time.perf_counter())
+    assert int(report.split()[0]) > 10
+    assert "test_instrumentation.py:_spin" in report
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+import jobs
+from auth import create_access_token
+from database import Job, SessionLocal, User
+from jobs import JobRunner, enqueue
+
+
+def _run_jobs():
+    runner = JobRunner(session_factory=SessionLocal)
+    while runner.run_pending():
+        pass
+
+
+def test_reviews_update_the_owner_rating_through_the_queue(client, db, make_user, make_item, make_rental):
+    owner = make_user(rating=4.0, total_ratings=2)
+    item = make_item(owner_id=owner.id)
+    now = datetime.utcnow()
+    reviewers = []
+    for rating in (5, 2):
+        renter = make_user()
+        rental = make_rental(item, now - timedelta(days=3), now - timedelta(days=1),
+                             renter_id=renter.id, status="completed")
+        reviewers.append((renter, rental, rating))
+
+    for renter, rental, rating in reviewers:
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': renter.email})}"}
+        response = client.post("/api/reviews", headers=headers, json={
+            "rental_id": rental.id, "reviewee_id": owner.id, "rating": rating, "comment": "ok",
+        })
+        assert response.status_code == 200, response.text
+
+    db.expire_all()
+    assert (db.get(User, owner.id).rating, db.get(User, owner.id).total_ratings) == (4.0, 2)
+
+    _run_jobs()
+    db.expire_all()
+    # (4.0 * 2 + 5 + 2) / 4
+    assert (db.get(User, owner.id).rating, db.get(User, owner.id).total_ratings) == (3.8, 4)
+
+
+def test_failed_jobs_back_off_and_then_die(db, monkeypatch):
+    calls = []
+
+    def flaky(session, payloads):
+        calls.append(payloads)
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(jobs._handlers, "tests.flaky", flaky)
+    job = enqueue(db, "tests.flaky", max_attempts=2, value=1)
+    db.commit()
+
+    runner = JobRunner(session_factory=SessionLocal)
+    runner.run_pending()
+    db.refresh(job)
+    assert (job.status, job.attempts) == ("queued", 1)
+    assert job.run_at > datetime.utcnow()
+    assert "boom" in job.last_error
+
+    job.run_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    runner.run_pending()
+    db.refresh(job)
+    assert (job.status, job.attempts) == ("dead", 2)
+    assert calls == [[{"value": 1}], [{"value": 1}]]
+
+
+def test_one_bad_job_does_not_fail_its_batch(db, monkeypatch):
+    handled = []
+
+    def picky(session, payloads):
+        if any(payload["value"] < 0 for payload in payloads):
+            raise ValueError("negative")
+        handled.extend(payload["value"] for payload in payloads)
+
+    monkeypatch.setitem(jobs._handlers, "tests.picky", picky)
+    batch = [enqueue(db, "tests.picky", value=value) for value in (1, -1, 2)]
+    db.commit()
+
+    JobRunner(session_factory=SessionLocal).run_pending()
+    for job in batch:
+        db.refresh(job)
+    assert [job.status for job in batch] == ["done", "queued", "done"]
+    assert batch[1].attempts == 1 and "negative" in batch[1].last_error
+    assert batch[0].last_error is None
+    assert sorted(handled) == [1, 2]
+
+
+def test_delayed_jobs_wait_until_due(db, monkeypatch):
+    seen = []
+    monkeypatch.setitem(jobs._handlers, "tests.later", lambda session, payloads: seen.extend(payloads))
+    job = enqueue(db, "tests.later", delay=timedelta(hours=1), n=1)
+    db.commit()
+
+    _run_jobs()
+    assert seen == []
+    db.query(Job).filter(Job.id == job.id).update({"run_at": datetime.utcnow()})
+    db.commit()
+    _run_jobs()
+    assert seen == [{"n": 1}]
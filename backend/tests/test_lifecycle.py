@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from database import Rental, SessionLocal, Transaction, _commit_listeners
+from lifecycle import AUTO_COMPLETE_DAYS, LifecycleSweeper
+
+
+def test_sweep_moves_stale_rentals_and_reports_them_to_commit_hooks(db, make_item, make_rental, monkeypatch):
+    now = datetime.utcnow()
+    item = make_item()
+    pending = make_rental(item, now - timedelta(days=1), now + timedelta(days=1), status="pending")
+    approved = make_rental(item, now - timedelta(days=3), now - timedelta(hours=1), status="approved")
+    overdue = make_rental(item, now - timedelta(days=5), now - timedelta(days=2), status="active")
+    abandoned = make_rental(item, now - timedelta(days=AUTO_COMPLETE_DAYS + 5),
+                            now - timedelta(days=AUTO_COMPLETE_DAYS + 1), status="active")
+    upcoming = make_rental(item, now + timedelta(days=1), now + timedelta(days=2), status="pending")
+
+    seen = []
+    monkeypatch.setitem(_commit_listeners, Rental, [*_commit_listeners[Rental], seen.extend])
+    counts = LifecycleSweeper(session_factory=SessionLocal).run_once()
+
+    assert counts["expired_pending"] >= 1 and counts["expired_approved"] >= 1
+    db.expire_all()
+    assert db.get(Rental, pending.id).status == "cancelled"
+    assert db.get(Rental, approved.id).status == "cancelled"
+    assert db.get(Rental, overdue.id).overdue_at is not None
+    assert db.get(Rental, abandoned.id).status == "completed"
+    assert db.get(Rental, upcoming.id).status == "pending"
+    assert db.query(Transaction).filter(Transaction.rental_id == abandoned.id, Transaction.type == "earning").count() == 1
+
+    reported = {row["id"]: row for operation, row in seen if operation == "update"}
+    assert reported[approved.id] == {"id": approved.id, "owner_id": item.owner_id, "item_id": item.id,
+                                     "status": "cancelled"}
+    assert reported[abandoned.id]["status"] == "completed"
+    assert "overdue_at" in reported[overdue.id]
+    assert upcoming.id not in reported
+
+    # A second sweep finds nothing left to do
+    assert not any(LifecycleSweeper(session_factory=SessionLocal).run_once().values())
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+
+import loaders
+from auth import create_access_token
+from database import Item, engine
+from loaders import MAX_BATCH_IDS, DataLoader, model_loader, parse_ids
+
+
+def _count_selects(fn):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        return fn(), len(statements)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def test_model_loader_keeps_request_order_across_chunks(db, make_item, monkeypatch):
+    items = [make_item(title=f"Loaded {n}") for n in range(5)]
+    monkeypatch.setattr(loaders, "QUERY_CHUNK_SIZE", 2)
+    db.expire_all()
+    wanted = [items[4].id, 10 ** 9, items[0].id, items[2].id, items[4].id, items[1].id]
+
+    async def load():
+        return await model_loader(db, Item).load_many(wanted)
+
+    loaded, selects = _count_selects(lambda: asyncio.run(load()))
+    assert [item.id if item is not None else None for item in loaded] == [
+        items[4].id, None, items[0].id, items[2].id, items[4].id, items[1].id
+    ]
+    # Five distinct ids in chunks of two
+    assert selects == 3
+
+
+def test_loads_in_one_tick_share_a_batch():
+    batches = []
+
+    def batch_load(keys):
+        batches.append(list(keys))
+        return {key: key * 10 for key in keys if key != 3}
+
+    async def load():
+        loader = DataLoader(batch_load)
+        loader.prime(7, "primed")
+        first, second, primed = await asyncio.gather(
+            loader.load_many([1, 2, 3]), loader.load_many([2, 4]), loader.load(7)
+        )
+        again = await loader.load(1)
+        return first, second, primed, again
+
+    first, second, primed, again = asyncio.run(load())
+    assert (first, second, primed, again) == ([10, 20, None], [20, 40], "primed", 10)
+    assert batches == [[1, 2, 3, 4]]
+
+
+def test_batch_errors_reach_every_waiter():
+    def batch_load(keys):
+        raise RuntimeError("database down")
+
+    async def load():
+        loader = DataLoader(batch_load)
+        return await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+
+    assert [str(error) for error in asyncio.run(load())] == ["database down", "database down"]
+
+
+def test_parse_ids():
+    assert parse_ids("3, 1,3 ,2") == [3, 1, 2]
+    assert len(parse_ids(",".join(map(str, range(MAX_BATCH_IDS))))) == MAX_BATCH_IDS
+    for bad in ("", " , ", "1,two", ",".join(map(str, range(MAX_BATCH_IDS + 1)))):
+        with pytest.raises(HTTPException) as error:
+            parse_ids(bad)
+        assert error.value.status_code == 400
+
+
+def test_batch_endpoints_enforce_the_id_cap(client, make_user):
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': make_user().email})}"}
+    too_many = ",".join(map(str, range(1, MAX_BATCH_IDS + 2)))
+    assert client.get(f"/api/items?ids={too_many}").status_code == 400
+    assert client.get(f"/api/users/batch?ids={too_many}", headers=headers).status_code == 400
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from conftest import auth_headers
+
+from database import Rental
+from pricing import build_quotes, price_many
+
+
+@pytest.mark.parametrize("daily,weekly,days,total,weekly_applied", [
+    (10.0, None, 3, 30.0, False),
+    (10.0, 50.0, 7, 50.0, True),
+    (10.0, 50.0, 9, 70.0, True),
+    # Leftover days never cost more than another week
+    (10.0, 50.0, 13, 100.0, True),
+    (10.0, 50.0, 6, 50.0, False),
+    # A weekly rate above seven daily rates is ignored
+    (10.0, 80.0, 7, 70.0, False),
+    (12.5, None, 15, 187.5, False),
+])
+def test_price_many(daily, weekly, days, total, weekly_applied):
+    prices = price_many([daily], [np.nan if weekly is None else weekly], days)
+    assert prices["total_cost"][0] == total
+    assert bool(prices["weekly_rate_applied"][0]) == weekly_applied
+    assert prices["platform_fee"][0] == round(total * 0.15, 2)
+    assert prices["owner_earnings"][0] == round(total - prices["platform_fee"][0], 2)
+
+
+def test_build_quotes_adds_deposit_and_breakdown():
+    quotes = build_quotes([(1, 10.0, 50.0, 100.0), (2, 4.0, None, 0.0)], 9)
+    assert quotes[1]["weeks"] == 1 and quotes[1]["extra_days"] == 2
+    assert quotes[1]["amount_due"] == 170.0
+    assert quotes[2]["total_cost"] == 36.0 and quotes[2]["platform_fee"] == 5.4
+    assert build_quotes([], 3) == {}
+
+
+def test_quote_matches_what_the_rental_charges(client, db, register, make_item):
+    item = make_item(daily_rate=11.0, weekly_rate=60.0, deposit=25.0)
+    start = datetime.utcnow().replace(microsecond=0) + timedelta(days=2)
+    end = start + timedelta(days=10)
+    params = {"item_ids": f"{item.id},999999999", "start_date": start.isoformat(), "end_date": end.isoformat()}
+
+    body = client.get("/api/rentals/quotes", params=params).json()
+    assert body["not_found"] == [999999999]
+    quote = body["quotes"][0]
+    assert quote["total_cost"] == 60.0 + 33.0
+
+    response = client.post("/api/rentals", headers=auth_headers(register()), json={
+        "item_id": item.id, "start_date": start.isoformat(), "end_date": end.isoformat(),
+    })
+    assert response.status_code == 200, response.text
+    rental = db.get(Rental, response.json()["id"])
+    assert (rental.total_cost, rental.platform_fee, rental.owner_earnings, rental.deposit_amount) == (
+        quote["total_cost"], quote["platform_fee"], quote["owner_earnings"], quote["deposit"]
+    )
+
+
+def test_cached_quotes_follow_price_changes(client, db, make_item):
+    item = make_item(daily_rate=10.0)
+    start = datetime.utcnow().replace(microsecond=0) + timedelta(days=1)
+    params = {"item_ids": str(item.id), "start_date": start.isoformat(),
+              "end_date": (start + timedelta(days=2)).isoformat()}
+    assert client.get("/api/rentals/quotes", params=params).json()["quotes"][0]["total_cost"] == 20.0
+
+    item.daily_rate = 15.0
+    db.commit()
+    assert client.get("/api/rentals/quotes", params=params).json()["quotes"][0]["total_cost"] == 30.0
+    assert client.get("/api/rentals/quotes", params={**params, "end_date": start.isoformat()}).status_code == 400
@@ -0,0 +1,37 @@
+from sqlalchemy import event
+
+from database import engine
+
+
+def test_fields_limits_the_response_keys(client, make_item):
+    item = make_item(title="Projected Tent")
+    response = client.get(f"/api/items?ids={item.id}&fields=id,title,daily_rate")
+    assert response.json() == [{"id": item.id, "title": "Projected Tent", "daily_rate": 10.0}]
+
+    owner = client.get(f"/api/items/{item.id}?fields=id,owner").json()
+    assert set(owner) == {"id", "owner"} and owner["owner"]["id"] == item.owner_id
+
+
+def test_unknown_fields_are_rejected(client, make_item):
+    item = make_item()
+    for url in ("/api/items?fields=id,bogus", f"/api/items/{item.id}?fields=password"):
+        response = client.get(url)
+        assert response.status_code == 400
+        assert "Unknown fields" in response.json()["detail"]
+
+
+def test_only_the_selected_columns_are_queried(client, make_item):
+    item_id = make_item(title="Pushed Down", description="not needed").id
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        assert client.get(f"/api/items?ids={item_id}&fields=id,title").status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    item_selects = [statement for statement in statements if "FROM items" in statement]
+    assert item_selects and all("items.description" not in statement for statement in item_selects)
+    assert not any("FROM users" in statement or "FROM categories" in statement for statement in statements)
@@ -0,0 +1,102 @@
+import math
+import random
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+import ranking
+from database import SessionLocal, User
+from ranking import RankingFeatures, parse_weights, rank_scores, top_k
+
+NOW = 1_900_000_000.0
+WEIGHTS = {"distance": 0.35, "price": 0.2, "rating": 0.3, "recency": 0.15}
+
+
+def _python_order(candidates, weights, k):
+    """The straightforward version: score each candidate in Python, then a stable sort"""
+    def score(candidate):
+        price, rating, created, distance = candidate
+        value = (weights["price"] * price + weights["rating"] * rating
+                 + weights["recency"] * math.exp(-max(NOW - created, 0.0) / 86400 / ranking.RECENCY_SCALE_DAYS))
+        if distance is not None and not math.isnan(distance) and weights["distance"]:
+            value += weights["distance"] * math.exp(-distance / ranking.DISTANCE_SCALE_MILES)
+        return value
+    return sorted(range(len(candidates)), key=lambda index: -score(candidates[index]))[:k]
+
+
+def _vectorized_order(candidates, weights, k):
+    price, rating, created, distance = (np.array(column, dtype=np.float64) for column in zip(*candidates))
+    return top_k(rank_scores((price, rating, created), distance, weights, now=NOW), k)
+
+
+@pytest.fixture(scope="module")
+def candidates():
+    rng = random.Random(3)
+    rows = [
+        (rng.random(), rng.random(), NOW - rng.uniform(0, 90 * 86400), rng.uniform(0, 10))
+        for _ in range(300)
+    ]
+    # Exact ties: repeated feature rows, and items without coordinates
+    rows += [rows[5], rows[5], rows[17]]
+    rows += [(0.5, 0.5, NOW, float("nan")), (0.5, 0.5, NOW, float("nan"))]
+    rng.shuffle(rows)
+    return rows
+
+
+@pytest.mark.parametrize("k", [1, 10, 50, 400])
+def test_top_k_matches_a_python_sort_including_ties(candidates, k):
+    assert _vectorized_order(candidates, WEIGHTS, k) == _python_order(candidates, WEIGHTS, k)
+
+
+def test_ties_keep_candidate_order():
+    scores = np.array([0.5, 0.9, 0.5, 0.9, 0.1])
+    assert top_k(scores, 5) == [1, 3, 0, 2, 4]
+    assert top_k(scores, 0) == []
+
+
+def test_without_a_location_distance_weight_is_ignored(candidates):
+    weights = {**WEIGHTS, "distance": 0.0}
+    assert _vectorized_order(candidates, weights, 20) == _python_order(candidates, weights, 20)
+
+
+def test_parse_weights():
+    assert parse_weights("price:1") == {"distance": 0.0, "price": 1.0, "rating": 0.0, "recency": 0.0}
+    for bad in ("speed:1", "price:cheap"):
+        with pytest.raises(HTTPException) as error:
+            parse_weights(bad)
+        assert error.value.status_code == 400
+
+
+def test_owner_rating_changes_reach_cached_features(db, make_user, make_item):
+    owner = make_user(rating=5.0, total_ratings=1)
+    item = make_item(owner_id=owner.id, daily_rate=25.0)
+    features = RankingFeatures()
+    price, rating, _ = features.features(db, np.array([item.id, 10 ** 9], dtype=np.int64))
+    assert price[0] == 0.5
+    # One 5-star rating shrunk toward three of the prior
+    assert rating[0] == pytest.approx((5.0 + 3 * ranking.PRIOR_RATING) / 4 / 5)
+    # Unknown ids rank last rather than failing
+    assert price[1] == 0.0
+
+    session = SessionLocal()
+    try:
+        session.get(User, owner.id).total_ratings = 9
+        session.commit()
+    finally:
+        session.close()
+    features.invalidate_owners([owner.id])
+    _, rating, _ = features.features(db, np.array([item.id], dtype=np.int64))
+    assert rating[0] == pytest.approx((5.0 * 9 + 3 * ranking.PRIOR_RATING) / 12 / 5)
+
+
+def test_rank_pages_are_slices_of_one_ranking(client, make_item):
+    marker = f"rankpage{random.randrange(10 ** 6)}"
+    for rate in (5, 50, 12, 30, 8, 12):
+        make_item(title=f"{marker} item", daily_rate=rate)
+    params = {"search": marker, "sort": "rank", "weights": "price:1"}
+    everything = client.get("/api/items", params={**params, "limit": 6}).json()
+    assert [item["daily_rate"] for item in everything] == [5, 8, 12, 12, 30, 50]
+    pages = [client.get("/api/items", params={**params, "limit": 2, "offset": offset}).json()
+             for offset in (0, 2, 4)]
+    assert [item["id"] for page in pages for item in page] == [item["id"] for item in everything]
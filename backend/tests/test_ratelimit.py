@@ -0,0 +1,76 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from jose import jwt
+
+from auth import ALGORITHM, create_access_token
+from ratelimit import RateLimitMiddleware, TokenBuckets, client_key, request_cost
+
+
+def _limited_client(**limits):
+    app = FastAPI()
+
+    @app.get("/api/ping")
+    def ping():
+        return {"ok": True}
+
+    @app.get("/health")
+    def health():
+        return {"ok": True}
+
+    app.add_middleware(RateLimitMiddleware, **limits)
+    return TestClient(app)
+
+
+def test_requests_past_the_burst_get_429_with_retry_after():
+    client = _limited_client(rate=0.5, burst=3)
+    assert [client.get("/api/ping").status_code for _ in range(3)] == [200, 200, 200]
+    response = client.get("/api/ping")
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too many requests"}
+    assert response.headers["retry-after"] == "2"
+    # Only /api is limited
+    assert client.get("/health").status_code == 200
+
+
+def _forged_token(subject: str) -> str:
+    return jwt.encode({"sub": subject, "type": "access", "jti": subject}, "not-our-key",
+                      algorithm=ALGORITHM, headers={"kid": "default"})
+
+
+def test_each_user_gets_their_own_bucket(app):
+    client = _limited_client(rate=0.01, burst=2)
+    alice = {"Authorization": f"Bearer {create_access_token({'sub': 'alice@test.edu'})}"}
+    bob = {"Authorization": f"Bearer {create_access_token({'sub': 'bob@test.edu'})}"}
+    assert [client.get("/api/ping", headers=alice).status_code for _ in range(3)] == [200, 200, 429]
+    assert client.get("/api/ping", headers=bob).status_code == 200
+    # Anonymous requests use the address, which alice hasn't touched
+    assert client.get("/api/ping").status_code == 200
+
+
+def test_forged_tokens_share_the_address_bucket(app):
+    client = _limited_client(rate=0.01, burst=2)
+    statuses = [
+        client.get("/api/ping", headers={"Authorization": f"Bearer {_forged_token(f'user{n}@test.edu')}"}).status_code
+        for n in range(5)
+    ]
+    assert statuses == [200, 200, 429, 429, 429]
+
+
+def test_client_key_uses_only_verified_subjects(app):
+    token = create_access_token({"sub": "alice@test.edu"})
+    scope = {"headers": [(b"authorization", f"Bearer {token}".encode())], "client": ("10.0.0.1", 1234)}
+    assert client_key(scope) == "user:alice@test.edu"
+    # Cached after the first check
+    assert client_key(scope) == "user:alice@test.edu"
+    for bad in (b"nonsense", _forged_token("alice@test.edu").encode()):
+        forged = {"headers": [(b"authorization", b"Bearer " + bad)], "client": ("10.0.0.1", 1234)}
+        assert client_key(forged) == "ip:10.0.0.1"
+
+
+def test_buckets_refill_and_costs():
+    buckets = TokenBuckets(rate=10, burst=10)
+    assert buckets.take("k", 10) == 0
+    assert buckets.take("k", 5) > 0
+    assert request_cost("POST", "/api/auth/login", b"") == 10
+    assert request_cost("GET", "/api/items", b"") > request_cost("GET", "/api/items", b"search=tent")
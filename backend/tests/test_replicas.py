@@ -0,0 +1,24 @@
+from starlette.requests import Request
+
+from auth import create_access_token
+from database import _client_key
+
+
+def _request(authorization=None, host="10.0.0.1"):
+    headers = [(b"authorization", authorization.encode())] if authorization else []
+    return Request({"type": "http", "headers": headers, "client": (host, 5000)})
+
+
+def test_read_your_writes_key_survives_token_refresh():
+    first = create_access_token({"sub": "alice@test.edu"})
+    refreshed = create_access_token({"sub": "alice@test.edu"})
+    assert first != refreshed
+    assert _client_key(_request(f"Bearer {first}")) == _client_key(_request(f"Bearer {refreshed}", host="10.0.0.2"))
+    assert _client_key(_request(f"Bearer {first}")) != _client_key(
+        _request(f"Bearer {create_access_token({'sub': 'bob@test.edu'})}")
+    )
+
+
+def test_anonymous_clients_are_keyed_by_address():
+    assert _client_key(_request()) == _client_key(_request("Bearer not-a-token"))
+    assert _client_key(_request()) != _client_key(_request(host="10.0.0.2"))
@@ -0,0 +1,56 @@
+import sqlite3
+import time
+
+import pytest
+
+import shared_state
+from shared_state import Channel, LocalState, SQLiteState
+
+
+@pytest.fixture(params=["local", "sqlite"])
+def state(request, tmp_path):
+    if request.param == "local":
+        return LocalState()
+    return SQLiteState(str(tmp_path / "shared_state.db"))
+
+
+def _stored_keys(state):
+    if isinstance(state, LocalState):
+        return set(state._values)
+    return {row[0] for row in sqlite3.connect(state.path).execute("SELECT key FROM kv")}
+
+
+def test_expired_keys_are_swept_on_set(state, monkeypatch):
+    state.set("ryw:old", "1", ttl=0.01)
+    state.set("kept", "1")
+    time.sleep(0.02)
+    assert state.get("ryw:old") is None
+
+    monkeypatch.setattr(shared_state, "EXPIRY_SWEEP_SECONDS", 0)
+    state.set("ryw:new", "1", ttl=60)
+    assert _stored_keys(state) == {"kept", "ryw:new"}
+    assert state.get("ryw:new") == "1"
+    assert state.get("kept") == "1"
+
+
+def test_sweeps_are_throttled(state, monkeypatch):
+    monkeypatch.setattr(shared_state, "EXPIRY_SWEEP_SECONDS", 3600)
+    state.set("a", "1", ttl=0.01)
+    time.sleep(0.02)
+    state.set("b", "1", ttl=0.01)
+    # Not swept yet, and still invisible
+    assert "a" in _stored_keys(state)
+    assert state.get("a") is None
+
+
+def test_channels_report_other_workers_publishes(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_state, "VERSION_CHECK_SECONDS", 0)
+    path = str(tmp_path / "shared_state.db")
+    ours, theirs = Channel("items", SQLiteState(path)), Channel("items", SQLiteState(path))
+    subscription = ours.subscribe()
+
+    ours.publish()
+    assert not subscription.changed()
+    theirs.publish()
+    assert subscription.changed()
+    assert not subscription.changed()
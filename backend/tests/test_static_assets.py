@@ -0,0 +1,106 @@
+import hashlib
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import static_assets
+from static_assets import AssetManifest, IMMUTABLE_CACHE, REVALIDATE_CACHE, serve_static
+
+
+def _static_dir(tmp_path):
+    (tmp_path / "images" / "camera").mkdir(parents=True)
+    (tmp_path / "images" / "camera" / "1.jpg").write_bytes(b"jpeg bytes")
+    return tmp_path
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _wait_for_refresh(manifest: AssetManifest):
+    deadline = time.monotonic() + 5
+    while (manifest._refreshing or manifest._stale) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+class _RecordingThread:
+    started = []
+
+    def __init__(self, target, name=None, daemon=None):
+        self.run = target
+
+    def start(self):
+        self.started.append(self)
+
+
+def test_rewrites_only_our_own_static_urls(tmp_path):
+    manifest = AssetManifest(str(_static_dir(tmp_path)), origins=["http://localhost:8000"])
+    manifest.load()
+    digest = _digest(b"jpeg bytes")
+
+    assert manifest.url("/static/images/camera/1.jpg") == f"/static/images/camera/1.{digest}.jpg"
+    assert manifest.url("http://localhost:8000/static/images/camera/1.jpg") == \
+        f"http://localhost:8000/static/images/camera/1.{digest}.jpg"
+    # Another site's /static path is not ours, even when we have a file there
+    foreign = "https://images.example.com/static/images/camera/1.jpg"
+    assert manifest.url(foreign) == foreign
+    assert manifest.url("https://example.com/photo.jpg") == "https://example.com/photo.jpg"
+
+
+def test_url_rewriting_never_hashes_on_the_caller(tmp_path, monkeypatch):
+    static_dir = _static_dir(tmp_path)
+    manifest = AssetManifest(str(static_dir), origins=[])
+    hashed_on = []
+    digest = manifest.digest
+    monkeypatch.setattr(manifest, "digest", lambda relpath: hashed_on.append(relpath) or digest(relpath))
+    monkeypatch.setattr(static_assets.threading, "Thread", _RecordingThread)
+
+    # Cold manifest: the URL goes out unfingerprinted and the file is queued
+    assert manifest.url("/static/images/camera/1.jpg") == "/static/images/camera/1.jpg"
+    assert hashed_on == []
+    _RecordingThread.started.pop().run()
+    assert hashed_on == ["images/camera/1.jpg"]
+    assert manifest.url("/static/images/camera/1.jpg") == \
+        f"/static/images/camera/1.{_digest(b'jpeg bytes')}.jpg"
+
+
+def test_changed_files_get_a_new_fingerprint(tmp_path, monkeypatch):
+    static_dir = _static_dir(tmp_path)
+    manifest = AssetManifest(str(static_dir), origins=[])
+    manifest.load()
+    (static_dir / "images" / "camera" / "1.jpg").write_bytes(b"new jpeg bytes!")
+    monkeypatch.setattr(static_assets, "RECHECK_SECONDS", 0)
+
+    manifest.url("/static/images/camera/1.jpg")
+    _wait_for_refresh(manifest)
+    assert manifest.url("/static/images/camera/1.jpg") == \
+        f"/static/images/camera/1.{_digest(b'new jpeg bytes!')}.jpg"
+
+
+def test_serves_fingerprinted_files_as_immutable(tmp_path, monkeypatch):
+    manifest = AssetManifest(str(_static_dir(tmp_path)), origins=[])
+    manifest.load()
+    monkeypatch.setattr(static_assets, "manifest", manifest)
+    app = FastAPI()
+
+    @app.get("/static/{path:path}")
+    def static(path: str, request: Request):
+        return serve_static(path, request)
+
+    client = TestClient(app)
+    digest = _digest(b"jpeg bytes")
+
+    current = client.get(f"/static/images/camera/1.{digest}.jpg")
+    assert current.status_code == 200
+    assert current.content == b"jpeg bytes"
+    assert current.headers["cache-control"] == IMMUTABLE_CACHE
+    assert current.headers["etag"] == f'"{digest}"'
+
+    outdated = client.get("/static/images/camera/1.000000000000.jpg")
+    assert outdated.content == b"jpeg bytes"
+    assert outdated.headers["cache-control"] == REVALIDATE_CACHE
+
+    assert client.get("/static/images/camera/1.jpg", headers={"if-none-match": f'W/"{digest}"'}).status_code == 304
+    assert client.get("/static/images/camera/2.jpg").status_code == 404
+    assert client.get("/static/../conftest.py").status_code == 404
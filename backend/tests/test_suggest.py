@@ -0,0 +1,62 @@
+from conftest import auth_headers
+
+from database import Category
+from suggest import SuggestIndex, search_suggestions, tokenize
+
+
+def _texts(suggestions):
+    return [(entry["type"], entry["text"], entry["count"]) for entry in suggestions]
+
+
+def test_tokenize_folds_case_accents_and_punctuation():
+    assert tokenize("Café  TI-84 Plus!") == ["cafe", "ti", "84", "plus"]
+    assert tokenize(None) == []
+
+
+def test_prefix_matches_are_ranked_and_deduplicated(db, make_item):
+    for title in ("Zanzibar Kayak", "zanzibar kayak", "Kayak Zanzibar Paddle", "Zanzibar Kayak Roof Rack"):
+        make_item(title=title)
+    index = SuggestIndex()
+
+    assert _texts(index.suggest(db, "zanz", 3)) == [
+        ("title", "Zanzibar Kayak", 2),
+        ("title", "Zanzibar Kayak Roof Rack", 1),
+        ("title", "Kayak Zanzibar Paddle", 1),
+    ]
+    # Earlier words must match too; the last one is a prefix
+    assert _texts(index.suggest(db, "kayak zanz"))[0] == ("title", "Kayak Zanzibar Paddle", 1)
+    assert _texts(index.suggest(db, "roof zanz")) == [("title", "Zanzibar Kayak Roof Rack", 1)]
+    assert index.suggest(db, "   ") == []
+
+
+def test_categories_are_suggested_with_their_item_counts(db, make_item):
+    tools = db.query(Category).filter(Category.name == "Tools").one()
+    index = SuggestIndex()
+    before = [s for s in index.suggest(db, "too", 20) if s["type"] == "category"]
+    make_item(title="Cordless Drill", categories=[tools])
+    index.invalidate()
+    after = [s for s in index.suggest(db, "too", 20) if s["type"] == "category"]
+    assert after[0]["text"] == "Tools" and after[0]["category_id"] == tools.id
+    assert after[0]["count"] == (before[0]["count"] if before else 0) + 1
+
+
+def test_new_items_are_indexed_without_a_rebuild(client, db, register, monkeypatch):
+    search_suggestions.ensure_loaded(db)
+    rebuilds = []
+    monkeypatch.setattr(search_suggestions, "invalidate", lambda: rebuilds.append(1))
+    response = client.post("/api/items", headers=auth_headers(register()), json={
+        "title": "Quokka Espresso Grinder", "description": "x", "daily_rate": 5, "deposit": 10,
+        "condition": "Good", "category_ids": [], "location_name": "x", "latitude": 40.3, "longitude": -74.6,
+    })
+    assert response.status_code == 200
+    assert search_suggestions._loaded and not rebuilds
+    assert _texts(search_suggestions.suggest(db, "quok")) == [("title", "Quokka Espresso Grinder", 1)]
+
+
+def test_unavailable_items_drop_out(db, make_item):
+    item = make_item(title="Wombat Tent")
+    search_suggestions.ensure_loaded(db)
+    assert _texts(search_suggestions.suggest(db, "womb")) == [("title", "Wombat Tent", 1)]
+    item.available = False
+    db.commit()
+    assert search_suggestions.suggest(db, "womb") == []
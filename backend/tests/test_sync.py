@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from database import Item
+from main import decode_sync_token, encode_sync_token
+
+
+def _pages(client, token, limit):
+    """Every (changed ids, deleted ids) page until has_more is false"""
+    pages = []
+    while True:
+        body = client.get("/api/items/changes", params={"since": token, "limit": limit, "fields": "id"}).json()
+        pages.append(([entry["id"] for entry in body["changed"]], body["deleted"]))
+        token = body["next_token"]
+        if not body["has_more"]:
+            return pages, token
+
+
+def test_paging_returns_each_change_once_in_order(client, db, make_item):
+    base = datetime(2001, 1, 1)
+    # Two items share a timestamp across a page boundary; ids break the tie
+    stamps = [base + timedelta(seconds=1), base + timedelta(seconds=2), base + timedelta(seconds=2),
+              base + timedelta(seconds=3), base + timedelta(seconds=5)]
+    items = [make_item(updated_at=stamp) for stamp in stamps]
+    gone = items[3]
+    db.query(Item).filter(Item.id == gone.id).update({"available": False, "updated_at": base + timedelta(seconds=4)})
+    db.commit()
+
+    pages, _ = _pages(client, encode_sync_token(base, 0), limit=2)
+    ours = {item.id for item in items}
+    changed = [item_id for page, _ in pages for item_id in page if item_id in ours]
+    deleted = [item_id for _, page in pages for item_id in page if item_id in ours]
+    assert changed == [items[0].id, items[1].id, items[2].id, items[4].id]
+    assert deleted == [gone.id]
+    assert all(len(page) + len(removed) <= 2 for page, removed in pages)
+
+
+def test_resuming_from_the_last_token_only_returns_newer_changes(client, db, make_item):
+    first, second = make_item(updated_at=datetime(2002, 1, 1)), make_item(updated_at=datetime(2002, 1, 2))
+    pages, token = _pages(client, encode_sync_token(datetime(2001, 12, 31), 0), limit=500)
+    assert {first.id, second.id} <= {item_id for page, _ in pages for item_id in page}
+
+    # Changed just after the cursor position, so settled by the next call
+    position, _ = decode_sync_token(token)
+    db.query(Item).filter(Item.id == first.id).update({"title": "Renamed", "updated_at": position + timedelta(microseconds=1)})
+    db.commit()
+    pages, token = _pages(client, token, limit=500)
+    ours = (first.id, second.id)
+    assert [item_id for page, _ in pages for item_id in page if item_id in ours] == [first.id]
+
+    pages, _ = _pages(client, token, limit=500)
+    assert not [item_id for page, _ in pages for item_id in page if item_id in ours]
+
+
+def test_initial_sync_skips_unavailable_items_and_rejects_bad_tokens(client, make_item):
+    hidden = make_item(available=False, updated_at=datetime(2003, 1, 1))
+    pages, _ = _pages(client, None, limit=1000)
+    assert hidden.id not in [item_id for page, removed in pages for item_id in page + removed]
+    assert client.get("/api/items/changes", params={"since": "garbage"}).status_code == 400
@@ -1,6 +1,6 @@
 import { BrowserRouter as Router, Routes, Route, Navigate } from 'react-router-dom';
 import { useState, useEffect } from 'react';
-import { getCurrentUser } from './api';
+import { getCurrentUser, logout } from './api';
 
 // Pages
 import Landing from './pages/Landing';
@@ -29,6 +29,7 @@ function App() {
         })
         .catch(() => {
           localStorage.removeItem('token');
+          localStorage.removeItem('refreshToken');
         })
         .finally(() => {
           setLoading(false);
@@ -38,13 +39,17 @@ function App() {
     }
   }, []);
 
-  const handleLogin = (userData, token) => {
+  const handleLogin = (userData, token, refreshToken) => {
     localStorage.setItem('token', token);
+    localStorage.setItem('refreshToken', refreshToken);
     setUser(userData);
   };
 
   const handleLogout = () => {
+    // Revoke server-side too; the local session ends either way
+    logout().catch(() => {});
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
     setUser(null);
   };
 
@@ -15,23 +15,82 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// Access tokens are short-lived: on a 401, trade the refresh token for a new
+// pair once and retry. Concurrent failures share one refresh request.
+let refreshing = null;
+
+const refreshTokens = () => {
+  if (!refreshing) {
+    const refreshToken = localStorage.getItem('refreshToken');
+    refreshing = axios
+      .post(`${API_BASE_URL}/auth/refresh`, { refresh_token: refreshToken })
+      .then((response) => {
+        localStorage.setItem('token', response.data.access_token);
+        localStorage.setItem('refreshToken', response.data.refresh_token);
+        return response.data.access_token;
+      })
+      .finally(() => {
+        refreshing = null;
+      });
+  }
+  return refreshing;
+};
+
+api.interceptors.response.use(
+  (response) => response,
+  async (error) => {
+    const original = error.config;
+    if (error.response?.status !== 401 || original._retried || !localStorage.getItem('refreshToken')) {
+      throw error;
+    }
+    original._retried = true;
+    try {
+      const token = await refreshTokens();
+      original.headers.Authorization = `Bearer ${token}`;
+      return api(original);
+    } catch {
+      localStorage.removeItem('token');
+      localStorage.removeItem('refreshToken');
+      throw error;
+    }
+  }
+);
+
 // Auth
 export const register = (data) => api.post('/auth/register', data);
 export const login = (data) => api.post('/auth/login', data);
+// Reads both tokens now, since the caller clears them right after
+export const logout = () =>
+  api.post(
+    '/auth/logout',
+    { refresh_token: localStorage.getItem('refreshToken') || '' },
+    { headers: { Authorization: `Bearer ${localStorage.getItem('token')}` } }
+  );
 export const getCurrentUser = () => api.get('/auth/me');
 
+// Users
+export const getUsers = (ids) => api.get('/users/batch', { params: { ids: ids.join(',') } });
+
 // Categories
 export const getCategories = () => api.get('/categories');
 
 // Items
 export const getItems = (params) => api.get('/items', { params });
+export const getItemChanges = (since, params) => api.get('/items/changes', { params: { ...params, since } });
+export const getItemFacets = (params) => api.get('/items/facets', { params });
+export const getSearchSuggestions = (q, limit) => api.get('/search/suggest', { params: { q, limit } });
+export const getNearbyItems = (params) => api.get('/items/nearby', { params });
 export const getItem = (id) => api.get(`/items/${id}`);
+export const getItemCalendar = (id, start, days) => api.get(`/items/${id}/calendar`, { params: { start, days } });
+export const getItemsByIds = (ids, params) => api.get('/items', { params: { ...params, ids: ids.join(',') } });
 export const createItem = (data) => api.post('/items', data);
 export const getMyItems = () => api.get('/items/my-items');
 
 // Rentals
 export const createRental = (data) => api.post('/rentals', data);
-export const getMyRentals = () => api.get('/rentals/my-rentals');
+export const getRentalQuotes = (itemIds, startDate, endDate) =>
+  api.get('/rentals/quotes', { params: { item_ids: itemIds.join(','), start_date: startDate, end_date: endDate } });
+export const getMyRentals = (params) => api.get('/rentals/my-rentals', { params });
 export const approveRental = (id) => api.patch(`/rentals/${id}/approve`);
 export const verifyPickup = (id) => api.patch(`/rentals/${id}/verify-pickup`);
 export const verifyReturn = (id) => api.patch(`/rentals/${id}/verify-return`);
@@ -39,11 +98,13 @@ export const verifyReturn = (id) => api.patch(`/rentals/${id}/verify-return`);
 // Messages
 export const getMessages = (rentalId) => api.get('/messages', { params: { rental_id: rentalId } });
 export const sendMessage = (data) => api.post('/messages', data);
+export const getArchivedMessages = (params) => api.get('/messages/archive', { params });
 
 // Reviews
 export const createReview = (data) => api.post('/reviews', data);
 
 // Dashboard
 export const getEarnings = () => api.get('/dashboard/earnings');
+export const getPlatformAnalytics = (params) => api.get('/admin/analytics', { params });
 
 export default api;
@@ -26,7 +26,7 @@ function Login({ onLogin }) {
 
     try {
       const response = await login(formData);
-      onLogin(response.data.user, response.data.access_token);
+      onLogin(response.data.user, response.data.access_token, response.data.refresh_token);
       navigate('/marketplace');
     } catch (err) {
       setError(err.response?.data?.detail || 'Login failed. Please try again.');
@@ -22,7 +22,8 @@ function Messages({ user }) {
 
   const loadRentals = async () => {
     try {
-      const response = await getMyRentals();
+      // The conversation list needs no QR codes or pricing
+      const response = await getMyRentals({ fields: 'id,item,renter,owner' });
       const allRentals = [...response.data.as_renter, ...response.data.as_owner];
       setRentals(allRentals);
       if (allRentals.length > 0) {
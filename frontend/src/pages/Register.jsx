@@ -29,7 +29,7 @@ function Register({ onLogin }) {
 
     try {
       const response = await register(formData);
-      onLogin(response.data.user, response.data.access_token);
+      onLogin(response.data.user, response.data.access_token, response.data.refresh_token);
       navigate('/marketplace');
     } catch (err) {
       setError(err.response?.data?.detail || 'Registration failed. Please try again.');